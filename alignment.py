@@ -0,0 +1,128 @@
+# Cross-timestep particle ID alignment index for one simulation
+# Records, for every particle ID, which row it occupies in each timestep's SDF file (or -1)
+# Built once from the ident fields of the SDF files and stored as a compact int32 matrix
+# Multi-timestep reductions gather rows through it instead of stepping through files in lockstep
+# Particles that appear or disappear between timesteps (cco2, vconvL) become explicit this way
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	index = AlignmentIndex.load_or_build(trajectories.timestep_files(paths, "all"),
+#		os.path.join(paths["head"], "alignment"))
+#	born, died = index.births(), index.deaths()
+# To align every DM processed timestep of a simulation and find each particle's lifetime
+
+import os
+
+import numpy as np
+
+import sn_utils as sn
+from sdf_reader import SDFFile
+from particle_data import files_fingerprint
+
+# Name of the alignment index directory within the simulation head directory
+INDEX_DIR = "alignment"
+# Marker stored in the row matrix for a particle that is absent from a timestep
+ABSENT = -1
+
+
+# Read the ident field of an SDF file, checking that no ID is repeated
+def read_ident(filename):
+	ident = SDFFile(filename).read("ident").astype(np.int64)
+	# A repeated ID within one file would make its row ambiguous
+	if len(np.unique(ident)) != len(ident):
+		raise ValueError("repeated IDs in file %s" % (filename))
+	return ident
+
+# Alignment of particle IDs to the rows of a list of SDF files
+class AlignmentIndex(object):
+	# Open an index directory that was written by build
+	def __init__(self, directory):
+		self.directory = os.path.abspath(directory)
+		# Sorted union of the particle IDs in all of the files
+		self.pids = np.load(os.path.join(self.directory, "pids.npy"), mmap_mode='r')
+		# Matrix of shape (particle IDs, files) holding the row of each ID in each file
+		self.rows = np.load(os.path.join(self.directory, "rows.npy"), mmap_mode='r')
+		# The SDF files in the order of the matrix columns
+		self.sources = sn.get_lines(os.path.join(self.directory, "sources"))
+	# Build the index for a list of SDF files (in timestep order) and return it opened
+	@classmethod
+	def build(cls, filenames, directory):
+		# Print a quick progress message for the user
+		print "\nBuilding particle ID alignment index %s" % (directory)
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		# The union of all the IDs gives the rows of the matrix, merged in one file at a time so
+		# that only the union and a single file's ident field are ever held in memory
+		pids = np.zeros(0, dtype=np.int64)
+		for filename in filenames:
+			unique = np.unique(read_ident(filename))
+			pids = (unique if len(pids) == 0 else np.union1d(pids, unique))
+		np.save(os.path.join(directory, "pids.npy"), pids)
+		# Scatter each file's row numbers into its column of the matrix, reading its IDs again
+		rows = np.lib.format.open_memmap(os.path.join(directory, "rows.npy"), mode="w+",
+			dtype=np.int32, shape=(len(pids), len(filenames)))
+		for j, filename in enumerate(filenames):
+			ident = read_ident(filename)
+			column = np.full(len(pids), ABSENT, dtype=np.int32)
+			column[np.searchsorted(pids, ident)] = np.arange(len(ident), dtype=np.int32)
+			rows[:, j] = column
+		rows.flush()
+		del rows
+		# Record the source files and their fingerprint so staleness can be detected
+		with open(os.path.join(directory, "sources"), 'w') as sources:
+			sources.write('\n'.join(os.path.abspath(f) for f in filenames) + '\n')
+		with open(os.path.join(directory, "fingerprint"), 'w') as fingerprint:
+			fingerprint.write(files_fingerprint(filenames) + '\n')
+		return cls(directory)
+	# Open the index in a directory if it was built from exactly these files, otherwise rebuild it
+	@classmethod
+	def load_or_build(cls, filenames, directory):
+		fingerprint_file = os.path.join(directory, "fingerprint")
+		if os.path.isfile(fingerprint_file):
+			with open(fingerprint_file, 'r') as fingerprint:
+				stored = fingerprint.read().strip()
+			sources = sn.get_lines(os.path.join(directory, "sources"))
+			if stored == files_fingerprint(filenames) and \
+				sources == [os.path.abspath(f) for f in filenames]:
+				return cls(directory)
+		return cls.build(filenames, directory)
+	# Return the number of particle IDs and the number of files in the index
+	@property
+	def shape(self):
+		return self.rows.shape
+	# Return the matrix columns of the given files, in the order given
+	def columns_of(self, filenames):
+		return [self.sources.index(os.path.abspath(f)) for f in filenames]
+	# Return the index rows of the given particle IDs, or -1 for IDs not in the index
+	def index_of(self, pids):
+		pids = np.atleast_1d(np.asarray(pids, dtype=np.int64))
+		if len(self.pids) == 0:
+			return np.full(len(pids), ABSENT, dtype=np.int64)
+		index = np.minimum(np.searchsorted(self.pids, pids), len(self.pids) - 1)
+		index[self.pids[index] != pids] = ABSENT
+		return index
+	# Return the rows of the given particle IDs in the given matrix columns
+	# IDs that are not in the index at all (e.g., born after the indexed files) are absent everywhere
+	def rows_of(self, pids, columns):
+		index = self.index_of(pids)
+		rows = np.full((len(index), len(columns)), ABSENT, dtype=np.int32)
+		known = index != ABSENT
+		rows[known] = np.asarray(self.rows[index[known]])[:, columns]
+		return rows
+	# Return a boolean matrix of which particles are present in which files
+	def present(self, start=0, stop=None):
+		return np.asarray(self.rows[start:stop]) != ABSENT
+	# Return the first file (column) in which each particle appears
+	def births(self):
+		present = self.present()
+		return np.argmax(present, axis=1)
+	# Return the column after the last file in which each particle appears
+	# A particle still present in the final file gets the number of files
+	def deaths(self):
+		present = self.present()
+		return present.shape[1] - np.argmax(present[:, ::-1], axis=1)
+	# Return the number of files each particle is missing from, between its birth and death
+	def gaps(self):
+		present = self.present()
+		return (self.deaths() - self.births()) - present.sum(axis=1)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+# Long-lived local analysis server that holds one or more simulations ready for queries
+# The particle datasets, abundance stores, spatial orderings, and SPH indices are loaded once,
+# before the worker processes are forked, so every worker shares the same read-only pages
+# (memory maps share the page cache, and in-memory arrays are shared copy-on-write)
+# Queries for selections, yields, peak statistics, column values, and projections arrive over
+# a Unix domain socket and are answered by the worker pool
+# Messages are length-prefixed pickles, so only trusted local clients should be allowed to connect;
+# the socket is created readable and writable by its owner only, and there is deliberately no TCP
+# mode, since any user on a shared node could connect to a port and run code as the server owner
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	./analysis_server.py /tmp/dm.sock jet3b:sn_data/jet3b/analysis/jet3b_plotting.dataset:sn_data/jet3b/sorted_queries.abundances
+#	client = AnalysisClient("/tmp/dm.sock")
+#	pids = client.select("jet3b", Cone(30.0) & Where("v_r", ">", 5e8))
+#	result = client.yields("jet3b", [BinSpec("v_r", bins=20)], ["44Ti"], pids=pids)
+# To serve jet3b and then break down its fast jet ejecta 44Ti yield from another session
+
+import os
+import sys
+import stat
+import socket
+import struct
+import threading
+import SocketServer
+import multiprocessing
+import cPickle as pickle
+
+import numpy as np
+
+from particle_data import ParticleDataset, AbundanceStore, get_values, abundance_column
+from spatial_order import OrderedDataset, ORDERED_SUFFIX
+from selections import select
+from yield_groupby import group_yields
+from sph_projection import SPHIndex, column_density, weighted_map, slice_map
+
+# Format of the length prefix sent ahead of every message
+LENGTH_FORMAT = "!Q"
+# Default number of worker processes, if not given
+DEFAULT_WORKERS = multiprocessing.cpu_count()
+
+# Everything the server has loaded, keyed by simulation name
+# This is filled in before the workers are forked so that they inherit it
+_SIMULATIONS = {}
+
+
+# LOADED SIMULATIONS
+
+# Everything loaded for one simulation
+class LoadedSimulation:
+	# Open the dataset and store, plus the spatial ordering and SPH index if they are available
+	def __init__(self, name, dataset_dir, store_dir=None, index=True):
+		self.name = name
+		self.ds = ParticleDataset(dataset_dir)
+		self.store = (AbundanceStore(store_dir) if store_dir is not None else None)
+		# Use the spatially ordered copy for selections if it has been built and is current
+		self.ordered = None
+		if os.path.isdir(self.ds.directory + ORDERED_SUFFIX):
+			self.ordered = OrderedDataset.load_or_build(self.ds)
+		# Build the SPH index up front, which is the slowest thing to make per query
+		self.index = None
+		if index and self.ds.has_column("h"):
+			self.index = SPHIndex.from_dataset(self.ds)
+		# Touch every column once so the first query does not pay for the cold reads
+		for name in self.ds.names:
+			np.asarray(self.ds.column(name)).sum()
+
+# Load the simulations named in "name:dataset[:store]" specs into the shared table
+def load_simulations(specs, index=True):
+	for spec in specs:
+		parts = spec.split(":")
+		if len(parts) not in (2, 3):
+			raise ValueError("simulation spec %s is not name:dataset[:store]" % (repr(spec)))
+		print "Loading simulation %s" % (parts[0])
+		_SIMULATIONS[parts[0]] = LoadedSimulation(parts[0], parts[1],
+			(parts[2] if len(parts) == 3 else None), index)
+
+
+# QUERIES
+
+# Return the simulation of a query, or raise an error naming the ones that are loaded
+def _simulation(name):
+	if name not in _SIMULATIONS:
+		raise KeyError("simulation %s is not loaded (have %s)" % (repr(name),
+			", ".join(sorted(_SIMULATIONS))))
+	return _SIMULATIONS[name]
+
+# Return the names of the loaded simulations and their columns
+def query_info():
+	return dict((name, {"columns": sim.ds.names, "rows": sim.ds.n_rows,
+		"isotopes": (sim.store.isotopes if sim.store is not None else [])})
+		for name, sim in _SIMULATIONS.items())
+
+# Return the sorted particle IDs in a selection
+def query_select(sim, selection):
+	sim = _simulation(sim)
+	return select((sim.ordered if sim.ordered is not None else sim.ds), selection)
+
+# Return a yields breakdown (see yield_groupby.group_yields)
+def query_yields(sim, specs, targets=None, pids=None):
+	sim = _simulation(sim)
+	if sim.store is None:
+		raise ValueError("simulation %s has no abundance store loaded" % (sim.name))
+	return group_yields(sim.ds, sim.store, specs, targets, pids=pids)
+
+# Return the values of some columns for a list of particle IDs (or every particle)
+def query_values(sim, columns, pids=None):
+	sim = _simulation(sim)
+	rows = (slice(None) if pids is None else sim.ds.rows_of(pids))
+	if pids is not None and np.any(rows < 0):
+		raise KeyError("%d particle IDs are not in simulation %s" % (np.sum(rows < 0), sim.name))
+	return dict((name, get_values(sim.ds, name, rows)) for name in columns)
+
+# Return count, minimum, maximum, mean, and mass-weighted mean of columns such as "peak temp"
+def query_stats(sim, columns, pids=None):
+	sim = _simulation(sim)
+	rows = (slice(None) if pids is None else np.sort(sim.ds.rows_of(pids)))
+	if pids is not None:
+		rows = rows[rows >= 0]
+	mass = get_values(sim.ds, "mass", rows)
+	stats = {}
+	for name in columns:
+		values = get_values(sim.ds, name, rows)
+		if len(values) == 0:
+			stats[name] = {"count": 0}
+			continue
+		stats[name] = {"count": len(values), "min": values.min(), "max": values.max(),
+			"mean": values.mean(), "mass mean": np.sum(values * mass) / np.sum(mass)}
+	return stats
+
+# Return a projected map of a column (or an abundance target) using the preloaded SPH index
+# The kind is "column", "weighted", or "slice", as in sph_projection
+def query_project(sim, column, extent, resolution, axis=2, kind="weighted", depth=0.0):
+	sim = _simulation(sim)
+	if sim.index is None:
+		raise ValueError("simulation %s has no SPH index loaded" % (sim.name))
+	if column is not None and not sim.ds.has_column(column) and \
+		sim.ds.has_column(abundance_column(column)):
+		column = abundance_column(column)
+	values = (None if column is None else get_values(sim.ds, column))
+	# Workers are single processes already, so each projection runs on one thread
+	if kind == "column":
+		return column_density(sim.index, values, extent, resolution, axis, threads=1)
+	if kind == "weighted":
+		return weighted_map(sim.index, values, extent, resolution, axis, threads=1)
+	if kind == "slice":
+		return slice_map(sim.index, values, extent, resolution, axis, depth, threads=1)
+	raise ValueError("unknown map kind %s" % (repr(kind)))
+
+# Lookup table of the query functions that clients can call by name
+QUERIES = {
+	"info": query_info,
+	"select": query_select,
+	"yields": query_yields,
+	"values": query_values,
+	"stats": query_stats,
+	"project": query_project,
+}
+
+# Run one query in a worker process, returning (True, result) or (False, error message)
+def _run_query(request):
+	op, args, kwargs = request
+	try:
+		if op not in QUERIES:
+			raise KeyError("unknown query %s" % (repr(op)))
+		return (True, QUERIES[op](*args, **kwargs))
+	except Exception as error:
+		return (False, "%s: %s" % (type(error).__name__, error))
+
+
+# MESSAGES
+
+# Send one object as a length-prefixed pickle
+def send_message(sock, obj):
+	data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+	sock.sendall(struct.pack(LENGTH_FORMAT, len(data)) + data)
+
+# Receive exactly n bytes, or None if the connection closes first
+def _receive_bytes(sock, n):
+	chunks, received = [], 0
+	while received < n:
+		chunk = sock.recv(min(n - received, 1 << 20))
+		if not chunk:
+			return None
+		chunks.append(chunk)
+		received += len(chunk)
+	return "".join(chunks)
+
+# Receive one length-prefixed pickle, or None if the connection closed
+def receive_message(sock):
+	header = _receive_bytes(sock, struct.calcsize(LENGTH_FORMAT))
+	if header is None:
+		return None
+	data = _receive_bytes(sock, struct.unpack(LENGTH_FORMAT, header)[0])
+	return (None if data is None else pickle.loads(data))
+
+
+# SERVER
+
+# Handles one client connection, passing each of its requests to the worker pool
+class _Handler(SocketServer.BaseRequestHandler):
+	def handle(self):
+		while True:
+			request = receive_message(self.request)
+			if request is None:
+				return
+			send_message(self.request, self.server.pool.apply(_run_query, (request,)))
+
+class _UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+	daemon_threads = True
+
+# Make a server on a Unix socket path, forking its worker pool now so it shares everything loaded
+def make_server(address, workers=DEFAULT_WORKERS):
+	if not isinstance(address, basestring):
+		raise TypeError("analysis server address must be a Unix socket path, not %s" %
+			(repr(address)))
+	pool = multiprocessing.Pool(max(1, workers))
+	if os.path.exists(address):
+		os.remove(address)
+	# Create the socket with owner-only permissions from the start, so no other user can
+	# connect to it in the moment before it is chmodded
+	umask = os.umask(stat.S_IRWXG | stat.S_IRWXO | stat.S_IXUSR)
+	try:
+		server = _UnixServer(address, _Handler)
+	finally:
+		os.umask(umask)
+	os.chmod(address, stat.S_IRUSR | stat.S_IWUSR)
+	server.pool = pool
+	return server
+
+# Serve queries on an address until interrupted
+def serve(address, workers=DEFAULT_WORKERS):
+	server = make_server(address, workers)
+	print "Serving %d simulations on %s with %d workers" % (len(_SIMULATIONS), address, workers)
+	try:
+		server.serve_forever()
+	finally:
+		server.server_close()
+		server.pool.terminate()
+		if os.path.exists(address):
+			os.remove(address)
+
+# Run a server in a background thread of this process (e.g., for testing), returning the server
+def serve_in_background(address, workers=1):
+	server = make_server(address, workers)
+	thread = threading.Thread(target=server.serve_forever)
+	thread.daemon = True
+	thread.start()
+	return server
+
+
+# CLIENT
+
+# Small client for talking to a running analysis server
+class AnalysisClient:
+	# Connect to the Unix socket path of the server
+	def __init__(self, address):
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.connect(address)
+	# Send one query and return its result, raising an error if the query failed
+	def call(self, op, *args, **kwargs):
+		send_message(self.sock, (op, args, kwargs))
+		reply = receive_message(self.sock)
+		if reply is None:
+			raise IOError("analysis server closed the connection")
+		ok, result = reply
+		if not ok:
+			raise RuntimeError("analysis server: %s" % (result))
+		return result
+	# Convenience wrappers for each of the queries
+	def info(self):
+		return self.call("info")
+	def select(self, sim, selection):
+		return self.call("select", sim, selection)
+	def yields(self, sim, specs, targets=None, pids=None):
+		return self.call("yields", sim, specs, targets, pids=pids)
+	def values(self, sim, columns, pids=None):
+		return self.call("values", sim, columns, pids=pids)
+	def stats(self, sim, columns, pids=None):
+		return self.call("stats", sim, columns, pids=pids)
+	def project(self, sim, column, extent, resolution, axis=2, kind="weighted", depth=0.0):
+		return self.call("project", sim, column, extent, resolution, axis=axis, kind=kind,
+			depth=depth)
+	# Close the connection
+	def close(self):
+		self.sock.close()
+
+
+# Main program: load the simulations given on the command line and serve them
+def main():
+	if len(sys.argv) < 3:
+		print "Usage: %s socket_path name:dataset[:store] ..." % (sys.argv[0])
+		sys.exit(1)
+	load_simulations(sys.argv[2:])
+	serve(sys.argv[1])
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+
+# Run DM pre- or postprocessing for a whole suite of simulations at once
+# Every simulation's postprocessing is split into stage tasks (total yields, updated yields, one
+# sort per burn_query output, and the plotting file) and the tasks of all the simulations are
+# scheduled together on one shared pool of worker processes, or on the tasks of a Slurm
+# allocation through srun, so a suite takes about as long as its slowest simulation
+# Ready tasks are interleaved fairly: the next free slot goes to the simulation with the fewest
+# tasks running, and among those to the one with the most work left, so slow models start early
+# Nothing asks the user anything; sbatch scripts are only submitted if --submit is given
+# A failed task only stops the tasks of its own simulation that depend on it
+# Each task's output goes to a log in the simulation's batch_logs directory, and a status table
+# with one line per simulation is printed as the batch goes (and written to a file with -s)
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	./batch_run.py -w 16 -s suite_status.txt post "sn_data/*"
+# To DM postprocess every simulation in sn_data on 16 worker processes
+#	srun -n 64 ... ./batch_run.py --srun -c post 50Am cco2 g292-j4c jet3b
+# To spread the stages of four simulations over a 64-task Slurm allocation, using their caches
+
+import os
+import sys
+import glob
+import json
+import time
+import Queue
+import argparse
+import threading
+import traceback
+import subprocess
+import multiprocessing
+
+import sn_utils as sn
+import pipeline
+
+# Name of the directory of task logs inside each simulation head directory
+LOG_DIR = "batch_logs"
+# Default number of seconds between status tables while waiting on tasks
+STATUS_INTERVAL = 60.0
+
+
+# HELPER FUNCTIONS
+
+# Send everything printed inside the with block to a log file
+class logged:
+	def __init__(self, filename):
+		self.filename = filename
+	def __enter__(self):
+		directory = os.path.dirname(self.filename)
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		self.log = open(self.filename, 'a')
+		self.stdout, sys.stdout = sys.stdout, self.log
+		return self.log
+	def __exit__(self, *exc):
+		sys.stdout = self.stdout
+		self.log.close()
+		return False
+
+# Return the log file of one stage of a simulation
+def log_file(head, stage):
+	return os.path.join(head, LOG_DIR, stage.replace(":", "_") + ".log")
+
+# Return the simulation directories named by a list of directories and glob patterns
+def expand_sims(patterns):
+	heads = []
+	for pattern in patterns:
+		matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+		heads.extend(os.path.abspath(m) for m in matches if os.path.isdir(m))
+	# Keep the first of any repeats, in the order given
+	return [head for i, head in enumerate(heads) if head not in heads[:i]]
+
+# Format a number of seconds as minutes and seconds
+def minutes(seconds):
+	return "%dm%02ds" % (seconds // 60, seconds % 60)
+
+
+# STAGE TASKS
+
+# Do one stage of one simulation and return None, or the traceback text if it failed
+# This runs in a worker process (or an srun job step) and prints only to the stage's log
+def run_task(payload):
+	head, stage, options = payload["head"], payload["stage"], payload["options"]
+	try:
+		with logged(log_file(head, stage)):
+			print "\n%s: %s %s" % (time.strftime("%Y-%m-%d %H:%M:%S"), os.path.basename(head),
+				stage)
+			do_stage(head, stage, options)
+	except Exception:
+		return traceback.format_exc()
+	return None
+
+# Do the work of one stage
+def do_stage(head, stage, options):
+	paths = pipeline.find_paths(head)
+	if stage == "preprocess":
+		pipeline.preprocess(paths, options["isotopes"], options["submit"])
+		return
+	paths = sn.check_dirs(paths, sn.PRE_DIRECTORIES)
+	paths = sn.make_dirs(paths, sn.POST_DIRECTORIES)
+	cache = pipeline.open_cache(paths, options["cache"] or None)
+	budget = options["budget"]
+	if stage == "yields" and options["incremental"] and "hdf5" in paths:
+		# Worker processes cannot start pools of their own, so the HDF5 files are scanned here
+		from incremental_yields import total_yields
+		total_yields(paths, workers=1, budget=budget, cache=cache)
+	elif stage == "yields":
+		pipeline.extract_yields(paths["sbatch"], pipeline.analysis_file(paths,
+			pipeline.YIELDS_END), cache)
+	elif stage == "update_yields":
+		unburned = glob.glob(os.path.join(paths["sdf"], "*.unburned.out"))
+		if len(unburned) > 1:
+			raise IOError("matched %d .unburned.out files" % (len(unburned)))
+		pipeline.update_yields(pipeline.analysis_file(paths, pipeline.YIELDS_END),
+			os.path.join(paths["hdf5"], pipeline.sim_name(paths) + "_pids.out"),
+			(unburned[0] if unburned else None),
+			os.path.join(paths["sdf"], sn.sdf_list(paths, mode="last")), budget=budget,
+			cache=cache)
+	elif stage.startswith("sort_query:"):
+		query = stage.split(":", 1)[1]
+		query_path = os.path.join(paths["queries"], query)
+		sorted_path = os.path.join(paths["sorted_queries"], query)
+		pipeline.cached_stage(cache, "sort_query", [query_path], [sorted_path],
+			lambda : pipeline.sort_query(query_path, sorted_path))
+	elif stage == "plotting":
+		pipeline.write_plotting(paths, options["abundances"], budget=budget, cache=cache)
+	else:
+		raise ValueError("unknown stage %s" % (repr(stage)))
+
+# One stage of one simulation, with the tasks it has to wait for
+class Task:
+	def __init__(self, sim, stage, needs=()):
+		self.sim, self.stage = sim, stage
+		self.needs = list(needs)
+		self.state = "pending"
+		self.start = self.stop = None
+		self.error = None
+		sim.tasks.append(self)
+	# Return what a worker needs to run the task
+	def payload(self):
+		return {"head": self.sim.head, "stage": self.stage, "options": self.sim.options}
+	# Check whether all of the tasks this one needs have finished
+	def ready(self):
+		return self.state == "pending" and all(t.state == "done" for t in self.needs)
+
+# One simulation of the batch and its tasks
+class Simulation:
+	def __init__(self, head, options):
+		self.head = head
+		self.name = os.path.basename(head)
+		self.options = options
+		self.tasks = []
+		self.error = None
+	# Return the number of tasks in a state
+	def count(self, state):
+		return len([t for t in self.tasks if t.state == state])
+	# Return the overall status of the simulation
+	def status(self):
+		if self.error is not None or self.count("failed") > 0:
+			return "failed"
+		if self.count("done") == len(self.tasks):
+			return "done"
+		if self.count("running") > 0 or self.count("done") > 0:
+			return "running"
+		return "pending"
+	# Return the wall time from the first task starting to the last one stopping (or now)
+	def wall(self):
+		starts = [t.start for t in self.tasks if t.start is not None]
+		if len(starts) == 0:
+			return 0.0
+		running = [t for t in self.tasks if t.state == "running"]
+		stops = [t.stop for t in self.tasks if t.stop is not None]
+		return (time.time() if running or not stops else max(stops)) - min(starts)
+
+# Plan the tasks of a simulation for the given mode, pre or post
+# Planning problems (e.g., missing directories) mark the simulation failed instead of raising
+def plan(head, mode, options):
+	sim = Simulation(head, options)
+	if mode == "pre":
+		Task(sim, "preprocess")
+		return sim
+	try:
+		with logged(log_file(head, "plan")):
+			paths = pipeline.find_paths(head)
+			paths = sn.check_dirs(paths, sn.PRE_DIRECTORIES)
+			paths = sn.make_dirs(paths, sn.POST_DIRECTORIES)
+			sn.sbatch_cleanup(paths)
+	except Exception:
+		sim.error = traceback.format_exc()
+		return sim
+	yields = Task(sim, "yields")
+	if not (options["incremental"] and "hdf5" in paths) and "sdf" in paths and "hdf5" in paths:
+		Task(sim, "update_yields", [yields])
+	sorts = [Task(sim, "sort_query:" + query) for query in sorted(os.listdir(paths["queries"]))]
+	if "sdf" in paths:
+		Task(sim, "plotting", sorts)
+	return sim
+
+
+# SCHEDULING
+
+# Run a task with a runner in a thread, then report back through the queue
+def launch(runner, task, finished):
+	try:
+		error = runner(task.payload())
+	except Exception:
+		error = traceback.format_exc()
+	finished.put((task, error))
+
+# Run a task in a worker process of a pool
+def pool_runner(pool):
+	return lambda payload : pool.apply(run_task, (payload,))
+
+# Run a task as an srun job step on one task of the current Slurm allocation
+def srun_runner(payload):
+	command = ["srun", "-N", "1", "-n", "1", "--exclusive", sys.executable,
+		os.path.abspath(__file__), "--task", json.dumps(payload)]
+	exit_code = subprocess.call(command)
+	if exit_code != 0:
+		return "srun exited with code %d, see %s" % (exit_code,
+			log_file(payload["head"], payload["stage"]))
+	return None
+
+# Pick the next task to start: from the simulation with the fewest tasks running, then the one
+# with the most tasks left, then the first given
+def pick(ready, sims):
+	order = dict((sim, i) for i, sim in enumerate(sims))
+	return min(ready, key=lambda t : (t.sim.count("running"), -t.sim.count("pending"),
+		order[t.sim]))
+
+# Mark every task that needs a failed or skipped task as skipped
+def skip_blocked(sims):
+	changed = True
+	while changed:
+		changed = False
+		for sim in sims:
+			for task in sim.tasks:
+				if task.state == "pending" and any(t.state in ("failed", "skipped")
+					for t in task.needs):
+					task.state = "skipped"
+					changed = True
+
+# Run the tasks of all the simulations on a number of slots with a runner
+# Returns True if every task of every simulation finished
+def run_batch(sims, runner, slots, status_file=None, interval=STATUS_INTERVAL):
+	finished = Queue.Queue()
+	running = 0
+	last_table = time.time()
+	while True:
+		skip_blocked(sims)
+		ready = [task for sim in sims for task in sim.tasks if task.ready()]
+		while running < slots and len(ready) > 0:
+			task = pick(ready, sims)
+			ready.remove(task)
+			task.state, task.start = "running", time.time()
+			thread = threading.Thread(target=launch, args=(runner, task, finished))
+			thread.daemon = True
+			thread.start()
+			running += 1
+		write_status(sims, status_file)
+		if running == 0:
+			break
+		try:
+			task, error = finished.get(timeout=interval)
+		except Queue.Empty:
+			task = None
+		if task is not None:
+			running -= 1
+			task.stop = time.time()
+			task.state, task.error = ("done" if error is None else "failed"), error
+			if error is not None:
+				print "%s %s failed:\n%s" % (task.sim.name, task.stage, error)
+		if time.time() - last_table >= interval:
+			sys.stdout.write("\n" + status_table(sims))
+			last_table = time.time()
+	return all(sim.status() == "done" for sim in sims)
+
+
+# STATUS
+
+# Return the status table of the simulations, one line each
+def status_table(sims):
+	lines = ["%-16s%-9s%7s%7s%8s%10s  %s" % ("simulation", "status", "done", "tasks", "failed",
+		"wall", "running")]
+	for sim in sims:
+		running = [t.stage for t in sim.tasks if t.state == "running"]
+		failed = sim.count("failed") + (1 if sim.error is not None else 0)
+		lines.append("%-16s%-9s%7d%7d%8d%10s  %s" % (sim.name, sim.status(), sim.count("done"),
+			len(sim.tasks), failed, minutes(sim.wall()), ", ".join(running)))
+	return '\n'.join(lines) + '\n'
+
+# Write the status table to a file, if there is one
+def write_status(sims, status_file):
+	if status_file is None:
+		return
+	temp = "%s.tmp%d" % (status_file, os.getpid())
+	with open(temp, 'w') as status:
+		status.write(time.strftime("%Y-%m-%d %H:%M:%S") + "\n" + status_table(sims))
+	os.rename(temp, status_file)
+
+# Return the number of task slots of the current Slurm allocation, or None outside of one
+def slurm_slots():
+	for name in ("SLURM_NTASKS", "SLURM_NPROCS"):
+		if os.environ.get(name, "").isdigit():
+			return int(os.environ[name])
+	return None
+
+# Main program: run a stage task (for srun), or the whole batch
+def main():
+	# A single task run by srun on behalf of the batch
+	if len(sys.argv) == 3 and sys.argv[1] == "--task":
+		error = run_task(json.loads(sys.argv[2]))
+		if error is not None:
+			sys.stderr.write(error)
+			sys.exit(1)
+		return
+	parser = argparse.ArgumentParser()
+	# Number of task slots (default is the Slurm allocation's tasks with --srun, else the cores)
+	parser.add_argument('-w', '--workers', type=int, default=None)
+	# Run the tasks as srun job steps in the current Slurm allocation instead of a local pool
+	parser.add_argument('--srun', action='store_true')
+	# File listing more simulation directories, one per line
+	parser.add_argument('-f', '--file', default=None)
+	# File to keep the current status table in
+	parser.add_argument('-s', '--status', default=None)
+	# Seconds between status tables
+	parser.add_argument('-i', '--interval', type=float, default=STATUS_INTERVAL)
+	# Use each simulation's stage cache when postprocessing
+	parser.add_argument('-c', '--cache', action='store_true')
+	# Take the total yields from per-file HDF5 partials when postprocessing
+	parser.add_argument('--incremental', action='store_true')
+	# Memory budget per task, e.g., 2G
+	parser.add_argument('-b', '--budget', default=None)
+	# Abundances file listing the elements and isotopes to plot (default is abundances.txt)
+	parser.add_argument('-a', '--abundances', default=sn.ABUNDANCES_FILE)
+	# Submit the sbatch scripts written when preprocessing (they are never submitted otherwise)
+	parser.add_argument('--submit', action='store_true')
+	# Which processing to run: pre or post
+	parser.add_argument('mode', choices=["pre", "post"])
+	# Simulation directories or glob patterns matching them
+	parser.add_argument('sims', nargs='*')
+	args = parser.parse_args()
+	patterns = args.sims + (sn.get_lines(args.file) if args.file is not None else [])
+	heads = expand_sims(patterns)
+	if len(heads) == 0:
+		print "No simulation directories found"
+		sys.exit(1)
+	options = {"budget": args.budget, "cache": args.cache, "incremental": args.incremental,
+		"submit": args.submit}
+	if args.mode == "pre":
+		options["isotopes"] = sn.get_list(sn.ISOTOPES_FILE)
+	else:
+		options["abundances"] = sn.get_list(args.abundances)
+	sims = [plan(head, args.mode, options) for head in heads]
+	slots = args.workers or (slurm_slots() if args.srun else None) or multiprocessing.cpu_count()
+	print "Running %d tasks for %d simulations on %d %s" % (sum(len(s.tasks) for s in sims),
+		len(sims), slots, ("srun tasks" if args.srun else "workers"))
+	start = time.time()
+	pool = None
+	if args.srun:
+		runner = srun_runner
+	else:
+		# A fresh worker process for every task returns each simulation's memory when it is done
+		pool = multiprocessing.Pool(slots, maxtasksperchild=1)
+		runner = pool_runner(pool)
+	try:
+		success = run_batch(sims, runner, slots, args.status, args.interval)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+	sys.stdout.write("\n" + status_table(sims))
+	print "\nFinished in %s" % (minutes(time.time() - start))
+	if not success:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+
+# Benchmark suite timing every stage of DM processing on synthetic simulations
+# Simulations of the requested sizes and layouts are generated once by synthetic_data.py and
+# kept in a work directory, then each stage is run a few times and its best run is kept
+# Every run is measured through telemetry (wall and CPU time, bytes read, peak memory), and the
+# results are written as JSON so that a later run can be compared against them as a baseline;
+# any stage that got slower than the baseline by more than the tolerance is flagged, and the
+# program exits with status 1 so that scripts can catch the regression
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	./benchmark.py -n 10k,1M --layout jet3b,cco2 -o results.json --baseline baseline.json
+# To time every stage on 10 thousand and 1 million particle simulations and check for regressions
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import multiprocessing
+
+import numpy as np
+
+import sn_utils as sn
+import telemetry
+import pipeline
+import synthetic_data
+import reducers
+from sdf_reader import SDFFile
+from particle_data import AbundanceStore
+from alignment import AlignmentIndex
+from trajectories import timestep_files
+
+# Default sizes and layouts of the synthetic simulations
+DEFAULT_SIZES = "10k,100k"
+DEFAULT_LAYOUTS = "jet3b"
+# Isotopes queried in the synthetic simulations, which are also the plotting abundance targets
+ISOTOPES = ("44Ti", "56Ni", "26Al")
+# Default fraction by which a stage may get slower than its baseline before it is flagged
+DEFAULT_TOLERANCE = 0.25
+# Differences in wall time below this many seconds are never flagged, since they are just noise
+NOISE_SECONDS = 0.05
+# Multipliers for size suffixes like 10k or 10M
+SIZE_UNITS = {"": 1, "K": 10**3, "M": 10**6}
+# File in each generated simulation marking that it was written completely
+COMPLETE_FILE = "complete"
+
+
+# SIMULATIONS
+
+# Convert a size like "10k" or "1M" into a number of particles
+def parse_size(size):
+	size = size.strip().upper()
+	unit = (size[-1] if size[-1] in SIZE_UNITS else "")
+	return int(float(size[:len(size) - len(unit)]) * SIZE_UNITS[unit])
+
+# Return the paths dict of a synthetic simulation in the work directory, generating it if needed
+def simulation(workdir, n, layout):
+	head = os.path.join(workdir, "%s_%d" % (layout, n))
+	if not os.path.isfile(os.path.join(head, COMPLETE_FILE)):
+		print "Generating %d particle %s simulation in %s" % (n, layout, head)
+		if os.path.isdir(head):
+			shutil.rmtree(head)
+		synthetic_data.write_simulation(head, n, layout, ISOTOPES, entropy=False)
+		open(os.path.join(head, COMPLETE_FILE), 'w').close()
+	paths = dict((name, os.path.join(head, name)) for name in
+		("sdf", "hdf5", "queries", "sbatch", "analysis", "sorted_queries"))
+	paths["head"] = head
+	for name in ("analysis", "sorted_queries"):
+		if not os.path.isdir(paths[name]):
+			os.makedirs(paths[name])
+	return paths
+
+
+# STAGES
+
+# Each stage takes the paths dict and the memory budget and returns the particles it processed
+# (or None to use the particle count that the stage's own telemetry recorded)
+
+# Scan the SDF files for their tpos values and parse every header
+def bench_catalog(paths, budget):
+	for mode in ("all", "first", "last", "early"):
+		sn.sdf_list(paths, mode)
+	return sum(SDFFile(f).n_rows for f in timestep_files(paths, "all"))
+
+# Read every field of the final SDF file, a chunk at a time
+def bench_extraction(paths, budget):
+	final = SDFFile(timestep_files(paths, "last")[0])
+	for start, stop, ids in reducers.id_blocks(final, budget, final.row_bytes()):
+		for name in final.names:
+			final.read(name, start, stop)
+	return final.n_rows
+
+# Convert the PID list to its memory-mapped form
+def setup_pid_list(paths):
+	npy_name = os.path.join(paths["hdf5"], os.path.basename(paths["head"]) + "_pids.out.npy")
+	if os.path.isfile(npy_name):
+		os.remove(npy_name)
+def bench_pid_list(paths, budget):
+	return len(reducers.load_pid_list(os.path.join(paths["hdf5"],
+		os.path.basename(paths["head"]) + "_pids.out")))
+
+# Sort the burn_query outfiles
+def bench_sort_queries(paths, budget):
+	pipeline.sort_queries(paths["queries"], paths["sorted_queries"])
+
+# Convert the sorted queries into an abundance store
+def setup_abundance_store(paths):
+	if len(os.listdir(paths["sorted_queries"])) == 0:
+		pipeline.sort_queries(paths["queries"], paths["sorted_queries"])
+def bench_abundance_store(paths, budget):
+	store = AbundanceStore.from_queries(paths["sorted_queries"])
+	return sum(len(store.get(isotope)[0]) for isotope in store.isotopes)
+
+# Find the peak temperature of every final particle over the early files by sorted ID joins
+def bench_peak_reduction(paths, budget):
+	final = SDFFile(timestep_files(paths, "last")[0])
+	early = [SDFFile(f) for f in timestep_files(paths, "early")]
+	bytes_per_row = sum(sdf.row_bytes() for sdf in early) + 64
+	for start, stop, ids in reducers.id_blocks(final, budget, bytes_per_row):
+		reducers.peak_reduction(early, ids)
+	return final.n_rows * len(early)
+
+# Build the alignment index of the early files and gather through it
+def setup_joins(paths):
+	directory = os.path.join(paths["head"], "alignment.bench")
+	if os.path.isdir(directory):
+		shutil.rmtree(directory)
+def bench_joins(paths, budget):
+	early = timestep_files(paths, "early")
+	alignment = AlignmentIndex.build(early, os.path.join(paths["head"], "alignment.bench"))
+	rows = np.asarray(alignment.rows)
+	for j, filename in enumerate(early):
+		reducers.gather_rows(SDFFile(filename), rows[:, j], ["temp", "rho"])
+	return rows.shape[0] * rows.shape[1]
+
+# Total the unburned yields from the final SDF file and update the total yields
+def setup_yields(paths):
+	pipeline.extract_yields(paths["sbatch"], pipeline.analysis_file(paths, pipeline.YIELDS_END))
+def bench_yields(paths, budget):
+	pipeline.update_yields(pipeline.analysis_file(paths, pipeline.YIELDS_END),
+		os.path.join(paths["hdf5"], os.path.basename(paths["head"]) + "_pids.out"),
+		final_sdf=timestep_files(paths, "last")[0], budget=budget)
+
+# Total the unburned yields from the unburned CSV outfile instead
+def bench_unburned_csv(paths, budget):
+	final = timestep_files(paths, "last")[0]
+	pipeline.update_yields(pipeline.analysis_file(paths, pipeline.YIELDS_END),
+		os.path.join(paths["hdf5"], os.path.basename(paths["head"]) + "_pids.out"),
+		final + ".unburned.out", out_path=pipeline.analysis_file(paths, "_csv_yields.out"))
+
+# Write the particle plotting file
+def setup_exports(paths):
+	setup_abundance_store(paths)
+	directory = os.path.join(paths["head"], "alignment.plotting")
+	if os.path.isdir(directory):
+		shutil.rmtree(directory)
+def bench_exports(paths, budget):
+	pipeline.write_plotting(paths, list(ISOTOPES), budget=budget)
+
+# Every stage in the order they run: name -> (setup function or None, benchmark function)
+STAGES = [
+	("catalog scan", None, bench_catalog),
+	("extraction", None, bench_extraction),
+	("pid list", setup_pid_list, bench_pid_list),
+	("sort queries", None, bench_sort_queries),
+	("abundance store", setup_abundance_store, bench_abundance_store),
+	("peak reduction", None, bench_peak_reduction),
+	("joins", setup_joins, bench_joins),
+	("yields", setup_yields, bench_yields),
+	("unburned csv", setup_yields, bench_unburned_csv),
+	("exports", setup_exports, bench_exports),
+]
+
+
+# RUNNING AND COMPARING
+
+# Run one stage the given number of times and return the record of its fastest run
+def run_stage(name, setup, function, paths, budget, repeats):
+	best = None
+	for repeat in range(repeats):
+		if setup is not None:
+			setup(paths)
+		with telemetry.stage("bench " + name) as record:
+			particles = function(paths, budget)
+			if particles is not None:
+				record["particles"] = particles
+		if best is None or record["wall"] < best["wall"]:
+			best = record
+	return best
+
+# Run the chosen stages on every simulation size and layout, returning the result dicts
+def run_suite(workdir, sizes, layouts, stages=None, budget=None, repeats=3):
+	results = []
+	for layout in layouts:
+		for n in sizes:
+			paths = simulation(workdir, n, layout)
+			for name, setup, function in STAGES:
+				if stages is not None and name not in stages:
+					continue
+				print "Timing %s on %d particle %s" % (name, n, layout)
+				record = run_stage(name, setup, function, paths, budget, repeats)
+				results.append({"stage": name, "layout": layout, "n": n,
+					"wall": record["wall"], "cpu": record["cpu"] + record["children_cpu"],
+					"bytes_read": record["bytes_read"], "peak_rss": record["peak_rss"],
+					"particles": record.get("particles", 0),
+					"particles_per_sec": record.get("particles_per_sec")})
+	return results
+
+# Compare results against a baseline, returning the list of (result, baseline wall) regressions
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+	walls = dict(((r["stage"], r["layout"], r["n"]), r["wall"]) for r in baseline["results"])
+	regressions = []
+	for result in results:
+		key = (result["stage"], result["layout"], result["n"])
+		if key not in walls:
+			continue
+		result["baseline_wall"] = walls[key]
+		if result["wall"] > walls[key] * (1.0 + tolerance) and \
+			result["wall"] - walls[key] > NOISE_SECONDS:
+			result["regression"] = True
+			regressions.append((result, walls[key]))
+	return regressions
+
+# Return a text table of benchmark results
+def table(results):
+	lines = ["%-16s %-6s %10s %10s %10s %10s %12s %10s %10s" % ("stage", "layout", "size",
+		"particles", "wall (s)", "cpu (s)", "particles/s", "peak (MB)", "baseline")]
+	for r in results:
+		# The simulation size and the particles the stage actually processed can differ
+		rate = r.get("particles_per_sec")
+		baseline = ("%.3f" % (r["baseline_wall"]) if "baseline_wall" in r else "-")
+		if r.get("regression"):
+			baseline += " SLOWER"
+		lines.append("%-16s %-6s %10d %10d %10.3f %10.3f %12s %10.1f %10s" % (r["stage"],
+			r["layout"], r["n"], r.get("particles", 0), r["wall"], r["cpu"],
+			("%.3g" % (rate) if rate else "-"), r["peak_rss"] / 1e6, baseline))
+	return '\n'.join(lines) + '\n'
+
+# Return a description of the machine and software the benchmarks ran on
+def machine():
+	return {"host": socket.gethostname(), "cpus": multiprocessing.cpu_count(),
+		"python": sys.version.split()[0], "numpy": np.__version__,
+		"date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+# Main program: run the benchmarks given on the command line
+def main():
+	parser = argparse.ArgumentParser()
+	# Particle counts of the synthetic simulations, e.g., 10k,1M,10M
+	parser.add_argument('-n', '--sizes', default=DEFAULT_SIZES)
+	# SDF layouts of the synthetic simulations, jet3b and/or cco2
+	parser.add_argument('-l', '--layout', default=DEFAULT_LAYOUTS)
+	# Only run these stages (comma separated names)
+	parser.add_argument('-s', '--stages', default=None)
+	# Directory keeping the generated simulations between runs
+	parser.add_argument('-w', '--workdir', default="benchmark_data")
+	# Memory budget for the chunked stages, e.g., 2G
+	parser.add_argument('-b', '--budget', default=None)
+	# Number of times each stage is run, keeping the fastest
+	parser.add_argument('-r', '--repeats', type=int, default=3)
+	# File for the JSON results
+	parser.add_argument('-o', '--output', default=None)
+	# Earlier JSON results to compare against, and the slowdown allowed before flagging
+	parser.add_argument('--baseline', default=None)
+	parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+	args = parser.parse_args()
+	stages = (None if args.stages is None else [s.strip() for s in args.stages.split(",")])
+	results = run_suite(args.workdir, [parse_size(s) for s in args.sizes.split(",")],
+		args.layout.split(","), stages, args.budget, args.repeats)
+	regressions = []
+	if args.baseline is not None:
+		with open(args.baseline, 'r') as baseline_file:
+			regressions = compare(results, json.load(baseline_file), args.tolerance)
+	print
+	sys.stdout.write(table(results))
+	if args.output is not None:
+		with open(args.output, 'w') as output:
+			json.dump({"machine": machine(), "budget": args.budget, "repeats": args.repeats,
+				"results": results}, output, indent=1, sort_keys=True)
+	if len(regressions) > 0:
+		print "\n%d stages regressed against %s" % (len(regressions), args.baseline)
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,62 @@
+# Utilities for the out-of-core chunked execution mode of the vectorized readers and reducers
+# The user gives a memory budget and every stage works out its own chunk size from it
+# A budget of None means in-memory mode, where each stage handles all particles in one chunk
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	rows = chunk_rows("2G", bytes_per_row=400)
+#	for chunk in row_chunks(n_rows, rows):
+# To step through a dataset in blocks that fit comfortably inside 2 GB of memory
+
+import os
+import re
+
+# Environment variable that can set the default memory budget, e.g., DM_MEMORY_BUDGET=4G
+BUDGET_VARIABLE = "DM_MEMORY_BUDGET"
+# Multiplier on the raw bytes per row to leave room for temporaries made during a chunk
+OVERHEAD = 4
+# Chunks are never made smaller than this many rows, however small the budget
+MIN_ROWS = 1024
+
+# Multipliers for the unit suffixes allowed in memory budget strings
+UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+# Convert a memory budget like "512M", "4G", or 1e9 into a number of bytes
+# Returns None (in-memory mode) when given None and no default is set in the environment
+def parse_budget(budget):
+	# Fall back on the environment variable when no budget is given
+	if budget is None:
+		budget = os.environ.get(BUDGET_VARIABLE)
+		if budget is None or budget.strip() == "":
+			return None
+	# Plain numbers are already in bytes
+	if isinstance(budget, (int, long, float)):
+		return int(budget)
+	# Otherwise parse the number and its optional unit suffix
+	match = re.match(r"\A\s*([0-9.]+)\s*([KMGT]?)B?\s*\Z", budget.upper())
+	if not match:
+		raise ValueError("memory budget %s did not parse" % (repr(budget)))
+	return int(float(match.group(1)) * UNITS[match.group(2)])
+
+# Work out how many rows to handle per chunk for a given budget and per-row cost in bytes
+# Returns None in in-memory mode, meaning all rows go in a single chunk
+def chunk_rows(budget, bytes_per_row):
+	# Translate the budget into bytes, or note that there isn't one
+	budget = parse_budget(budget)
+	if budget is None:
+		return None
+	# Leave room for the temporary arrays that the vectorized math creates
+	rows = budget // (OVERHEAD * max(int(bytes_per_row), 1))
+	return max(int(rows), MIN_ROWS)
+
+# Generate (start, stop) row ranges covering n_rows rows in chunks of the given size
+# A chunk size of None produces a single range covering all of the rows
+def row_chunks(n_rows, rows=None):
+	# In-memory mode is a single chunk
+	if rows is None:
+		rows = max(n_rows, 1)
+	# Step through the rows one chunk at a time
+	for start in xrange(0, n_rows, rows):
+		yield start, min(start + rows, n_rows)
@@ -0,0 +1,448 @@
+#!/usr/bin/env python
+
+# Compound multi-isotope queries over the fmass data in the SE HDF5 files
+# burn_query can only flag a particle when one head isotope passes its cut; here a query is any
+# expression of per-term cuts combined with and (&), or (|), and not (~), where a term is
+#	26Al >= 1e-6      an isotope against its own threshold
+#	Si >= 1e-4        an element, i.e., the sum over all isotopes of that Z
+#	Si* >= 1e-6       any single isotope of that Z passing the cut
+#	44Ti/48Ti > 0.1   the ratio of two isotopes (or elements) against a threshold
+#	26Al              an isotope against its usual FMASS_CUT or FMASS_CUT_LOW threshold
+# Every query is evaluated as a batch of NumPy masks over blocks of particles, and all queries
+# share a single pass over the HDF5 files, so dozens of them cost about as much as one
+# Each query returns its sorted particle IDs, their masses, and the mass fractions of whatever
+# isotopes it asks to report (elements and wildcards expand to all of their isotopes)
+# Results can be written in the burn_query output format for sort_query and the abundance store
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	./compound_query.py -e "alsi: 26Al >= 1e-6 & Si* >= 1e-6 -> 26Al, Si" -o queries jet3b/hdf5/*.h5
+# To find every particle with 26Al and any silicon isotope above 1e-6 and write their 26Al and
+# silicon abundances to queries/alsi.out in burn_query format
+# Queries can also be listed in a file, one "name: expression -> report targets" per line
+
+import os
+import re
+import argparse
+import operator
+
+import numpy as np
+
+import sn_utils as sn
+import telemetry
+from se_data import SEFile, species_columns, file_bytes
+
+# Comparison operators that can be used in a query term
+OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+	"==": operator.eq, "!=": operator.ne}
+# Regular expression splitting query text into tokens
+TOKEN_PATTERN = re.compile(r"""
+	\s*(?:
+		(?P<isotope>[0-9]+(?:[A-Z][a-z]?|n)\*?(?![A-Za-z0-9.]|[-+][0-9]))  # isotope, not 1E-6
+	|
+		(?P<number>[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)  # threshold
+	|
+		(?P<word>[A-Za-z]+\*?)                # element, wildcard, or and/or/not
+	|
+		(?P<op><=|>=|==|!=|<|>|&&?|\|\|?|[~/()])  # operators and parentheses
+	)""", re.VERBOSE)
+# Words that can be used in place of the logical operators
+WORDS = {"and": "&", "or": "|", "not": "~"}
+
+
+# TARGETS
+
+# Parse a target into (kind, nz, nn), where the kind is "isotope", "element" (the sum over all
+# isotopes of Z), or "any" (each isotope of Z separately, from a trailing * wildcard)
+def parse_target(target):
+	wildcard = target.endswith("*")
+	name = target.rstrip("*")
+	if name.isalpha():
+		if name not in sn.SYMBOLS:
+			raise ValueError("unknown element %s in query" % (repr(target)))
+		return ("any" if wildcard else "element", sn.SYMBOLS.index(name), None)
+	nn, nz = sn.nn_nz(name)
+	return ("isotope", int(nz), int(nn))
+
+# Return the usual burn_query threshold of a target as a mass fraction
+def default_cut(target):
+	name = target.rstrip("*")
+	cut = (sn.FMASS_CUT_LOW if name in sn.ISOTOPES_LOW else sn.FMASS_CUT)
+	return 10.0 ** -int(cut)
+
+# Return the names of every isotope in a network that a target covers
+# An isotope the network lacks covers nothing, so it is simply never reported for that file
+def expand_target(target, nz, nn):
+	kind, z, n = parse_target(target)
+	return [sn.iso_name(b, a) for a, b in zip(nz, nn) if a == z and (kind != "isotope" or b == n)]
+
+
+# BLOCKS
+
+# One block of particles from an SE file, with every lookup a query makes saved for reuse,
+# so terms shared between queries are only computed once per block
+class Block:
+	def __init__(self, pids, mass, fmass, nz, nn):
+		self.pids, self.mass, self.fmass = pids, mass, fmass
+		self.nz, self.nn = nz, nn
+		self.columns = species_columns(nz, nn)
+		self.saved = {}
+	# Return the fmass columns that a target covers (none if the network lacks the isotope)
+	def target_columns(self, target):
+		kind, z, n = parse_target(target)
+		if kind == "isotope":
+			return [self.columns[(z, n)]] if (z, n) in self.columns else []
+		return [k for k in range(len(self.nz)) if self.nz[k] == z]
+	# Return the mass fractions of a target: one column for an isotope or the sum for an element,
+	# or a 2D array of every isotope for a wildcard
+	def values(self, target):
+		key = ("values", target)
+		if key not in self.saved:
+			columns = self.target_columns(target)
+			kind = parse_target(target)[0]
+			if kind == "any":
+				self.saved[key] = self.fmass[:, columns]
+			elif len(columns) == 1:
+				self.saved[key] = self.fmass[:, columns[0]]
+			else:
+				self.saved[key] = self.fmass[:, columns].sum(axis=1)
+		return self.saved[key]
+	# Return a mask saved under a key, computing it with a function if needed
+	def mask(self, key, function):
+		if key not in self.saved:
+			self.saved[key] = function()
+		return self.saved[key]
+
+
+# PREDICATES
+
+# A predicate knows how to compute its boolean mask over a block of particles
+# Combine them with &, |, and ~, just like the selections in selections.py
+class Predicate(object):
+	# Return a boolean array saying which particles in the block pass
+	def mask(self, block):
+		raise NotImplementedError
+	# Return the list of targets that the predicate looks at
+	def targets(self):
+		raise NotImplementedError
+	def __and__(self, other):
+		return And(self, other)
+	def __or__(self, other):
+		return Or(self, other)
+	def __invert__(self):
+		return Not(self)
+
+# Particles passing both of two predicates
+class And(Predicate):
+	def __init__(self, first, second):
+		self.first, self.second = first, second
+	def mask(self, block):
+		return self.first.mask(block) & self.second.mask(block)
+	def targets(self):
+		return self.first.targets() + self.second.targets()
+	def __str__(self):
+		return "(%s & %s)" % (self.first, self.second)
+
+# Particles passing either of two predicates
+class Or(Predicate):
+	def __init__(self, first, second):
+		self.first, self.second = first, second
+	def mask(self, block):
+		return self.first.mask(block) | self.second.mask(block)
+	def targets(self):
+		return self.first.targets() + self.second.targets()
+	def __str__(self):
+		return "(%s | %s)" % (self.first, self.second)
+
+# Particles failing a predicate
+class Not(Predicate):
+	def __init__(self, inner):
+		self.inner = inner
+	def mask(self, block):
+		return ~self.inner.mask(block)
+	def targets(self):
+		return self.inner.targets()
+	def __str__(self):
+		return "~%s" % (self.inner)
+
+# Mass fraction of an isotope or element compared against a threshold
+# A wildcard target passes if any one of its isotopes does
+class Cut(Predicate):
+	def __init__(self, target, op=">=", value=None):
+		parse_target(target)
+		self.target, self.op = target, op
+		self.value = (default_cut(target) if value is None else float(value))
+	def mask(self, block):
+		def compute():
+			result = OPERATORS[self.op](block.values(self.target), self.value)
+			return (result.any(axis=1) if result.ndim == 2 else result)
+		return block.mask(("cut", self.target, self.op, self.value), compute)
+	def targets(self):
+		return [self.target]
+	def __str__(self):
+		return "%s %s %g" % (self.target, self.op, self.value)
+
+# Ratio of the mass fractions of two isotopes or elements compared against a threshold
+# Particles with none of the denominator never pass
+class Ratio(Predicate):
+	def __init__(self, numerator, denominator, op, value):
+		for target in (numerator, denominator):
+			parse_target(target)
+		self.numerator, self.denominator = numerator.rstrip("*"), denominator.rstrip("*")
+		self.op, self.value = op, float(value)
+	def mask(self, block):
+		def compute():
+			top, bottom = block.values(self.numerator), block.values(self.denominator)
+			with np.errstate(divide='ignore', invalid='ignore'):
+				ratio = top / bottom
+			return (bottom > 0.0) & OPERATORS[self.op](ratio, self.value)
+		return block.mask(("ratio", self.numerator, self.denominator, self.op, self.value),
+			compute)
+	def targets(self):
+		return [self.numerator, self.denominator]
+	def __str__(self):
+		return "%s/%s %s %g" % (self.numerator, self.denominator, self.op, self.value)
+
+
+# PARSING
+
+# Split query text into a list of (kind, text) tokens
+def tokenize(text):
+	tokens, position = [], 0
+	text = text.rstrip()
+	while position < len(text):
+		match = TOKEN_PATTERN.match(text, position)
+		if not match or match.end() == position:
+			raise ValueError("query %s did not parse at %s" % (repr(text), repr(text[position:])))
+		kind = match.lastgroup
+		token = match.group(kind)
+		if kind == "word" and token.lower() in WORDS:
+			kind, token = "op", WORDS[token.lower()]
+		elif kind == "word":
+			kind = "isotope"
+		elif kind == "op":
+			token = token[0] if token in ("&&", "||") else token
+		tokens.append((kind, token))
+		position = match.end()
+	return tokens
+
+# Recursive descent parser for query expressions, with & binding tighter than |
+class Parser:
+	def __init__(self, text):
+		self.text = text
+		self.tokens = tokenize(text)
+		self.position = 0
+	def peek(self):
+		return (self.tokens[self.position] if self.position < len(self.tokens) else (None, None))
+	def take(self, kind=None, token=None):
+		found = self.peek()
+		if found[0] is None or (kind is not None and found[0] != kind) or \
+			(token is not None and found[1] != token):
+			raise ValueError("query %s did not parse: expected %s, found %s" % (repr(self.text),
+				token or kind, found[1]))
+		self.position += 1
+		return found[1]
+	def parse(self):
+		predicate = self.expression()
+		if self.peek()[0] is not None:
+			raise ValueError("query %s did not parse: unexpected %s" % (repr(self.text),
+				self.peek()[1]))
+		return predicate
+	def expression(self):
+		predicate = self.term()
+		while self.peek() == ("op", "|"):
+			self.take()
+			predicate = predicate | self.term()
+		return predicate
+	def term(self):
+		predicate = self.factor()
+		while self.peek() == ("op", "&"):
+			self.take()
+			predicate = predicate & self.factor()
+		return predicate
+	def factor(self):
+		if self.peek() == ("op", "~"):
+			self.take()
+			return ~self.factor()
+		if self.peek() == ("op", "("):
+			self.take()
+			predicate = self.expression()
+			self.take("op", ")")
+			return predicate
+		target = self.take("isotope")
+		# A ratio of two targets always needs an explicit threshold
+		if self.peek() == ("op", "/"):
+			self.take()
+			denominator = self.take("isotope")
+			op = self.take("op")
+			return Ratio(target, denominator, op, self.take("number"))
+		# A bare target uses its usual threshold
+		if self.peek()[0] != "op" or self.peek()[1] not in OPERATORS:
+			return Cut(target)
+		op = self.take("op")
+		return Cut(target, op, self.take("number"))
+
+# Parse a query expression into a predicate
+def parse(text):
+	return Parser(text).parse()
+
+
+# QUERIES
+
+# A named predicate plus the targets whose mass fractions it reports
+# By default a query reports the targets that its predicate looks at
+class Query:
+	def __init__(self, name, predicate, report=None):
+		self.name = name
+		self.predicate = (parse(predicate) if isinstance(predicate, basestring) else predicate)
+		if report is None:
+			report = []
+			for target in self.predicate.targets():
+				if target not in report:
+					report.append(target)
+		self.report = list(report)
+	def __str__(self):
+		return "%s: %s -> %s" % (self.name, self.predicate, ", ".join(self.report))
+
+# Parse a "name: expression -> report targets" line into a query
+def parse_query(line):
+	name, colon, rest = line.partition(":")
+	if colon == "" or name.strip() == "":
+		raise ValueError("query line %s has no name" % (repr(line)))
+	expression, arrow, report = rest.partition("->")
+	report = ([t.strip() for t in report.split(",") if t.strip() != ""] if arrow else None)
+	return Query(name.strip(), expression, report)
+
+# Read every query listed in a file, skipping blank lines and # comments
+def read_queries(filename):
+	return [parse_query(line) for line in sn.get_lines(filename)
+		if line.strip() != "" and not line.strip().startswith("#")]
+
+# The particles that passed a query, sorted by ID, with their masses and reported mass fractions
+class QueryResult:
+	def __init__(self, query, pids, mass, isotopes, fmass):
+		self.query, self.name = query, query.name
+		self.pids, self.mass, self.isotopes, self.fmass = pids, mass, isotopes, fmass
+	def __len__(self):
+		return len(self.pids)
+	# Return the reported mass fractions of one isotope
+	def get(self, isotope):
+		return self.fmass[:, self.isotopes.index(isotope)]
+
+# Rows of many queries gathered over blocks of particles from one or more SE files
+# Scans of different files merge by concatenation, and the results come out in particle ID order
+# whatever order the scans were merged in, so the rows are the same however files are divided up
+class QueryScan:
+	def __init__(self, queries):
+		self.queries = list(queries)
+		self.parts = dict((query.name, []) for query in self.queries)
+		self.reported = dict((query.name, []) for query in self.queries)
+		self.columns = None
+	# Work out which network columns each query reports, once per file
+	def start_file(self, nz, nn):
+		self.nz, self.nn = nz, nn
+		lookup = dict((sn.iso_name(n, z), k) for k, (z, n) in enumerate(zip(nz, nn)))
+		self.columns = {}
+		for query in self.queries:
+			isotopes = []
+			for target in query.report:
+				isotopes.extend([i for i in expand_target(target, nz, nn) if i not in isotopes])
+			self.reported[query.name].extend([i for i in isotopes
+				if i not in self.reported[query.name]])
+			self.columns[query.name] = (isotopes, [lookup[i] for i in isotopes])
+	# Evaluate every query on a block of particles from the current file
+	def add(self, pids, mass, fmass):
+		block = Block(pids, mass, fmass, self.nz, self.nn)
+		for query in self.queries:
+			passed = np.flatnonzero(query.predicate.mask(block))
+			if len(passed) == 0:
+				continue
+			isotopes, ks = self.columns[query.name]
+			self.parts[query.name].append((pids[passed], mass[passed], isotopes,
+				fmass[np.ix_(passed, ks)]))
+	# Add the rows of another scan of the same queries into this one
+	def merge(self, other):
+		for query in self.queries:
+			self.parts[query.name].extend(other.parts[query.name])
+			self.reported[query.name].extend([i for i in other.reported[query.name]
+				if i not in self.reported[query.name]])
+		return self
+	# Put each query's rows together in particle ID order, returning a dict of results
+	def results(self):
+		results = {}
+		for query in self.queries:
+			isotopes = self.reported[query.name]
+			pieces = self.parts[query.name]
+			pids = np.concatenate([p[0] for p in pieces] + [np.zeros(0, dtype=np.int64)])
+			mass = np.concatenate([p[1] for p in pieces] + [np.zeros(0)])
+			fmass = np.zeros((len(pids), len(isotopes)))
+			row = 0
+			for part_pids, part_mass, names, values in pieces:
+				ks = [isotopes.index(i) for i in names]
+				fmass[row:row+len(part_pids), ks] = values
+				row += len(part_pids)
+			order = np.argsort(pids, kind="mergesort")
+			results[query.name] = QueryResult(query, pids[order], mass[order], isotopes,
+				fmass[order])
+		return results
+
+# Run many queries on a list of SE HDF5 files in a single pass, returning a dict of results
+def run_queries(hdf5_files, queries, budget=None):
+	scan = QueryScan(queries)
+	for filename in sorted(hdf5_files):
+		telemetry.count(bytes_read=file_bytes(filename))
+		with SEFile(filename) as se:
+			scan.start_file(se.nz, se.nn)
+			for pids, mass, fmass in se.blocks(budget):
+				telemetry.count(particles=len(pids))
+				scan.add(pids, mass, fmass)
+	return scan.results()
+
+# Write a query result in the "ID, Z, n, Mass_Frac" format of burn_query outfiles
+# Only mass fractions at or above the minimum are written, like burn_query's secondary cuts
+def write_result(filename, result, minimum=0.0):
+	with open(filename, 'w') as outfile:
+		outfile.write("ID, Z, n, Mass_Frac \n")
+		names = [sn.nn_nz(isotope) for isotope in result.isotopes]
+		for i in range(len(result)):
+			for k, (nn, nz) in enumerate(names):
+				if result.fmass[i, k] > 0.0 and result.fmass[i, k] >= minimum:
+					outfile.write("%d, %s, %s, %e\n" % (result.pids[i], nz, nn,
+						result.fmass[i, k]))
+	return filename
+
+# Main program: run the queries given on the command line and write their results
+def main():
+	parser = argparse.ArgumentParser()
+	# File of queries, one "name: expression -> report targets" per line
+	parser.add_argument('-q', '--queries', default=None)
+	# Single queries in the same format (can be repeated)
+	parser.add_argument('-e', '--expression', action='append', default=[])
+	# Directory for the result files, one "<name>.out" per query
+	parser.add_argument('-o', '--outdir', default=".")
+	# Smallest reported mass fraction to write out
+	parser.add_argument('-m', '--minimum', type=float, default=0.0)
+	# Memory budget for the particle blocks, e.g., 2G
+	parser.add_argument('-b', '--budget', default=None)
+	# The set of HDF5 file(s) that the queries are being done on
+	parser.add_argument('hdf5', nargs='+')
+	args = parser.parse_args()
+	queries = (read_queries(args.queries) if args.queries is not None else [])
+	queries.extend([parse_query(line) for line in args.expression])
+	if len(queries) == 0:
+		parser.error("no queries given")
+	if not os.path.isdir(args.outdir):
+		os.makedirs(args.outdir)
+	telemetry.start_run("compound_query")
+	with telemetry.stage("compound_query", queries=len(queries)):
+		results = run_queries(args.hdf5, queries, args.budget)
+	for query in queries:
+		result = results[query.name]
+		outfile = write_result(os.path.join(args.outdir, query.name + ".out"), result,
+			args.minimum)
+		print "%s: %d particles -> %s" % (query, len(result), outfile)
+	telemetry.end_run()
+
+if __name__ == "__main__":
+	main()
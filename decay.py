@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+# Radioactive decay of total yields and per-particle abundances to any later times
+# A built-in chain table covers the radioactive nuclides in isotopes.txt, plus the short-lived
+# members of their chains that the list leaves out (44Sc, 48V, 55Fe, 63Ni) and their final
+# daughters, so 56Ni -> 56Co -> 56Fe, 44Ti -> 44Sc -> 44Ca, 60Fe -> 60Co -> 60Ni, and so on
+# The chains make a linear system dX/dt = A X for the mass fractions, and since no nuclide feeds
+# back into its own chain, A is triangular with the decay constants down its diagonal, so the
+# matrix exponential exp(A t) = V exp(-lambda t) V^-1 follows from the analytic (Bateman)
+# eigenvectors V and is worked out for a whole grid of times at once
+# Applying it is then one small matrix product per time over a block of particles, so late-time
+# compositions of millions of particles take seconds
+# Every decay in the table keeps the mass number, so mass fractions move between nuclides as is
+# (the tiny mass defects are ignored)
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	./decay.py -t 1y,100y,1Myr sn_data/jet3b/analysis/jet3b_updated_yields.out
+# To write the jet3b total yields as they would be 1, 100, and 1 million years after the explosion
+#	./decay.py -t 100y -d sn_data/jet3b/analysis/jet3b_plotting.dataset
+# To write a dataset of the per-particle isotope abundances at 100 years next to jet3b's dataset
+
+import os
+import re
+import argparse
+
+import numpy as np
+
+import sn_utils as sn
+import telemetry
+from chunking import chunk_rows, row_chunks
+from particle_data import ParticleDataset, COLUMNS_FILE, abundance_column, column_filename
+
+# Units of time in seconds, by the suffixes that times can be given with
+MINUTE = 60.0
+HOUR = 3600.0
+DAY = 86400.0
+YEAR = 365.25 * DAY
+TIME_UNITS = {"s": 1.0, "min": MINUTE, "h": HOUR, "d": DAY, "y": YEAR, "yr": YEAR,
+	"kyr": 1e3 * YEAR, "Myr": 1e6 * YEAR, "Gyr": 1e9 * YEAR}
+
+# Chain table: nuclide -> (half-life in seconds, [(daughter, branching fraction), ...])
+DECAYS = {
+	"1n": (613.9, [("1H", 1.0)]),
+	"7Be": (53.22 * DAY, [("7Li", 1.0)]),
+	"10Be": (1.387e6 * YEAR, [("10B", 1.0)]),
+	"22Na": (2.6018 * YEAR, [("22Ne", 1.0)]),
+	"26Al": (7.17e5 * YEAR, [("26Mg", 1.0)]),
+	"40K": (1.248e9 * YEAR, [("40Ca", 0.8928), ("40Ar", 0.1072)]),
+	"41Ca": (9.94e4 * YEAR, [("41K", 1.0)]),
+	"44Ti": (59.1 * YEAR, [("44Sc", 1.0)]),
+	"44Sc": (3.97 * HOUR, [("44Ca", 1.0)]),
+	"48Cr": (21.56 * HOUR, [("48V", 1.0)]),
+	"48V": (15.9735 * DAY, [("48Ti", 1.0)]),
+	"55Co": (17.53 * HOUR, [("55Fe", 1.0)]),
+	"55Fe": (2.744 * YEAR, [("55Mn", 1.0)]),
+	"56Ni": (6.075 * DAY, [("56Co", 1.0)]),
+	"56Co": (77.236 * DAY, [("56Fe", 1.0)]),
+	"57Co": (271.74 * DAY, [("57Fe", 1.0)]),
+	"58Co": (70.86 * DAY, [("58Fe", 1.0)]),
+	"60Fe": (2.62e6 * YEAR, [("60Co", 1.0)]),
+	"60Co": (5.2714 * YEAR, [("60Ni", 1.0)]),
+	"61Co": (1.650 * HOUR, [("61Ni", 1.0)]),
+	"62Co": (1.54 * MINUTE, [("62Ni", 1.0)]),
+	"63Co": (27.4, [("63Ni", 1.0)]),
+	"63Ni": (101.2 * YEAR, [("63Cu", 1.0)]),
+}
+
+# Rough memory cost in bytes per particle row per isotope column per time while decaying
+BYTES_PER_VALUE = 24
+
+
+# TIMES
+
+# Convert a time like "100y", "3.5d", "1Myr", or a plain number of seconds into seconds
+def parse_time(text):
+	match = re.match(r"\A\s*([0-9.eE+-]+)\s*([A-Za-z]*)\s*\Z", text)
+	if not match or match.group(2) not in TIME_UNITS and match.group(2) != "":
+		raise ValueError("time %s did not parse" % (repr(text)))
+	return float(match.group(1)) * TIME_UNITS.get(match.group(2), 1.0)
+
+
+# DECAY CHAINS
+
+# The decay system of a list of nuclides, which grows to hold every member of their chains
+class DecayChains:
+	# Set up the chains of a list of isotopes (default is isotopes.txt) from the chain table
+	def __init__(self, isotopes=None, table=DECAYS):
+		if isotopes is None:
+			isotopes = sn.get_list(sn.ISOTOPES_FILE)
+		self.table = table
+		# Only nuclides that decay or are fed by a decay need to be in the system
+		self.species = []
+		pending = [standard_name(i) for i in isotopes if standard_name(i) in table]
+		while len(pending) > 0:
+			name = pending.pop(0)
+			if name in self.species:
+				continue
+			self.species.append(name)
+			if name in table:
+				pending.extend([daughter for daughter, branch in table[name][1]])
+		# Put parents before their daughters, so the rate matrix is lower triangular
+		self.species = topological_order(self.species, table)
+		self.index = dict((name, k) for k, name in enumerate(self.species))
+		# Rate matrix of dX/dt = A X, with a decay constant ln(2) / half-life per nuclide
+		n = len(self.species)
+		self.rates = np.zeros((n, n))
+		self.constants = np.zeros(n)
+		for name in self.species:
+			if name not in table:
+				continue
+			half_life, daughters = table[name]
+			k = self.index[name]
+			rate = np.log(2.0) / half_life
+			self.constants[k] = rate
+			self.rates[k, k] -= rate
+			for daughter, branch in daughters:
+				self.rates[self.index[daughter], k] += rate * branch
+		self.vectors, self.inverse = bateman_vectors(self.rates, self.constants)
+	# Return the (times, species, species) stack of matrices exp(A t) for a grid of times
+	def propagators(self, times):
+		times = np.asarray(times, dtype=float)
+		decays = np.exp(-np.outer(times, self.constants))
+		stack = np.einsum("ij,tj,jk->tik", self.vectors, decays, self.inverse)
+		# Round-off in the fastest chains can leave tiny negative entries
+		return np.clip(stack, 0.0, None)
+	# Decay a (particles, isotopes) array of mass fractions (or masses) to every time in a grid
+	# Returns the (times, particles, isotopes) array of results and its list of isotope names,
+	# which is the input list followed by any chain members that were not in it
+	def evolve(self, values, isotopes, times, propagators=None):
+		values = np.asarray(values, dtype=float)
+		if values.ndim == 1:
+			values = values[:, np.newaxis]
+		isotopes = [standard_name(i) for i in isotopes]
+		extra = [name for name in self.species if name not in isotopes]
+		names = isotopes + extra
+		out = np.empty((len(times), values.shape[0], len(names)))
+		out[:, :, :len(isotopes)] = values
+		out[:, :, len(isotopes):] = 0.0
+		# Only the columns in the decay system change, through one product per time
+		columns = [names.index(name) for name in self.species]
+		if len(columns) == 0:
+			return out, names
+		if propagators is None:
+			propagators = self.propagators(times)
+		start = np.zeros((values.shape[0], len(self.species)))
+		for k, name in enumerate(self.species):
+			if name in isotopes:
+				start[:, k] = values[:, isotopes.index(name)]
+		for t in range(len(times)):
+			out[t][:, columns] = np.dot(start, propagators[t].T)
+		return out, names
+
+# Return the nuclides of a decay system with every parent before all of its daughters
+def topological_order(species, table):
+	parents = dict((name, 0) for name in species)
+	for name in species:
+		for daughter, branch in table.get(name, (0.0, []))[1]:
+			parents[daughter] += 1
+	ready = [name for name in species if parents[name] == 0]
+	order = []
+	while len(ready) > 0:
+		name = ready.pop(0)
+		order.append(name)
+		for daughter, branch in table.get(name, (0.0, []))[1]:
+			parents[daughter] -= 1
+			if parents[daughter] == 0:
+				ready.append(daughter)
+	if len(order) != len(species):
+		raise ValueError("decay chain table has a loop")
+	return order
+
+# Return the eigenvectors of a lower triangular rate matrix and their inverse
+# Each nuclide's vector is 1 at itself and follows its chain down by forward substitution,
+# which is the Bateman solution; it needs every nuclide to decay faster or slower than each of
+# its descendants, which holds for any real chain
+def bateman_vectors(rates, constants):
+	n = len(constants)
+	vectors = np.zeros((n, n))
+	for i in range(n):
+		vectors[i, i] = 1.0
+		for j in range(i + 1, n):
+			feed = np.dot(rates[j, i:j], vectors[i:j, i])
+			if feed == 0.0:
+				continue
+			if abs(constants[j] - constants[i]) <= 1e-12 * max(constants[i], constants[j]):
+				raise ValueError("nuclides %d and %d of a chain decay at the same rate" % (i, j))
+			vectors[j, i] = feed / (constants[j] - constants[i])
+	# The vectors are unit lower triangular, so their inverse is well behaved
+	return vectors, np.linalg.inv(vectors)
+
+# Return the standard name of an isotope, e.g., "26Al" for "Al26"
+def standard_name(isotope):
+	nn, nz = sn.nn_nz(isotope)
+	return sn.iso_name(nn, nz)
+
+
+# YIELDS AND DATASETS
+
+# Decay total yields, given as (nn, nz, grams, percent) tuples, to every time in a grid
+# Returns a list with the decayed yields at each time, with any new chain members at the end
+def decay_yields(yields, times, chains=None):
+	names = [sn.iso_name(nn, nz) for nn, nz, mass, percent in yields]
+	if chains is None:
+		chains = DecayChains(names)
+	grams = np.array([[mass for nn, nz, mass, percent in yields]])
+	out, names = chains.evolve(grams, names, times)
+	results = []
+	for t in range(len(times)):
+		masses = out[t, 0]
+		total = masses.sum()
+		pairs = [sn.nn_nz(name) for name in names]
+		results.append([(int(nn), int(nz), mass, (100.0 * mass / total if total > 0 else 0.0))
+			for (nn, nz), mass in zip(pairs, masses)])
+	return results
+
+# Return the isotope abundance columns of a particle dataset as (column names, isotope names)
+def isotope_columns(ds):
+	columns, isotopes = [], []
+	for name in ds.names:
+		match = re.match(r"\AX_\{(.+)\}\Z", name)
+		if match and not match.group(1).isalpha():
+			columns.append(name)
+			isotopes.append(standard_name(match.group(1)))
+	return columns, isotopes
+
+# Decay the isotope abundances of a particle dataset to every time in a grid
+# Each time gets its own dataset directory (<dataset>.decay_<label>) with the ID column and an
+# abundance column for every isotope, including chain members the dataset did not have
+# Element columns are not carried over, since element sums cannot be decayed without their isotopes
+def decay_dataset(ds, times, labels=None, chains=None, budget=None):
+	if labels is None:
+		labels = ["%gs" % (t) for t in times]
+	columns, isotopes = isotope_columns(ds)
+	if chains is None:
+		chains = DecayChains(isotopes)
+	propagators = chains.propagators(times)
+	names = isotopes + [name for name in chains.species if name not in isotopes]
+	directories = [os.path.normpath(ds.directory) + ".decay_" + label for label in labels]
+	outputs = []
+	for directory in directories:
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		np.save(os.path.join(directory, column_filename("id")), ds.read("id"))
+		header = ["id"] + [abundance_column(name) for name in names]
+		with open(os.path.join(directory, COLUMNS_FILE), 'w') as columns_file:
+			columns_file.write('\n'.join(header) + '\n')
+		outputs.append([np.lib.format.open_memmap(os.path.join(directory,
+			column_filename(abundance_column(name))), mode="w+", dtype=float, shape=(ds.n_rows,))
+			for name in names])
+	rows = chunk_rows(budget, BYTES_PER_VALUE * len(names) * (len(times) + 1))
+	for start, stop in row_chunks(ds.n_rows, rows):
+		values = np.column_stack([ds.read(name, start, stop) for name in columns])
+		telemetry.count(particles=stop - start)
+		out, names = chains.evolve(values, isotopes, times, propagators)
+		for t in range(len(times)):
+			for k in range(len(names)):
+				outputs[t][k][start:stop] = out[t, :, k]
+	for arrays in outputs:
+		for array in arrays:
+			array.flush()
+	return [ParticleDataset(directory) for directory in directories]
+
+# Main program: decay a yields file or a particle dataset to the times given
+def main():
+	parser = argparse.ArgumentParser()
+	# Times after the end of the simulation, e.g., 1d,1y,100y,1Myr
+	parser.add_argument('-t', '--times', required=True)
+	# Decay a particle dataset directory instead of a yields file
+	parser.add_argument('-d', '--dataset', action='store_true')
+	# Memory budget for the particle blocks, e.g., 2G
+	parser.add_argument('-b', '--budget', default=None)
+	# The yields file or dataset directory to decay
+	parser.add_argument('source')
+	args = parser.parse_args()
+	labels = [label.strip() for label in args.times.split(",")]
+	times = [parse_time(label) for label in labels]
+	telemetry.start_run("decay")
+	if args.dataset:
+		with telemetry.stage("decay_dataset", times=len(times)):
+			for ds in decay_dataset(ParticleDataset(args.source), times, labels, budget=args.budget):
+				print "Decayed abundances saved to %s" % (ds.directory)
+	else:
+		import pipeline
+		with telemetry.stage("decay_yields", times=len(times)):
+			results = decay_yields(pipeline.read_yields(args.source), times)
+		base = os.path.splitext(args.source)[0]
+		for label, yields in zip(labels, results):
+			pipeline.write_yields(yields, "%s_%s.out" % (base, label))
+			print "Decayed yields saved to %s_%s.out" % (base, label)
+	telemetry.end_run()
+
+if __name__ == "__main__":
+	main()
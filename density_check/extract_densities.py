@@ -2,65 +2,34 @@
 
 # Extract the peak density and density at peak temp from each simulation
 # Write them to files in this directory for analysis
+# Both reductions are computed together in one pass over the early SDF files
 
 # Greg Vance, 4/4/17
 
-import os
 import sys
 
-# So sn_utils and particler can be imported
+# So sn_utils and lazy_frame can be imported
 sys.path.append("/home/gsvance/data_mining/")
 
-import sn_utils as sn
-from particler import Particler
+import numpy as np
+
+from lazy_frame import Simulation, compute
 
 SN_DATA = "/home/gsvance/sn_data/"
 SN_SIMS = ["50Am", "cco2", "g292-j4c", "jet3b"]
 
 for sim in SN_SIMS:
 
-	head = SN_DATA + sim
-	paths = sn.get_paths(head)
-	sdf_dir = paths["sdf"]
+	early = Simulation(SN_DATA + sim).early()
 
-	sdf_files = sn.sdf_list(paths, mode="early", dotout=True)
-	sdfs = [Particler(os.path.join(paths["sdf"], s)) for s in sdf_files]
+	peak_rho, rho_at_peak_temp = compute(early.max("rho"), early.at_max("temp", "rho"))
 
 	outfilename = sim + "_density.txt"
 	outfile = open(outfilename, "w")
 
 	outfile.write("id, peak_density, density_at_peak_temp\n")
 
-	id = 0
-
-	while not all([s.is_empty() for s in sdfs]):
-
-		if id % 50000 == 0:
-			print "particle " + str(id)
-
-		lines = [s.get_next(id) for s in sdfs]
-		if all([line == [] for line in lines]):
-			id += 1
-			continue
-
-		rho_temp = []
-
-		for line in lines:
-			if line != []:
-				rho = float(line[7])
-				temp = float(line[4])
-				rho_temp.append((rho, temp))
-
-		peak_rho = max(rho_temp, key=lambda x : x[0])[0]
-		rho_at_peak_temp = max(rho_temp, key=lambda x : x[1])[0]
-
-		outfile.write(str(id) + ", " + str(peak_rho) + ", " + \
-			str(rho_at_peak_temp) + "\n")
-
-		id += 1
+	np.savetxt(outfile, np.column_stack([peak_rho.pids, peak_rho.values,
+		rho_at_peak_temp.values]), fmt=["%d", "%.12g", "%.12g"], delimiter=", ")
 
 	outfile.close()
-
-	for s in sdfs:
-		s.close()
-
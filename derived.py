@@ -0,0 +1,217 @@
+# Registry of derived particle quantities computed from the base fields of SDF files
+# Each derived column names the SDF fields it needs and a vectorized function that turns them
+# into the derived values, in CGS units unless noted otherwise
+# Columns are computed lazily on first use, a chunk of rows at a time, and cached to disk
+# next to the SDF file; a cached column is recomputed whenever the file or definition changes
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	columns = DerivedColumns(SDFFile("sn_data/jet3b/sdf/run1.00410"), budget="2G")
+#	unbound = columns.get("unbound")
+#	ye_mass = columns.get("Ye mass")[unbound == 1.0].sum()
+# To sum the Ye-weighted mass of the unbound ejecta in a jet3b timestep
+
+import os
+import types
+import hashlib
+
+import numpy as np
+
+import sn_utils as sn
+from particle_data import files_fingerprint
+from chunking import chunk_rows, row_chunks
+
+# Directory name suffix for the derived column cache of an SDF file
+CACHE_SUFFIX = ".derived"
+
+# Physical constants in CGS units
+RADIATION_CONSTANT = 7.5657e-15  # erg cm^-3 K^-4
+BOLTZMANN = 1.380649e-16  # erg K^-1
+ATOMIC_MASS_UNIT = 1.66053907e-24  # g
+
+
+# DERIVED QUANTITIES
+
+# Every function takes a dict of input field arrays (in SNSPH units) and returns a float64 array
+
+# Distance from the origin in centimeters
+def _radius(v):
+	return np.sqrt(v["x"]**2 + v["y"]**2 + v["z"]**2) * sn.SNSPH_LENGTH
+
+# Radial velocity in cm/s (positive outward), zero for particles at the origin
+def _radial_velocity(v):
+	r = np.sqrt(v["x"]**2 + v["y"]**2 + v["z"]**2)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		v_r = (v["x"] * v["vx"] + v["y"] * v["vy"] + v["z"] * v["vz"]) / r
+	v_r[r == 0.0] = 0.0
+	return v_r * sn.SNSPH_VELOCITY
+
+# Speed in cm/s
+def _speed(v):
+	return np.sqrt(v["vx"]**2 + v["vy"]**2 + v["vz"]**2) * sn.SNSPH_VELOCITY
+
+# Kinetic energy in erg
+def _kinetic_energy(v):
+	speed2 = (v["vx"]**2 + v["vy"]**2 + v["vz"]**2) * sn.SNSPH_VELOCITY**2
+	return 0.5 * v["mass"] * sn.SNSPH_MASS * speed2
+
+# Internal (thermal) energy in erg
+def _internal_energy(v):
+	return v["mass"] * sn.SNSPH_MASS * v["u"] * sn.SNSPH_VELOCITY**2
+
+# Gravitational potential energy in erg (negative for bound particles)
+def _potential_energy(v):
+	return v["mass"] * sn.SNSPH_MASS * v["phi"] * sn.SNSPH_VELOCITY**2
+
+# Total specific energy (kinetic + internal + potential) in erg/g
+def _specific_energy(v):
+	kinetic = 0.5 * (v["vx"]**2 + v["vy"]**2 + v["vz"]**2)
+	return (kinetic + v["u"] + v["phi"]) * sn.SNSPH_VELOCITY**2
+
+# One for particles with positive total specific energy (unbound ejecta), zero otherwise
+def _unbound(v):
+	return (_specific_energy(v) > 0.0).astype(np.float64)
+
+# Radiation entropy in units of k_B per baryon, which dominates in the shocked ejecta
+def _entropy(v):
+	rho = v["rho"] * sn.SNSPH_DENSITY
+	with np.errstate(invalid="ignore", divide="ignore"):
+		s = 4.0 * RADIATION_CONSTANT * v["temp"]**3 * ATOMIC_MASS_UNIT / (3.0 * rho * BOLTZMANN)
+	s[rho <= 0.0] = 0.0
+	return s
+
+# Particle mass times electron fraction in grams, for Ye-weighted sums
+def _ye_mass(v):
+	return v["mass"] * sn.SNSPH_MASS * v["Y_el"]
+
+# Lookup table of the derived columns: name -> (SDF fields needed, function)
+DERIVED_FIELDS = {
+	"r": (("x", "y", "z"), _radius),
+	"v_r": (("x", "y", "z", "vx", "vy", "vz"), _radial_velocity),
+	"speed": (("vx", "vy", "vz"), _speed),
+	"kinetic energy": (("mass", "vx", "vy", "vz"), _kinetic_energy),
+	"internal energy": (("mass", "u"), _internal_energy),
+	"potential energy": (("mass", "phi"), _potential_energy),
+	"specific energy": (("vx", "vy", "vz", "u", "phi"), _specific_energy),
+	"unbound": (("vx", "vy", "vz", "u", "phi"), _unbound),
+	"entropy": (("temp", "rho"), _entropy),
+	"Ye mass": (("mass", "Y_el"), _ye_mass),
+}
+
+# Add a derived column to the registry (or replace one), given its SDF inputs and function
+def register(name, inputs, function):
+	DERIVED_FIELDS[name] = (tuple(inputs), function)
+
+# Return a text description of everything a derived function's result depends on: its own code,
+# the code of any functions it calls (e.g., _unbound calls _specific_energy), and the values of
+# the constants it reads, either globals or module attributes (e.g., sn.SNSPH_VELOCITY)
+def definition(function):
+	return _code_definition(function.__code__, function.__globals__, set())
+
+# Describe one code object, using its globals to resolve names and seen to avoid recursing forever
+def _code_definition(code, globals_, seen):
+	seen.add(code)
+	parts = [code.co_code]
+	# Nested code objects (e.g., lambdas) are described rather than repr'd with their addresses
+	for const in code.co_consts:
+		if isinstance(const, types.CodeType):
+			if const not in seen:
+				parts.append(_code_definition(const, globals_, seen))
+		else:
+			parts.append(repr(const))
+	for name in code.co_names:
+		if name not in globals_:
+			continue
+		value = globals_[name]
+		if isinstance(value, types.FunctionType):
+			if value.__code__ not in seen:
+				parts.append(_code_definition(value.__code__, value.__globals__, seen))
+		elif isinstance(value, (int, long, float, str)):
+			parts.append("%s=%r" % (name, value))
+		elif isinstance(value, types.ModuleType):
+			# Any other name the code reads could be a constant attribute of this module
+			for attr in code.co_names:
+				constant = getattr(value, attr, None)
+				if isinstance(constant, (int, long, float, str)):
+					parts.append("%s.%s=%r" % (name, attr, constant))
+	return "\n".join(parts)
+
+
+# LAZY COLUMN CACHE
+
+# Derived columns of one SDF file, computed on first request and cached on disk
+class DerivedColumns:
+	# Set up the cache for an SDF file, by default in a directory next to the file
+	def __init__(self, sdf, directory=None, budget=None):
+		self.sdf = sdf
+		if directory is None:
+			directory = sdf.filename + CACHE_SUFFIX
+		self.directory = os.path.abspath(directory)
+		self.budget = budget
+		# Memory maps of the columns already opened
+		self._maps = {}
+	# Return the cache key of a derived column, which changes if its inputs or definition change,
+	# including the functions and unit constants the definition uses
+	def key(self, name):
+		inputs, function = DERIVED_FIELDS[name]
+		digest = hashlib.sha1()
+		digest.update(("%s\n%s\n" % (name, ",".join(inputs))).encode("utf-8"))
+		digest.update(definition(function))
+		digest.update(files_fingerprint([self.sdf.filename]).encode("utf-8"))
+		return digest.hexdigest()
+	# Return the cache file paths (values and key) of a derived column
+	def paths(self, name):
+		base = os.path.join(self.directory, name.replace(" ", "_"))
+		return base + ".npy", base + ".key"
+	# Check whether a derived column is cached and still current
+	def is_current(self, name):
+		npy_path, key_path = self.paths(name)
+		if not (os.path.isfile(npy_path) and os.path.isfile(key_path)):
+			return False
+		with open(key_path, 'r') as key_file:
+			return key_file.read().strip() == self.key(name)
+	# Return a derived column as a read-only memory map, computing and caching it if needed
+	def get(self, name):
+		if name not in DERIVED_FIELDS:
+			raise KeyError("unknown derived column %s" % (repr(name)))
+		if name in self._maps and self.is_current(name):
+			return self._maps[name]
+		if not self.is_current(name):
+			self.compute(name)
+		self._maps[name] = np.load(self.paths(name)[0], mmap_mode='r')
+		return self._maps[name]
+	# Compute a derived column chunk by chunk and write it to the cache
+	def compute(self, name):
+		inputs, function = DERIVED_FIELDS[name]
+		for field in inputs:
+			if not self.sdf.has_column(field):
+				raise KeyError("derived column %s needs field %s, which is not in %s"
+					% (repr(name), field, self.sdf.filename))
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+		npy_path, key_path = self.paths(name)
+		# Drop any old key first so that an interrupted write is never mistaken for current
+		if os.path.isfile(key_path):
+			os.remove(key_path)
+		self._maps.pop(name, None)
+		out = np.lib.format.open_memmap(npy_path, mode="w+", dtype=np.float64,
+			shape=(self.sdf.n_rows,))
+		rows = chunk_rows(self.budget, 8 * (len(inputs) + 2) + self.sdf.row_bytes())
+		for start, stop in row_chunks(self.sdf.n_rows, rows):
+			values = dict((field, self.sdf.read(field, start, stop).astype(np.float64))
+				for field in inputs)
+			out[start:stop] = function(values)
+		out.flush()
+		del out
+		with open(key_path, 'w') as key_file:
+			key_file.write(self.key(name) + '\n')
+	# Return rows start to stop of a derived column as an ordinary array
+	def read(self, name, start=0, stop=None):
+		return np.array(self.get(name)[start:stop])
+	# Remove every cached column, e.g., to reclaim disk space
+	def clear(self):
+		self._maps = {}
+		if os.path.isdir(self.directory):
+			for filename in os.listdir(self.directory):
+				os.remove(os.path.join(self.directory, filename))
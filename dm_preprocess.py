@@ -6,8 +6,9 @@
 # Sneak in extraction for the unburned yields using unburned as well
 # On a related note, also extract the list of particle IDs DM processed by Burnf
 # Finish by submitting those scripts to the saguaro cluster for execution
+# Importing this file has no side effects, so pipeline.preprocess can run the same stages
 
-# Last modified 1 Aug 2020 by Greg Vance
+# Last modified 19 Oct 2026 by Greg Vance
 
 # Usage example:
 #	./dm_preprocess.py sn_data/jet3b
@@ -17,6 +18,7 @@ import sys
 import os
 
 import sn_utils as sn
+import telemetry
 
 # User's home directory
 HOME_DIR = os.path.expanduser("~")
@@ -32,27 +34,43 @@ CCO2UNBURN_PATH = os.path.join(HOME_DIR, "data_mining/cco2-unburned")
 # Full path to the compiled HDF5 file particle ID lister
 HDF5PID_PATH = os.path.join(HOME_DIR, "data_mining/hdf5_pid_list")
 
-# Main program for DM preprocessing (called at end of this file)
-def main():
+# Main program for DM preprocessing (called when this file is run as a script)
+def main(argv=None):
+	if argv is None:
+		argv = sys.argv
 	# This script takes exactly one argument (the head directory for the simulation data)
-	if len(sys.argv) != 2:
+	if len(argv) != 2:
 		# You did it wrong, try that again
-		print "Usage: %s simulation_directory" % (sys.argv[0])
+		print "Usage: %s simulation_directory" % (argv[0])
 		sys.exit(1)
 	# Get all the preliminary info like directories and which isotopes to query
-	paths, isotopes = sn.get_paths(sys.argv[1]), sn.get_list(sn.ISOTOPES_FILE)
+	paths, isotopes = sn.get_paths(argv[1]), sn.get_list(sn.ISOTOPES_FILE)
+	# Write all of the scripts and ask the user before submitting each kind
+	telemetry.start_run("dm_preprocess")
+	preprocess(paths, isotopes)
+	telemetry.end_run()
+
+# Run all of the DM preprocessing stages for a simulation
+# The submit argument is None to ask the user about each kind of script, or True/False to
+# submit every script or none of them without asking
+def preprocess(paths, isotopes, submit=None):
 	# Make any directories that need to be made before DM processing begins
 	paths = sn.make_dirs(paths, sn.PRE_DIRECTORIES)
 	# Generate sbatch scripts for each isotope query and place them in the right spot
-	write_burn_query_scripts(paths, isotopes)
+	with telemetry.stage("write_burn_query_scripts"):
+		write_burn_query_scripts(paths, isotopes)
 	# Determine which SDF files to DM process based on tpos values, make sbatch scripts for them too
-	write_entropy_scripts(paths)
+	with telemetry.stage("write_entropy_scripts"):
+		write_entropy_scripts(paths)
 	# Write an sbatch script for listing the particle IDs that were DM processed by Burnf
-	write_pid_script(paths)
+	with telemetry.stage("write_pid_script"):
+		write_pid_script(paths)
 	# Submit all of the sbatch scripts to the saguaro cluster via slurm
-	sbatch_submit(paths)
+	with telemetry.stage("sbatch_submit"):
+		sbatch_submit(paths, submit)
 	# Print that the script has completed
 	print "\nAll done!"
+	return paths
 
 # Write all of the needed sbatch scripts for running burn_query
 def write_burn_query_scripts(paths, isotopes):
@@ -158,46 +176,47 @@ def write_pid_script(paths):
 	sn.write_script(scriptfile, command, stdout, stderr, walltime)
 
 # Submit all of the written sbatch scripts to the cluster for execution
-def sbatch_submit(paths):
+# Unless submit is True or False, the user is asked before each kind of script is submitted
+def sbatch_submit(paths, submit=None):
 	# Print a progress indicator at this point
 	print "\nPreparing to submit sbatch scripts to the cluster"
 	# Determine whether to submit burn_query scripts to the cluster
 	if "hdf5" in paths:
 		# Do not use supercomputer time without the user's consent
-		burn_query = sn.ask_user("Proceed with submitting burn_query scripts?")
+		burn_query = (sn.ask_user("Proceed with submitting burn_query scripts?") if submit is None else submit)
 	else:
 		# No scripts, so nothing to submit
 		burn_query = False
 	# Determine whether to submit entropy scripts to the cluster
 	if "sdf" in paths:
 		# Do not use supercomputer time without the user's consent
-		entropy = sn.ask_user("Proceed with submitting entropy scripts?")
+		entropy = (sn.ask_user("Proceed with submitting entropy scripts?") if submit is None else submit)
 	else:
 		# No scripts, so nothing to submit
 		entropy = False
 	# Determine whether to submit the PID listing script to the cluster
 	if "hdf5" in paths and "sdf" in paths:
 		# Do not use supercomputer time without the user's consent
-		hdf5_pid_list = sn.ask_user("Proceed with submitting hdf5_pid_list script?")
+		hdf5_pid_list = (sn.ask_user("Proceed with submitting hdf5_pid_list script?") if submit is None else submit)
 	else:
 		# No script to submit
 		hdf5_pid_list = False
 	# Submit each authorized sbatch script to the cluster, they are all of the .sh files
 	for script in [f for f in os.listdir(paths["sbatch"]) if sn.get_ext(f) == "sh"]:
 		# Should this script be submitted to the cluster?
-		submit = False
+		approved = False
 		# Determine which type of script is being considered
 		if script[:3] == "ISO":
 			# This is a burn_query script
-			submit = burn_query
+			approved = burn_query
 		elif script[:3] == "SDF":
 			# This is an entropy script
-			submit = entropy
+			approved = entropy
 		elif script[:3] == "PID":
 			# This is the hdf5_pid_list script
-			submit = hdf5_pid_list
+			approved = hdf5_pid_list
 		# If approved, proceed with submitting the script to the cluster
-		if submit:
+		if approved:
 			# Put together the script's full path
 			scriptpath = os.path.join(paths["sbatch"], script)
 			# Submit the file through sbatch and get sbatch's exit code
@@ -205,10 +224,14 @@ def sbatch_submit(paths):
 			# If the submission failed, stop and ask the user whether to try again
 			# This often happens if dm_preprocess.py tries to submit too many jobs at once
 			while exitcode != 0:
+				# Without a user to ask, a failed submission is an error
+				if submit is not None:
+					raise OSError("sbatch failed to submit %s (exit code %d)" % (scriptpath, exitcode))
 				# Let the user diagnose the sbatch output and choose whether to retry
 				if sn.ask_user("Submission failure was detected. Try again?"):
 					# Try it again and continue the while loop if it fails again
 					exitcode = sn.sbatch(scriptpath)
 
-main()
+if __name__ == "__main__":
+	main()
 
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+# One-pass histograms of mass fraction per species, for tuning FMASS_CUT and ISOTOPES_LOW
+# Every particle's fmass values go into log-spaced bins (BINS_PER_DECADE per decade down to
+# 10**LOG_MIN, with zeros and anything smaller in the lowest bin), both as particle counts and
+# weighted by the mass of the species in the particle
+# From the histograms, any candidate cut at a bin edge gives, for each isotope, how many rows a
+# burn_query at that cut would emit and what fraction of the isotope's total mass they capture
+# So choosing cuts takes one scan of the HDF5 files instead of a round of burn_query jobs
+# Histograms from different files (or scans) merge by adding them up
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	./fmass_histogram.py -s jet3b_fmass.npz jet3b/hdf5/*.h5
+#	./fmass_histogram.py -l jet3b_fmass.npz -i 26Al,44Ti,60Fe -c 6,8,10,12
+# To histogram every species once and then see what a range of cuts would do for three isotopes
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+import sn_utils as sn
+import telemetry
+from se_data import SEFile, file_bytes
+
+# Number of log bins per decade of mass fraction, so that every decade is a bin edge
+BINS_PER_DECADE = 10
+# Lowest decade with its own bins; smaller mass fractions (and zeros) share the lowest bin
+LOG_MIN = -30
+# Candidate cuts shown by default, as burn_query style exponents (6 means 1e-6)
+DEFAULT_CUTS = (4, 6, 8, 10, 12, 14)
+# Fraction of an isotope's mass that its cut should capture in the ISOTOPES_LOW suggestions
+DEFAULT_CAPTURE = 0.99
+
+
+# HISTOGRAMS
+
+# Counts and mass-weighted histograms of the mass fractions of every species in a network
+class FmassHistogram:
+	# Start empty histograms for a network
+	def __init__(self, nz, nn, counts=None, mass=None):
+		self.nz = np.asarray(nz, dtype=np.int64)
+		self.nn = np.asarray(nn, dtype=np.int64)
+		self.isotopes = [sn.iso_name(n, z) for z, n in zip(self.nz, self.nn)]
+		# Bin 0 holds everything below 10**LOG_MIN; bin b > 0 starts at 10**(LOG_MIN + (b-1)/BPD)
+		self.n_bins = -LOG_MIN * BINS_PER_DECADE + 1
+		shape = (len(self.nz), self.n_bins)
+		self.counts = (np.zeros(shape, dtype=np.int64) if counts is None else counts)
+		self.mass = (np.zeros(shape) if mass is None else mass)
+		self.particles = 0
+	# Add a block of particle masses and their (particles, species) fmass array
+	def add(self, mass, fmass):
+		with np.errstate(divide='ignore'):
+			logs = np.log10(fmass)
+		bins = np.floor((logs - LOG_MIN) * BINS_PER_DECADE + 1e-9).astype(np.int64) + 1
+		bins = np.clip(np.where(np.isfinite(logs), bins, 0), 0, self.n_bins - 1)
+		# One bincount covers every species at once through flat (species, bin) indices
+		flat = (bins + self.n_bins * np.arange(fmass.shape[1])).ravel()
+		size = self.counts.size
+		self.counts += np.bincount(flat, minlength=size).reshape(self.counts.shape)
+		weights = (fmass * mass[:, np.newaxis]).ravel()
+		self.mass += np.bincount(flat, weights=weights, minlength=size).reshape(self.mass.shape)
+		self.particles += len(mass)
+	# Add another histogram of the same network into this one
+	def merge(self, other):
+		if not (np.array_equal(self.nz, other.nz) and np.array_equal(self.nn, other.nn)):
+			raise ValueError("cannot merge fmass histograms of different networks")
+		self.counts += other.counts
+		self.mass += other.mass
+		self.particles += other.particles
+		return self
+	# Return the bin that a cut at a mass fraction of 10**-exponent starts
+	def cut_bin(self, exponent):
+		return max(int(round((-float(exponent) - LOG_MIN) * BINS_PER_DECADE)) + 1, 0)
+	# Return the rows a query at a cut would emit and the fraction of mass they would capture,
+	# as arrays over every species in the network
+	def at_cut(self, exponent):
+		b = self.cut_bin(exponent)
+		rows = self.counts[:, b:].sum(axis=1)
+		total = self.mass.sum(axis=1)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			captured = np.where(total > 0.0, self.mass[:, b:].sum(axis=1) / total, 1.0)
+		return rows, captured
+	# Return the index of an isotope in the network
+	def index(self, isotope):
+		nn, nz = sn.nn_nz(isotope)
+		return self.isotopes.index(sn.iso_name(nn, nz))
+	# Save the histograms in a .npz file
+	def save(self, filename):
+		np.savez(filename, nz=self.nz, nn=self.nn, counts=self.counts, mass=self.mass,
+			particles=self.particles, bins_per_decade=BINS_PER_DECADE, log_min=LOG_MIN)
+	# Load histograms saved in a .npz file
+	@classmethod
+	def load(cls, filename):
+		data = np.load(filename)
+		if int(data["bins_per_decade"]) != BINS_PER_DECADE or int(data["log_min"]) != LOG_MIN:
+			raise ValueError("%s was binned differently than this version expects" % (filename))
+		histogram = cls(data["nz"], data["nn"], data["counts"], data["mass"])
+		histogram.particles = int(data["particles"])
+		return histogram
+
+# Histogram every particle in a list of SE HDF5 files in one pass
+def scan(hdf5_files, budget=None):
+	histogram = None
+	for filename in sorted(hdf5_files):
+		telemetry.count(bytes_read=file_bytes(filename))
+		with SEFile(filename) as se:
+			part = FmassHistogram(se.nz, se.nn)
+			for pids, mass, fmass in se.blocks(budget):
+				telemetry.count(particles=len(pids))
+				part.add(mass, fmass)
+		histogram = (part if histogram is None else histogram.merge(part))
+	return histogram
+
+
+# REPORTS
+
+# Return the cut that an isotope is queried at now, as an exponent
+def current_cut(isotope):
+	return int(sn.FMASS_CUT_LOW if isotope in sn.ISOTOPES_LOW else sn.FMASS_CUT)
+
+# Return a text table of rows emitted and mass captured at each cut for some isotopes
+def report(histogram, isotopes=None, cuts=DEFAULT_CUTS):
+	if isotopes is None:
+		isotopes = histogram.isotopes
+	at = [histogram.at_cut(cut) for cut in cuts]
+	lines = ["%d particles; rows emitted (fraction of mass captured) at each cut" %
+		(histogram.particles)]
+	lines.append("%-8s %5s " % ("isotope", "now") +
+		" ".join("%18s" % ("1e-%d" % (cut)) for cut in cuts))
+	for isotope in isotopes:
+		k = histogram.index(isotope)
+		cells = ["%9d (%6.4f)" % (rows[k], captured[k]) for rows, captured in at]
+		lines.append("%-8s %5s " % (isotope, "1e-%d" % (current_cut(isotope))) + " ".join(cells))
+	# Total rows that the whole set of queries would emit with each single cut for all of them
+	lines.append("%-8s %5s " % ("total", "") +
+		" ".join("%18d" % (sum(rows[histogram.index(i)] for i in isotopes)) for rows, c in at))
+	return '\n'.join(lines) + '\n'
+
+# Return the isotopes whose FMASS_CUT would capture less than the given fraction of their mass
+# while FMASS_CUT_LOW would capture it, i.e., the suggested contents of ISOTOPES_LOW
+def suggest_low(histogram, isotopes=None, capture=DEFAULT_CAPTURE):
+	if isotopes is None:
+		isotopes = histogram.isotopes
+	rows, high = histogram.at_cut(sn.FMASS_CUT)
+	rows, low = histogram.at_cut(sn.FMASS_CUT_LOW)
+	return [i for i in isotopes if high[histogram.index(i)] < capture and
+		low[histogram.index(i)] >= capture]
+
+# Main program: scan HDF5 files (or load a saved scan) and report on candidate cuts
+def main():
+	parser = argparse.ArgumentParser()
+	# Save the histograms of the scan to this .npz file
+	parser.add_argument('-s', '--save', default=None)
+	# Load histograms saved earlier instead of scanning
+	parser.add_argument('-l', '--load', default=None)
+	# Isotopes to report on (default is every isotope in isotopes.txt)
+	parser.add_argument('-i', '--isotopes', default=None)
+	# Candidate cuts as burn_query style exponents, e.g., 6,8,12
+	parser.add_argument('-c', '--cuts', default=",".join(str(c) for c in DEFAULT_CUTS))
+	# Fraction of mass that a cut should capture for the ISOTOPES_LOW suggestions
+	parser.add_argument('--capture', type=float, default=DEFAULT_CAPTURE)
+	# Memory budget for the particle blocks, e.g., 2G
+	parser.add_argument('-b', '--budget', default=None)
+	# The set of HDF5 file(s) to scan
+	parser.add_argument('hdf5', nargs='*')
+	args = parser.parse_args()
+	if args.load is not None:
+		histogram = FmassHistogram.load(args.load)
+	elif len(args.hdf5) > 0:
+		telemetry.start_run("fmass_histogram")
+		with telemetry.stage("fmass_histogram"):
+			histogram = scan(args.hdf5, args.budget)
+		telemetry.end_run()
+	else:
+		parser.error("give HDF5 files to scan or a saved scan to load")
+	if args.save is not None:
+		histogram.save(args.save)
+	if args.isotopes is not None:
+		isotopes = args.isotopes.split(",")
+	elif os.path.isfile(sn.ISOTOPES_FILE):
+		isotopes = [i for i in sn.get_list(sn.ISOTOPES_FILE) if i in histogram.isotopes]
+	else:
+		isotopes = histogram.isotopes
+	sys.stdout.write(report(histogram, isotopes, [int(c) for c in args.cuts.split(",")]))
+	print "\nSuggested ISOTOPES_LOW (1e-%s keeps %.2f%% of mass where 1e-%s does not):" % \
+		(sn.FMASS_CUT_LOW, 100.0 * args.capture, sn.FMASS_CUT)
+	print ", ".join(suggest_low(histogram, isotopes, args.capture))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+# Incremental total yields from per-file partials of the SE HDF5 data
+# Every HDF5 file's species mass totals and sorted particle ID run are saved in a partials
+# directory under the file's fingerprint (name, size, and modification time), so when Burn
+# reprocesses some particles and replaces a file or two, only the new or changed files are
+# scanned again and the simulation totals are just the sum of the saved partials
+# The totals are written as the "_yields.out" file and the IDs as the "_pids.out" list, and the
+# unburned yields are added on with pipeline.update_yields as usual
+# Files are only rewritten when their contents change, so stage cache keys downstream stay valid
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	./incremental_yields.py -w 8 sn_data/jet3b
+# To bring the jet3b total yields up to date with its HDF5 files, rescanning only what changed
+
+import os
+import glob
+import json
+import hashlib
+import argparse
+
+import numpy as np
+
+import sn_utils as sn
+import telemetry
+import pipeline
+from stage_cache import file_record
+from parallel_scan import ScanPartial, scan_files, merge_partials, write_pid_list, \
+	DEFAULT_WORKERS
+
+# Name of the partials directory inside a simulation head directory, if none is given
+PARTIALS_DIR = "yield_partials"
+
+
+# PARTIALS
+
+# Directory of saved single-file partials, each stored under its file's fingerprint
+class PartialStore:
+	def __init__(self, directory):
+		self.directory = os.path.abspath(directory)
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+	# Return the fingerprint key of an HDF5 file
+	def key(self, filename):
+		record = file_record(filename)
+		text = json.dumps([record["name"], record["size"], record["mtime"]])
+		return hashlib.sha1(text.encode("utf-8")).hexdigest()
+	# Return the path to the saved partial of a file (whether or not it exists)
+	def path(self, filename):
+		return os.path.join(self.directory, self.key(filename) + ".npz")
+	# Return the saved partial of a file, or None if the file is new or has changed
+	def load(self, filename):
+		path = self.path(filename)
+		if not os.path.isfile(path):
+			return None
+		data = np.load(path)
+		partial = ScanPartial(data["nz"], data["nn"])
+		partial.files.append(os.path.basename(filename))
+		partial.runs.append(data["pids"])
+		partial.totals = data["totals"]
+		partial.particles = len(data["pids"])
+		return partial
+	# Save the partial of a single file
+	def save(self, filename, partial):
+		path = self.path(filename)
+		temp = "%s.tmp%d.npz" % (path[:-len(".npz")], os.getpid())
+		np.savez(temp, nz=partial.nz, nn=partial.nn, totals=partial.totals,
+			pids=partial.runs[0], name=os.path.basename(filename))
+		os.rename(temp, path)
+	# Remove every saved partial that does not belong to one of the given files
+	def prune(self, filenames):
+		keep = set(self.key(filename) + ".npz" for filename in filenames)
+		for name in os.listdir(self.directory):
+			if name.endswith(".npz") and name not in keep:
+				os.remove(os.path.join(self.directory, name))
+
+# Return the merged partial of a list of HDF5 files, scanning only those without saved partials
+# Also returns the list of files that had to be scanned
+def scan_changed(hdf5_files, directory, workers=DEFAULT_WORKERS, budget=None):
+	hdf5_files = sorted(hdf5_files)
+	if len(hdf5_files) == 0:
+		raise ValueError("no HDF5 files to scan")
+	store = PartialStore(directory)
+	partials = [store.load(filename) for filename in hdf5_files]
+	changed = [f for f, partial in zip(hdf5_files, partials) if partial is None]
+	print "Reusing %d saved partials, scanning %d new or changed HDF5 files" % (
+		len(hdf5_files) - len(changed), len(changed))
+	scanned = scan_files(changed, workers=workers, budget=budget)
+	for filename, partial in zip(changed, scanned):
+		store.save(filename, partial)
+		partials[hdf5_files.index(filename)] = partial
+	store.prune(hdf5_files)
+	merged = merge_partials(partials)
+	telemetry.count(particles=sum(p.particles for p in scanned))
+	return merged, changed
+
+
+# TOTAL YIELDS
+
+# Write a file through a writer function only if its contents would change
+def write_if_changed(filename, writer):
+	temp = "%s.tmp%d" % (filename, os.getpid())
+	writer(temp)
+	if os.path.isfile(filename):
+		with open(filename, 'rb') as old, open(temp, 'rb') as new:
+			if old.read() == new.read():
+				os.remove(temp)
+				return False
+	os.rename(temp, filename)
+	return True
+
+# Bring the total yields and particle ID list of a simulation up to date with its HDF5 files,
+# then add on the unburned yields, returning the updated (nn, nz, grams, percent) tuples
+# The cache argument is anything pipeline.open_cache accepts
+def total_yields(paths, directory=None, workers=DEFAULT_WORKERS, budget=None, cache=None):
+	if "hdf5" not in paths:
+		raise IOError("simulation %s has no hdf5 directory" % (paths["head"]))
+	if directory is None:
+		directory = os.path.join(paths["head"], PARTIALS_DIR)
+	paths = sn.make_dirs(paths, ["analysis"])
+	with telemetry.stage("yield_partials") as record:
+		merged, changed = scan_changed(glob.glob(os.path.join(paths["hdf5"], "*.h5")),
+			directory, workers, budget)
+		record["rescanned"] = len(changed)
+	yields_path = pipeline.analysis_file(paths, pipeline.YIELDS_END)
+	pids_path = os.path.join(paths["hdf5"], pipeline.sim_name(paths) + "_pids.out")
+	write_if_changed(yields_path, lambda name : pipeline.write_yields(merged.yields(), name))
+	write_if_changed(pids_path, lambda name : write_pid_list(name, merged.pids()))
+	if "sdf" not in paths:
+		return merged.yields()
+	unburned = glob.glob(os.path.join(paths["sdf"], "*.unburned.out"))
+	if len(unburned) > 1:
+		raise IOError("matched %d .unburned.out files" % (len(unburned)))
+	final_sdf = os.path.join(paths["sdf"], sn.sdf_list(paths, mode="last"))
+	return pipeline.update_yields(yields_path, pids_path, (unburned[0] if unburned else None),
+		final_sdf, budget=budget, cache=pipeline.open_cache(paths, cache))
+
+# Main program: update the yields of the simulation given on the command line
+def main():
+	parser = argparse.ArgumentParser()
+	# Number of worker processes for the files that need scanning
+	parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS)
+	# Memory budget per worker for the particle blocks, e.g., 1G
+	parser.add_argument('-b', '--budget', default=None)
+	# Directory of saved partials (default is yield_partials in the simulation directory)
+	parser.add_argument('-p', '--partials', default=None)
+	# The simulation head directory
+	parser.add_argument('head')
+	args = parser.parse_args()
+	paths = pipeline.find_paths(args.head)
+	telemetry.start_run("incremental_yields")
+	total_yields(paths, args.partials, args.workers, args.budget)
+	telemetry.end_run()
+
+if __name__ == "__main__":
+	main()
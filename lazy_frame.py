@@ -0,0 +1,477 @@
+# Lazy dataframe-style API over the SDF timesteps of one simulation
+# Indexing, filtering, reducing, and joining only build up a graph of expressions
+# Nothing is read until compute is called, at which point every request on the same timestep
+# (or the same stack of early timesteps) is answered from one fused, chunked pass over the
+# memory-mapped files, so several reductions share a single read
+# Column names can be any SDF field or any derived column from the derived.py registry
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	sim = Simulation("sn_data/jet3b")
+#	early = sim.early()
+#	peak_rho, rho_at_peak_temp = compute(early.max("rho"), early.at_max("Temp", "rho"))
+#	final = sim.timestep(-1).join(peak_rho, "peak rho")
+#	hot = final[final["temp"] > 1e9][["x", "rho", "peak rho"]].collect()
+# To find the peak densities over the early timesteps, then the final state of hot particles
+
+import os
+import operator
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+import sn_utils as sn
+from sdf_reader import SDFFile
+from derived import DERIVED_FIELDS
+from chunking import chunk_rows, row_chunks
+from reducers import gather_rows
+from alignment import AlignmentIndex, INDEX_DIR
+
+# Other names accepted for SDF fields, e.g., the column headings of the entropy output files
+ALIASES = {"id": "ident", "ID": "ident", "Temp": "temp", "Rho": "rho", "Ye": "Y_el",
+	"Y_e": "Y_el", "U": "u", "U_dot": "udot"}
+
+
+# EXPRESSIONS
+
+# Base class for lazily evaluated expressions over the columns of one timestep
+# Arithmetic and comparisons between expressions (or with numbers) make new expressions
+class Expr(object):
+	# Return the set of column names the expression needs
+	def columns(self):
+		raise NotImplementedError
+	# Evaluate the expression given a function that returns the values of a named column
+	def evaluate(self, get):
+		raise NotImplementedError
+	def _binary(self, other, op):
+		return BinaryOp(op, self, other)
+	def _reflected(self, other, op):
+		return BinaryOp(op, other, self)
+	def __add__(self, other): return self._binary(other, operator.add)
+	def __sub__(self, other): return self._binary(other, operator.sub)
+	def __mul__(self, other): return self._binary(other, operator.mul)
+	def __div__(self, other): return self._binary(other, operator.truediv)
+	def __truediv__(self, other): return self._binary(other, operator.truediv)
+	def __pow__(self, other): return self._binary(other, operator.pow)
+	def __radd__(self, other): return self._reflected(other, operator.add)
+	def __rsub__(self, other): return self._reflected(other, operator.sub)
+	def __rmul__(self, other): return self._reflected(other, operator.mul)
+	def __rdiv__(self, other): return self._reflected(other, operator.truediv)
+	def __rtruediv__(self, other): return self._reflected(other, operator.truediv)
+	def __lt__(self, other): return self._binary(other, operator.lt)
+	def __le__(self, other): return self._binary(other, operator.le)
+	def __gt__(self, other): return self._binary(other, operator.gt)
+	def __ge__(self, other): return self._binary(other, operator.ge)
+	def __eq__(self, other): return self._binary(other, operator.eq)
+	def __ne__(self, other): return self._binary(other, operator.ne)
+	def __and__(self, other): return self._binary(other, operator.and_)
+	def __or__(self, other): return self._binary(other, operator.or_)
+	def __invert__(self): return UnaryOp(np.logical_not, self)
+	def __neg__(self): return UnaryOp(operator.neg, self)
+	def __abs__(self): return UnaryOp(np.abs, self)
+	# Expressions compare with == to build masks, so they cannot be hashed by value
+	__hash__ = object.__hash__
+
+# A named column
+class Col(Expr):
+	def __init__(self, name):
+		self.name = name
+	def columns(self):
+		return set([self.name])
+	def evaluate(self, get):
+		return get(self.name)
+
+# An operator applied to two expressions (or an expression and a number)
+class BinaryOp(Expr):
+	def __init__(self, op, left, right):
+		self.op, self.left, self.right = op, left, right
+	def columns(self):
+		return _columns_of(self.left) | _columns_of(self.right)
+	def evaluate(self, get):
+		return self.op(_evaluate(self.left, get), _evaluate(self.right, get))
+
+# A function applied to one expression, e.g., np.log10
+class UnaryOp(Expr):
+	def __init__(self, function, operand):
+		self.function, self.operand = function, operand
+	def columns(self):
+		return _columns_of(self.operand)
+	def evaluate(self, get):
+		return self.function(_evaluate(self.operand, get))
+
+# Apply a NumPy function to an expression lazily, e.g., apply(np.log10, frame["rho"])
+def apply(function, expr):
+	return UnaryOp(function, _as_expr(expr))
+
+# Turn a column name into a column expression, leaving expressions alone
+def _as_expr(item):
+	return (Col(item) if isinstance(item, basestring) else item)
+
+# Column names needed by an expression or constant
+def _columns_of(item):
+	return (item.columns() if isinstance(item, Expr) else set())
+
+# Value of an expression or constant
+def _evaluate(item, get):
+	return (item.evaluate(get) if isinstance(item, Expr) else item)
+
+
+# COLUMN ACCESS
+
+# Return a function that reads named columns of rows start to stop of an SDF file
+# Every column is read (or derived) once and then remembered, so requests share the read
+# Joined per-particle results are looked up through the chunk's particle IDs
+def _chunk_getter(sdf, start, stop, joins):
+	cache = {}
+	def get(name):
+		if name in cache:
+			return cache[name]
+		if name in joins:
+			values = joins[name].lookup(get("ident"))
+		else:
+			values = _field_values(sdf, name, lambda field : get(field),
+				lambda field : sdf.read(field, start, stop))
+		cache[name] = values
+		return values
+	return get
+
+# Return the values of a field, alias, or derived column, given functions to get other columns
+# (through any cache) and to read raw SDF fields
+def _field_values(sdf, name, get, read):
+	name = ALIASES.get(name, name)
+	if sdf.has_column(name):
+		return read(name).astype(np.int64 if name == "ident" else np.float64)
+	if name in DERIVED_FIELDS:
+		inputs, function = DERIVED_FIELDS[name]
+		return function(dict((field, get(field)) for field in inputs))
+	raise KeyError("no column %s in SDF file %s" % (repr(name), sdf.filename))
+
+# Return the raw SDF fields needed to produce a set of column names
+def _fields_needed(sdf, names, joins=None):
+	fields = set()
+	for name in names:
+		if joins and name in joins:
+			fields.add("ident")
+			continue
+		name = ALIASES.get(name, name)
+		if sdf.has_column(name):
+			fields.add(name)
+		elif name in DERIVED_FIELDS:
+			fields |= set(DERIVED_FIELDS[name][0])
+		else:
+			raise KeyError("no column %s in SDF file %s" % (repr(name), sdf.filename))
+	return fields
+
+
+# SINGLE TIMESTEP FRAMES
+
+# Lazy view of one timestep: optional column selection, row filters, and joined results
+class Frame(object):
+	def __init__(self, sdf, names=None, where=None, joins=None):
+		self.sdf = sdf
+		self.names = names
+		self.where = where
+		self.joins = (joins if joins is not None else {})
+	# frame["temp"] gives a column expression, frame[["x", "rho"]] selects columns,
+	# and frame[expression] keeps only the rows where the expression is true
+	def __getitem__(self, key):
+		if isinstance(key, basestring):
+			return Col(key)
+		if isinstance(key, Expr):
+			return self.filter(key)
+		return Frame(self.sdf, list(key), self.where, self.joins)
+	# Keep only the rows where an expression is true (combined with any earlier filters)
+	def filter(self, expr):
+		where = (expr if self.where is None else (self.where & expr))
+		return Frame(self.sdf, self.names, where, self.joins)
+	# Attach a per-particle result (e.g., from a Stack reduction) as a new column, by particle ID
+	# Particles missing from the result get NaN
+	def join(self, result, name):
+		joins = dict(self.joins)
+		joins[name] = result
+		return Frame(self.sdf, self.names, self.where, joins)
+	# Lazy reductions over the selected rows
+	def max(self, expr):
+		return Reduction(self, "max", _as_expr(expr))
+	def min(self, expr):
+		return Reduction(self, "min", _as_expr(expr))
+	def sum(self, expr):
+		return Reduction(self, "sum", _as_expr(expr))
+	def mean(self, expr):
+		return Reduction(self, "mean", _as_expr(expr))
+	def count(self):
+		return Reduction(self, "count", None)
+	# Return the selected columns of the selected rows as a dict of arrays
+	def collect(self, budget=None, threads=None):
+		return compute(self, budget=budget, threads=threads)[0]
+	# Column names needed to produce this frame's output, besides any reductions
+	def _needed(self):
+		names = set(self.names if self.names is not None else self.sdf.names)
+		return names | _columns_of(self.where)
+	# Return the row mask of a chunk (None means every row)
+	def _mask(self, get):
+		return (None if self.where is None else np.asarray(self.where.evaluate(get), dtype=bool))
+
+# A lazily computed scalar reduction over the rows of a frame
+class Reduction(object):
+	def __init__(self, frame, kind, expr):
+		self.frame, self.kind, self.expr = frame, kind, expr
+	def compute(self, budget=None, threads=None):
+		return compute(self, budget=budget, threads=threads)[0]
+	# Return the partial result for one chunk: (count, sum, min, max)
+	def _partial(self, get):
+		mask = self.frame._mask(get)
+		if self.expr is None:
+			values = np.zeros(len(get("ident")))
+		else:
+			values = np.asarray(self.expr.evaluate(get), dtype=np.float64)
+		if mask is not None:
+			values = values[mask]
+		if len(values) == 0:
+			return (0, 0.0, np.inf, -np.inf)
+		return (len(values), values.sum(), values.min(), values.max())
+	# Combine the partial results of all the chunks into the final value
+	def _combine(self, partials):
+		count = sum(p[0] for p in partials)
+		if self.kind == "count":
+			return count
+		if count == 0:
+			return np.nan
+		if self.kind == "sum":
+			return sum(p[1] for p in partials)
+		if self.kind == "mean":
+			return sum(p[1] for p in partials) / count
+		if self.kind == "min":
+			return min(p[2] for p in partials)
+		return max(p[3] for p in partials)
+
+# Run every frame request on one SDF file in a single chunked pass, in parallel over chunks
+def _run_frames(sdf, requests, budget, threads):
+	joins = {}
+	names = set()
+	for request in requests:
+		frame = (request if isinstance(request, Frame) else request.frame)
+		joins.update(frame.joins)
+		names |= frame._needed()
+		if isinstance(request, Reduction):
+			names |= _columns_of(request.expr) | set(["ident"])
+	fields = _fields_needed(sdf, names, joins)
+	rows = chunk_rows(budget, sdf.row_bytes() + 8 * (len(fields) + len(names)))
+	chunks = list(row_chunks(sdf.n_rows, rows))
+	# Every chunk answers every request from the same cached reads
+	def run_chunk(chunk):
+		get = _chunk_getter(sdf, chunk[0], chunk[1], joins)
+		answers = []
+		for request in requests:
+			if isinstance(request, Reduction):
+				answers.append(request._partial(get))
+			else:
+				mask = request._mask(get)
+				names = (request.names if request.names is not None else sdf.names)
+				answers.append(dict((name, (get(name) if mask is None else get(name)[mask]))
+					for name in names))
+		return answers
+	pool = ThreadPool(max(1, min(threads, len(chunks))))
+	try:
+		results = pool.map(run_chunk, chunks)
+	finally:
+		pool.close()
+		pool.join()
+	# Put the chunks back together for each request
+	outputs = []
+	for i, request in enumerate(requests):
+		if isinstance(request, Reduction):
+			outputs.append(request._combine([result[i] for result in results]))
+		else:
+			parts = [result[i] for result in results]
+			names = (request.names if request.names is not None else sdf.names)
+			outputs.append(dict((name, np.concatenate([part[name] for part in parts]))
+				for name in names))
+	return outputs
+
+
+# MULTIPLE TIMESTEP STACKS
+
+# Lazy view of several timesteps of the same particles, aligned by particle ID
+# Reductions over a stack are per particle, across the timesteps it is present in
+class Stack(object):
+	def __init__(self, filenames, alignment):
+		self.filenames = filenames
+		self.sdfs = [SDFFile(filename) for filename in filenames]
+		self.alignment = alignment
+	# Lazy per-particle reductions across the timesteps
+	def max(self, expr):
+		return PerParticle(self, "max", _as_expr(expr))
+	def min(self, expr):
+		return PerParticle(self, "min", _as_expr(expr))
+	def sum(self, expr):
+		return PerParticle(self, "sum", _as_expr(expr))
+	def mean(self, expr):
+		return PerParticle(self, "mean", _as_expr(expr))
+	def count(self):
+		return PerParticle(self, "count", Col("ident"))
+	# The value of one expression at the timestep where another one peaks, per particle
+	def at_max(self, by, expr):
+		return PerParticle(self, "at_max", _as_expr(expr), _as_expr(by))
+
+# A lazily computed per-particle result: after compute, it holds particle IDs and values
+class PerParticle(object):
+	def __init__(self, stack, kind, expr, by=None):
+		self.stack, self.kind, self.expr, self.by = stack, kind, expr, by
+		self.pids, self.values = None, None
+	def columns(self):
+		return _columns_of(self.expr) | _columns_of(self.by)
+	def compute(self, budget=None, threads=None):
+		return compute(self, budget=budget, threads=threads)[0]
+	# Look up the values for some particle IDs, NaN for any that are missing
+	def lookup(self, pids):
+		if self.values is None:
+			raise ValueError("per-particle result has not been computed yet")
+		pids = np.asarray(pids, dtype=np.int64)
+		out = np.full(len(pids), np.nan)
+		if len(self.pids) == 0:
+			return out
+		index = np.minimum(np.searchsorted(self.pids, pids), len(self.pids) - 1)
+		found = self.pids[index] == pids
+		out[found] = self.values[index[found]]
+		return out
+	# Reduce a (particles, timesteps) array of values (NaN where absent) for a block of particles
+	def _reduce(self, values, by):
+		present = ~np.isnan(values)
+		if self.kind == "count":
+			return present.sum(axis=1).astype(np.float64)
+		if self.kind == "at_max":
+			ranked = np.where(np.isnan(by), -np.inf, by)
+			picks = values[np.arange(len(values)), np.argmax(ranked, axis=1)]
+			picks[~np.any(~np.isnan(by), axis=1)] = np.nan
+			return picks
+		if self.kind == "max":
+			return np.fmax.reduce(values, axis=1)
+		if self.kind == "min":
+			return np.fmin.reduce(values, axis=1)
+		total = np.where(present, values, 0.0).sum(axis=1)
+		if self.kind == "sum":
+			return total
+		with np.errstate(invalid="ignore", divide="ignore"):
+			return total / present.sum(axis=1)
+
+# Run every per-particle request on one stack in a single pass over blocks of particle IDs
+# Each block reads every timestep once, with one thread per timestep file
+def _run_stack(stack, requests, budget, threads):
+	alignment, sdfs = stack.alignment, stack.sdfs
+	columns = alignment.columns_of(stack.filenames)
+	names = set()
+	for request in requests:
+		names |= request.columns()
+	fields = sorted(set.union(set(["ident"]), *[_fields_needed(sdf, names) for sdf in sdfs]))
+	pids = np.asarray(alignment.pids)
+	n_steps = len(sdfs)
+	outputs = [np.full(len(pids), np.nan) for request in requests]
+	bytes_per_row = sum(sdf.row_bytes() for sdf in sdfs) + 8 * n_steps * (len(fields) + 2)
+	pool = ThreadPool(max(1, min(threads, n_steps)))
+	try:
+		for start, stop in row_chunks(len(pids), chunk_rows(budget, bytes_per_row)):
+			block_rows = np.asarray(alignment.rows[start:stop])
+			# Gather the needed fields of this block of particles from one timestep
+			def read_step(step):
+				sdf = sdfs[step]
+				values, found = gather_rows(sdf, block_rows[:, columns[step]],
+					[field for field in fields if sdf.has_column(field)])
+				cache = {}
+				def get(name):
+					if name not in cache:
+						cache[name] = _field_values(sdf, name, get, lambda field : values[field])
+					return cache[name]
+				# Evaluate every expression the requests need at this timestep
+				step_values = {}
+				for request in requests:
+					for expr in (request.expr, request.by):
+						if expr is not None and id(expr) not in step_values:
+							result = np.asarray(expr.evaluate(get), dtype=np.float64)
+							step_values[id(expr)] = np.where(found, result, np.nan)
+				return step_values
+			steps = pool.map(read_step, range(n_steps))
+			# Reduce across the timesteps for every request
+			for i, request in enumerate(requests):
+				stacked = [None, None]
+				for j, expr in enumerate((request.expr, request.by)):
+					if expr is not None:
+						stacked[j] = np.column_stack([step[id(expr)] for step in steps])
+				outputs[i][start:stop] = request._reduce(stacked[0], stacked[1])
+	finally:
+		pool.close()
+		pool.join()
+	for request, output in zip(requests, outputs):
+		request.pids, request.values = pids, output
+	return [request for request in requests]
+
+
+# EXECUTION
+
+# Compute any number of lazy requests (frames, reductions, and per-particle results) together
+# Requests on the same timestep or stack share one pass; stacks are run first so that their
+# results can be joined into frames; returns the results in the order given
+def compute(*requests, **options):
+	budget = options.get("budget")
+	threads = options.get("threads")
+	if threads is None:
+		threads = multiprocessing.cpu_count()
+	results = [None] * len(requests)
+	# Per-particle results, including any that frames join in, are computed first
+	stack_requests = [r for r in requests if isinstance(r, PerParticle)]
+	for request in requests:
+		frame = (request.frame if isinstance(request, Reduction) else request)
+		if isinstance(frame, Frame):
+			stack_requests.extend(j for j in frame.joins.values() if j.values is None)
+	by_stack = {}
+	for request in stack_requests:
+		if request.values is None and request not in by_stack.get(id(request.stack), []):
+			by_stack.setdefault(id(request.stack), []).append(request)
+	for group in by_stack.values():
+		_run_stack(group[0].stack, group, budget, threads)
+	# Frame requests are grouped by their SDF file
+	by_file = {}
+	for i, request in enumerate(requests):
+		if isinstance(request, PerParticle):
+			results[i] = request
+			continue
+		frame = (request.frame if isinstance(request, Reduction) else request)
+		by_file.setdefault(os.path.abspath(frame.sdf.filename), []).append(i)
+	for indices in by_file.values():
+		frame = requests[indices[0]]
+		sdf = (frame.frame if isinstance(frame, Reduction) else frame).sdf
+		outputs = _run_frames(sdf, [requests[i] for i in indices], budget, threads)
+		for i, output in zip(indices, outputs):
+			results[i] = output
+	return results
+
+
+# SIMULATIONS
+
+# Entry point to the lazy API for one simulation directory
+class Simulation(object):
+	# Find the simulation's directories without asking for confirmation
+	def __init__(self, head, paths=None):
+		self.paths = (paths if paths is not None else sn.get_paths(head, confirm=False))
+		# Every SDF file in the simulation, in order of tpos
+		names = [name for name in os.listdir(self.paths["sdf"]) if sn.get_ext(name).isdigit()]
+		names.sort(key=lambda name : sn.get_tpos(os.path.join(self.paths["sdf"], name)))
+		self.files = [os.path.join(self.paths["sdf"], name) for name in names]
+		self._stacks = {}
+	# Return a lazy frame over one timestep, indexed in order of tpos (so -1 is the last one)
+	def timestep(self, index):
+		return Frame(SDFFile(self.files[index]))
+	# Return a lazy stack of the early timesteps used to find peak temperatures
+	def early(self):
+		return self.stack("early")
+	# Return a lazy stack of the timesteps selected by an sn.sdf_list mode ("early" or "all")
+	def stack(self, mode):
+		if mode not in self._stacks:
+			names = sn.sdf_list(self.paths, mode=mode)
+			filenames = [os.path.join(self.paths["sdf"], name) for name in names]
+			alignment = AlignmentIndex.load_or_build(filenames,
+				os.path.join(self.paths["head"], INDEX_DIR + "." + mode))
+			self._stacks[mode] = Stack(filenames, alignment)
+		return self._stacks[mode]
@@ -0,0 +1,186 @@
+# Multi-resolution octree export of the final timestep for interactive 3D viewers
+# The octree follows the Morton keys of a spatially ordered dataset, so every node is one
+# contiguous run of rows and needs no searching or copying to build
+# Leaf nodes hold their raw particles, while every coarser node holds mass-conserving aggregates:
+# one pseudo-particle per occupied sub-cell a few levels down, carrying the summed mass and the
+# mass-weighted mean of every other column
+# Each node is written as its own compact binary chunk so a viewer can stream only the levels
+# and regions in view, and the subtrees below the top levels are built in parallel processes
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	ods = OrderedDataset.load_or_build(ParticleDataset("sn_data/jet3b/analysis/jet3b_plotting.dataset"))
+#	export_octree(ods, "jet3b_octree", ["density", "peak temp", "X_{Ni}"], processes=8)
+# To write a level-of-detail octree of the jet3b final timestep with three extra columns
+
+import os
+import json
+import multiprocessing
+
+import numpy as np
+
+from spatial_order import OrderedDataset, KEY_BITS
+from particle_data import get_values
+
+# Largest number of particles in a leaf node, which stores its particles as they are
+LEAF_SIZE = 4096
+# Number of levels below a node at which its aggregate pseudo-particles are formed
+AGGREGATE_DEPTH = 3
+# Level of the octree at which the build is split into independent subtrees
+SPLIT_LEVEL = 2
+# Columns that every node stores, ahead of any columns that are asked for
+BASE_COLUMNS = ["x", "y", "z", "mass", "h"]
+# Name of the JSON index file describing the tree
+INDEX_FILE = "octree.json"
+# File name pattern for the binary chunk of one node, from its level and Morton key prefix
+NODE_NAME = "L%02d_%016x.bin"
+
+
+# NODE CONSTRUCTION
+
+# Return the row range of each of the eight children of a node, in Morton order
+def _child_ranges(keys, level, prefix, start, stop):
+	shift = np.uint64(3 * (KEY_BITS - level - 1))
+	child_keys = (np.uint64(prefix) * np.uint64(8) + np.arange(8, dtype=np.uint64)) << shift
+	bounds = np.searchsorted(keys[start:stop], child_keys) + start
+	bounds = list(bounds) + [stop]
+	return [(bounds[c], bounds[c+1]) for c in range(8)]
+
+# Return the values of the node columns for its own raw particles, as a (columns, n) array
+def _raw_values(ods, columns, start, stop):
+	return np.array([get_values(ods, name, slice(start, stop)) for name in columns])
+
+# Return the aggregate pseudo-particles of a node, as a (columns, n) array
+# Particles are grouped by their sub-cell a few levels down; the groups are contiguous runs
+def _aggregate_values(ods, columns, level, start, stop):
+	values = _raw_values(ods, columns, start, stop)
+	mass = values[columns.index("mass")]
+	# Group the particles by the Morton key prefix of their sub-cell
+	depth = min(level + AGGREGATE_DEPTH, KEY_BITS)
+	cells = np.asarray(ods.keys[start:stop]) >> np.uint64(3 * (KEY_BITS - depth))
+	firsts = np.concatenate([[0], np.nonzero(cells[1:] != cells[:-1])[0] + 1])
+	group_mass = np.add.reduceat(mass, firsts)
+	counts = np.diff(np.append(firsts, len(mass)))
+	# Mass is summed so that every level conserves it, everything else is a mass-weighted mean
+	# (falling back to a plain mean for any massless group)
+	plain = np.add.reduceat(values, firsts, axis=1) / counts
+	with np.errstate(invalid="ignore", divide="ignore"):
+		weighted = np.add.reduceat(values * mass, firsts, axis=1) / group_mass
+	aggregates = np.where(group_mass > 0.0, weighted, plain)
+	aggregates[columns.index("mass")] = group_mass
+	# The smoothing length of an aggregate is at least the size of its sub-cell
+	size = (ods.hi - ods.lo).max() / 2.0**depth
+	aggregates[columns.index("h")] = np.maximum(aggregates[columns.index("h")], size)
+	return aggregates
+
+# Write the binary chunk of one node: float32 values, column by column, little-endian
+def _write_node(directory, level, prefix, values):
+	name = NODE_NAME % (level, prefix)
+	values.astype("<f4").tofile(os.path.join(directory, name))
+	return name
+
+# Write the chunk of one node and return its record for the index
+# Leaves store their raw particles, all other nodes store their aggregates
+def _node_record(ods, columns, directory, level, prefix, start, stop, leaf):
+	if leaf:
+		values = _raw_values(ods, columns, start, stop)
+	else:
+		values = _aggregate_values(ods, columns, level, start, stop)
+	# Describe the node for the index, including its box in the same units as the positions
+	size = (ods.hi - ods.lo) / 2.0**level
+	cell = _deinterleave(prefix, level)
+	return {"level": level, "key": prefix, "file": _write_node(directory, level, prefix, values),
+		"count": int(values.shape[1]), "particles": int(stop - start), "leaf": leaf,
+		"lo": list(ods.lo + cell * size), "hi": list(ods.lo + (cell + 1) * size),
+		"mass": float(values[columns.index("mass")].sum()), "children": []}
+
+# Return whether the node holding rows start to stop at a level is a leaf
+def _is_leaf(level, start, stop):
+	return bool(stop - start <= LEAF_SIZE or level == KEY_BITS)
+
+# Build the node at a level and key prefix and everything below it, returning the node records
+def _build_node(ods, columns, directory, level, prefix, start, stop):
+	leaf = _is_leaf(level, start, stop)
+	record = _node_record(ods, columns, directory, level, prefix, start, stop, leaf)
+	records = [record]
+	if not leaf:
+		for c, (child_start, child_stop) in enumerate(_child_ranges(ods.keys, level, prefix,
+			start, stop)):
+			if child_stop > child_start:
+				child = prefix * 8 + c
+				record["children"].append(child)
+				records.extend(_build_node(ods, columns, directory, level + 1, child,
+					child_start, child_stop))
+	return records
+
+# Recover the integer cell coordinates of a Morton key prefix at a level
+def _deinterleave(prefix, level):
+	cell = np.zeros(3)
+	for bit in xrange(level):
+		for d in range(3):
+			cell[d] += ((prefix >> (3 * bit + d)) & 1) << bit
+	return cell
+
+# Build one subtree in a worker process (arguments are packed for multiprocessing)
+def _build_subtree(args):
+	ods_directory, columns, directory, level, prefix, start, stop = args
+	return _build_node(OrderedDataset(ods_directory), columns, directory, level, prefix,
+		start, stop)
+
+
+# EXPORT
+
+# Write the octree of a spatially ordered dataset into a directory
+# The columns are stored after the base columns (positions, mass, and smoothing length)
+# and processes defaults to the number of cores
+def export_octree(ods, directory, columns=(), processes=None):
+	# Print a quick progress message for the user
+	print "\nExporting octree of %s to %s" % (ods.directory, directory)
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	columns = BASE_COLUMNS + [name for name in columns if name not in BASE_COLUMNS]
+	if "id" in columns:
+		raise ValueError("particle IDs cannot be aggregated, leave out the id column")
+	# Build the top levels here, stopping at the split level to hand out the subtrees
+	records, tasks = [], []
+	pending = [(0, 0, 0, ods.n_rows)]
+	while pending:
+		level, prefix, start, stop = pending.pop(0)
+		if level == SPLIT_LEVEL or _is_leaf(level, start, stop):
+			tasks.append((ods.directory, columns, directory, level, prefix, start, stop))
+			continue
+		record = _node_record(ods, columns, directory, level, prefix, start, stop, False)
+		records.append(record)
+		for c, (child_start, child_stop) in enumerate(_child_ranges(ods.keys, level, prefix,
+			start, stop)):
+			if child_stop > child_start:
+				record["children"].append(prefix * 8 + c)
+				pending.append((level + 1, prefix * 8 + c, child_start, child_stop))
+	# Build the subtrees in parallel, each worker opening the dataset for itself
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	if processes > 1 and len(tasks) > 1:
+		pool = multiprocessing.Pool(min(processes, len(tasks)))
+		try:
+			results = pool.map(_build_subtree, tasks)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		results = [_build_subtree(task) for task in tasks]
+	for result in results:
+		records.extend(result)
+	# Write the index that a viewer reads first
+	records.sort(key=lambda record : (record["level"], record["key"]))
+	index = {"columns": columns, "dtype": "<f4", "layout": "column-major",
+		"lo": list(ods.lo), "hi": list(ods.hi), "leaf_size": LEAF_SIZE,
+		"aggregate_depth": AGGREGATE_DEPTH, "particles": int(ods.n_rows), "nodes": records}
+	with open(os.path.join(directory, INDEX_FILE), 'w') as index_file:
+		json.dump(index, index_file, indent=1)
+	return index
+
+# Read the (columns, n) array of values stored for one node of an exported octree
+def read_node(directory, index, record):
+	values = np.fromfile(os.path.join(directory, record["file"]), dtype=index["dtype"])
+	return values.reshape(len(index["columns"]), record["count"])
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+# Parallel scan of SE HDF5 files, one file per worker process, with mergeable partial results
+# burn_query and hdf5_pid_list open their HDF5 files one after another on a single core, but the
+# files are independent, so here every file is scanned by a worker in a process pool
+# Each worker returns a partial result for its file: species mass totals, the sorted run of
+# particle IDs, the rows of any compound queries, and optionally the fmass histograms
+# Partials are merged in file name order, never in the order workers finish, so the totals and
+# rows come out the same whatever the number of workers
+# The merged result can be written out as the hdf5_pid_list ID list, the total yields file, and
+# burn_query style query outfiles
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	./parallel_scan.py -w 8 -p jet3b_pids.out -y jet3b_yields.out -e "44Ti: 44Ti" jet3b/hdf5/*.h5
+# To list the particle IDs, total the yields, and query 44Ti across every HDF5 file on 8 cores
+
+import os
+import argparse
+import multiprocessing
+
+import numpy as np
+
+import telemetry
+import pipeline
+from se_data import SEFile, file_bytes
+from compound_query import QueryScan, parse_query, read_queries, write_result
+from fmass_histogram import FmassHistogram
+
+# Default number of worker processes
+DEFAULT_WORKERS = multiprocessing.cpu_count()
+
+
+# PARTIAL RESULTS
+
+# Everything a scan found in one or more files, which merges with the scans of other files
+class ScanPartial:
+	# Start an empty partial for a network, with the queries to run and whether to histogram
+	def __init__(self, nz, nn, queries=(), histogram=False):
+		self.nz = np.asarray(nz, dtype=np.int64)
+		self.nn = np.asarray(nn, dtype=np.int64)
+		self.files = []
+		self.totals = np.zeros(len(self.nz))
+		self.runs = []
+		self.queries = QueryScan(queries)
+		self.histogram = (FmassHistogram(nz, nn) if histogram else None)
+		self.particles = 0
+	# Note the start of a new file, whose sorted particle IDs are its run
+	def start_file(self, filename, pids):
+		self.files.append(os.path.basename(filename))
+		self.runs.append(np.asarray(pids, dtype=np.int64))
+		self.queries.start_file(self.nz, self.nn)
+	# Add a block of particles from the current file
+	def add(self, pids, mass, fmass):
+		self.totals += np.dot(mass, fmass)
+		self.queries.add(pids, mass, fmass)
+		if self.histogram is not None:
+			self.histogram.add(mass, fmass)
+		self.particles += len(pids)
+	# Add another partial of the same network into this one, after the files already in it
+	def merge(self, other):
+		if not (np.array_equal(self.nz, other.nz) and np.array_equal(self.nn, other.nn)):
+			raise ValueError("files %s and %s have different networks" % (self.files[0],
+				other.files[0]))
+		self.files.extend(other.files)
+		self.totals += other.totals
+		self.runs.extend(other.runs)
+		self.queries.merge(other.queries)
+		if self.histogram is not None:
+			self.histogram.merge(other.histogram)
+		self.particles += other.particles
+		return self
+	# Return every particle ID from every run, sorted like hdf5_pid_list does
+	def pids(self):
+		pids = np.concatenate(self.runs + [np.zeros(0, dtype=np.int64)])
+		return np.sort(pids, kind="mergesort")
+	# Return the total yields as (nn, nz, grams, percent) tuples, like burn_query prints them
+	def yields(self):
+		total = self.totals.sum()
+		return [(int(n), int(z), mass, (100.0 * mass / total if total > 0.0 else 0.0))
+			for z, n, mass in zip(self.nz, self.nn, self.totals)]
+
+# Scan one file into a new partial (this runs in the worker processes)
+def scan_file(task):
+	filename, queries, histogram, budget = task
+	with SEFile(filename) as se:
+		partial = ScanPartial(se.nz, se.nn, queries, histogram)
+		partial.start_file(filename, se.cycles())
+		for pids, mass, fmass in se.blocks(budget):
+			partial.add(pids, mass, fmass)
+	return partial
+
+
+# PARALLEL SCAN
+
+# Scan each of a list of SE HDF5 files on a pool of worker processes
+# Returns the partial of every file, in the same order as the files
+# With one worker (or one file) everything runs in this process instead
+def scan_files(hdf5_files, queries=(), histogram=False, workers=DEFAULT_WORKERS, budget=None):
+	telemetry.count(bytes_read=sum(file_bytes(f) for f in hdf5_files))
+	tasks = [(filename, list(queries), histogram, budget) for filename in hdf5_files]
+	workers = max(1, min(workers, len(hdf5_files)))
+	if workers == 1:
+		return [scan_file(task) for task in tasks]
+	pool = multiprocessing.Pool(workers)
+	try:
+		# map hands the partials back in task order, whichever worker finishes first
+		return pool.map(scan_file, tasks, chunksize=1)
+	finally:
+		pool.close()
+		pool.join()
+
+# Merge a list of partials in order and return the result
+def merge_partials(partials):
+	merged = partials[0]
+	for partial in partials[1:]:
+		merged.merge(partial)
+	return merged
+
+# Scan a list of SE HDF5 files on a pool of worker processes and return the merged partial
+def parallel_scan(hdf5_files, queries=(), histogram=False, workers=DEFAULT_WORKERS, budget=None):
+	hdf5_files = sorted(hdf5_files)
+	if len(hdf5_files) == 0:
+		raise ValueError("no HDF5 files to scan")
+	merged = merge_partials(scan_files(hdf5_files, queries, histogram, workers, budget))
+	telemetry.count(particles=merged.particles)
+	return merged
+
+# Write particle IDs in the format of hdf5_pid_list output files
+def write_pid_list(filename, pids):
+	with open(filename, 'w') as pid_file:
+		pid_file.write("n_ids=%d\n" % (len(pids)))
+		for start in xrange(0, len(pids), 100000):
+			pid_file.write("".join("%d\n" % (i) for i in pids[start:start+100000]))
+	return filename
+
+# Main program: scan HDF5 files in parallel and write whichever outputs were asked for
+def main():
+	parser = argparse.ArgumentParser()
+	# Number of worker processes
+	parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS)
+	# Output file for the sorted particle ID list, as hdf5_pid_list writes it
+	parser.add_argument('-p', '--pids', default=None)
+	# Output file for the total yields, as update_yields reads it
+	parser.add_argument('-y', '--yields', default=None)
+	# File of compound queries, one "name: expression -> report targets" per line
+	parser.add_argument('-q', '--queries', default=None)
+	# Single compound queries in the same format (can be repeated)
+	parser.add_argument('-e', '--expression', action='append', default=[])
+	# Directory for the query outfiles, one "<name>.out" per query
+	parser.add_argument('-o', '--outdir', default=".")
+	# Output .npz file for the fmass histograms
+	parser.add_argument('--histogram', default=None)
+	# Memory budget per worker for the particle blocks, e.g., 1G
+	parser.add_argument('-b', '--budget', default=None)
+	# The set of HDF5 file(s) to scan
+	parser.add_argument('hdf5', nargs='+')
+	args = parser.parse_args()
+	queries = (read_queries(args.queries) if args.queries is not None else [])
+	queries.extend([parse_query(line) for line in args.expression])
+	telemetry.start_run("parallel_scan")
+	with telemetry.stage("parallel_scan", workers=args.workers):
+		scan = parallel_scan(args.hdf5, queries, args.histogram is not None, args.workers,
+			args.budget)
+	print "Scanned %d particles in %d files" % (scan.particles, len(scan.files))
+	if args.pids is not None:
+		write_pid_list(args.pids, scan.pids())
+	if args.yields is not None:
+		pipeline.write_yields(scan.yields(), args.yields)
+	if args.histogram is not None:
+		scan.histogram.save(args.histogram)
+	if len(queries) > 0 and not os.path.isdir(args.outdir):
+		os.makedirs(args.outdir)
+	for name, result in sorted(scan.queries.results().items()):
+		write_result(os.path.join(args.outdir, name + ".out"), result)
+		print "%s: %d particles" % (name, len(result))
+	telemetry.end_run()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,346 @@
+# Columnar storage for the per-particle data produced by DM postprocessing
+# A particle dataset is a directory holding one NumPy .npy file per plotting column
+# An abundance store is a directory holding the sparse burn_query results per isotope
+# Both are built once from the ASCII files and then memory-mapped for fast analysis
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	ds = ParticleDataset.from_plotting("sn_data/jet3b/analysis/jet3b_plotting.out")
+#	store = AbundanceStore.from_queries("sn_data/jet3b/sorted_queries")
+# To convert the jet3b plotting file and sorted queries for vectorized analysis
+
+import os
+import re
+import hashlib
+
+import numpy as np
+
+import sn_utils as sn
+import telemetry
+
+# Directory name suffix for a particle dataset built from a plotting file
+DATASET_SUFFIX = ".dataset"
+# Directory name suffix for an abundance store built from sorted query files
+ABUNDANCE_SUFFIX = ".abundances"
+# Name of the file in each dataset directory that lists its columns in order
+COLUMNS_FILE = "columns"
+# Name of the file in each abundance store that lists its isotopes
+ISOTOPES_INDEX = "isotopes"
+# Number of text lines to parse at once while converting ASCII files
+BLOCK_LINES = 100000
+
+# Unit vector along the jet axis of the simulations (the z axis)
+JET_AXIS = (0.0, 0.0, 1.0)
+
+
+# COLUMN NAMES
+
+# Turn a plotting file column name like "X_{26Al}" into a safe file name like "X_26Al"
+def column_filename(name):
+	# Replace every run of characters that are awkward in file names with underscores
+	safe = re.sub(r"[^A-Za-z0-9.+-]+", "_", name)
+	# Trim any underscores left hanging at either end and add the NumPy extension
+	return safe.strip("_") + ".npy"
+
+# Return the plotting file column name used for the abundance of a target, e.g., "X_{Al}"
+def abundance_column(target):
+	return "X_{%s}" % (target)
+
+
+# HELPER FUNCTIONS
+
+# Count the data lines in a CSV file, skipping any header lines that start with letters
+def count_rows(filename):
+	# Keep a running total of the numeric lines
+	rows = 0
+	with open(filename, 'r') as csv:
+		for line in csv:
+			# Data lines always start with a particle ID number
+			if line[:1].isdigit():
+				rows += 1
+	# Return the number of data lines
+	return rows
+
+# Read a CSV file in blocks of lines, yielding each block as a 2D float array
+# The first alphabetic line found is returned through the header list argument
+def read_csv_blocks(filename, header, block_lines=BLOCK_LINES):
+	# Store lines here until the block is full, counting their bytes for the telemetry
+	block, n_bytes = [], 0
+	with open(filename, 'r') as csv:
+		for line in csv:
+			n_bytes += len(line)
+			# Split the line into its CSV entries
+			entries = line.strip().split(", ")
+			# Non-numeric lines are headers, keep the first one and skip the rest
+			if not line[:1].isdigit():
+				if header == [] and entries != [""]:
+					header.extend(entries)
+				continue
+			block.append(entries)
+			# Hand back a full block as a float array and start a new one
+			if len(block) == block_lines:
+				telemetry.count(bytes_read=n_bytes)
+				yield np.array(block, dtype=np.float64)
+				block, n_bytes = [], 0
+	# Send out whatever partial block is left at the end of the file
+	telemetry.count(bytes_read=n_bytes)
+	if len(block) > 0:
+		yield np.array(block, dtype=np.float64)
+
+# Make a short fingerprint string from the sizes and modification times of some files
+def files_fingerprint(filenames):
+	# Hash the identifying info of every file in the given order
+	digest = hashlib.sha1()
+	for filename in filenames:
+		info = os.stat(filename)
+		digest.update(("%s %d %r\n" % (os.path.basename(filename), info.st_size,
+			info.st_mtime)).encode("utf-8"))
+	# Return the hex string of the hash
+	return digest.hexdigest()
+
+
+# PARTICLE DATASET
+
+# Columnar particle dataset stored as a directory of memory-mapped .npy files
+# All columns have one row per particle and the rows are sorted by particle ID
+class ParticleDataset:
+	# Open an existing dataset directory
+	def __init__(self, directory):
+		# Store the full path to the dataset directory
+		self.directory = os.path.abspath(directory)
+		# Read the ordered list of column names
+		self.names = sn.get_lines(os.path.join(self.directory, COLUMNS_FILE))
+		# Memory maps are opened on first use and stored here
+		self._maps = {}
+		# The number of rows is the length of the ID column
+		self.n_rows = len(self.column("id"))
+	# Convert a plotting file into a new dataset directory and return it opened
+	@classmethod
+	def from_plotting(cls, plotting_file, directory=None, block_lines=BLOCK_LINES):
+		# By default, put the dataset next to the plotting file
+		if directory is None:
+			directory = os.path.splitext(plotting_file)[0] + DATASET_SUFFIX
+		build_dataset(plotting_file, directory, block_lines)
+		return cls(directory)
+	# Return the full path to the .npy file storing the named column
+	def path(self, name):
+		return os.path.join(self.directory, column_filename(name))
+	# Check whether the dataset has the named column
+	def has_column(self, name):
+		return name in self.names
+	# Return the full column as a read-only memory map, loading nothing until it is indexed
+	def column(self, name):
+		# Check that the column actually exists in this dataset
+		if name not in self.names:
+			raise KeyError("no column %s in dataset %s" % (repr(name), self.directory))
+		# Open the memory map the first time the column is requested
+		if name not in self._maps:
+			self._maps[name] = np.load(self.path(name), mmap_mode='r')
+		return self._maps[name]
+	# Read rows start to stop of the named column into an ordinary array
+	def read(self, name, start=0, stop=None):
+		return np.array(self.column(name)[start:stop])
+	# Return the row index of each particle ID, or -1 for IDs not in the dataset
+	def rows_of(self, pids):
+		# The ID column is sorted, so a binary search finds every ID at once
+		ids = self.column("id")
+		pids = np.asarray(pids)
+		rows = np.searchsorted(ids, pids)
+		# Clip so that IDs past the end can be checked safely, then flag any mismatch
+		rows = np.minimum(rows, self.n_rows - 1)
+		rows[ids[rows] != pids] = -1
+		return rows
+	# Return a fingerprint string that changes whenever any column file changes
+	def fingerprint(self):
+		return files_fingerprint([self.path(name) for name in self.names])
+
+# Build a dataset directory from a plotting CSV file, one .npy file per column
+def build_dataset(plotting_file, directory, block_lines=BLOCK_LINES):
+	# Print a quick progress message for the user
+	print "Building particle dataset %s" % (directory)
+	# Make the dataset directory if needed
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	# Count the particles first so that every column can be preallocated on disk
+	n_rows = count_rows(plotting_file)
+	# Read the file block by block, copying each block into the column files
+	header, columns, row = [], None, 0
+	for block in read_csv_blocks(plotting_file, header, block_lines):
+		# Open one writable .npy memory map per column once the header is known
+		if columns is None:
+			if len(header) != block.shape[1]:
+				raise ValueError("header of %s does not match its data" % (plotting_file))
+			columns = []
+			for name in header:
+				# Particle IDs are stored as integers, everything else as doubles
+				dtype = (np.int64 if name == "id" else np.float64)
+				path = os.path.join(directory, column_filename(name))
+				columns.append(np.lib.format.open_memmap(path, mode="w+",
+					dtype=dtype, shape=(n_rows,)))
+		# Copy this block of rows into each of the columns
+		for c, column in enumerate(columns):
+			column[row:row+len(block)] = block[:, c]
+		row += len(block)
+	# An empty plotting file cannot be turned into a dataset
+	if columns is None:
+		raise ValueError("no particle data found in %s" % (plotting_file))
+	# Every row lookup depends on the IDs being sorted, so check that now
+	ids = columns[0]
+	if np.any(ids[1:] <= ids[:-1]):
+		raise ValueError("repeated or unsorted IDs in %s" % (plotting_file))
+	# Flush the columns to disk and record their names in order
+	for column in columns:
+		column.flush()
+	del columns
+	with open(os.path.join(directory, COLUMNS_FILE), 'w') as names:
+		names.write('\n'.join(header) + '\n')
+
+
+# ABUNDANCE STORE
+
+# Sparse per-isotope abundances taken from the sorted burn_query output files
+# Each isotope has a sorted array of particle IDs and an array of their mass fractions
+class AbundanceStore:
+	# Open an existing abundance store directory
+	def __init__(self, directory):
+		# Store the full path to the store directory
+		self.directory = os.path.abspath(directory)
+		# Read the isotope index, one "name nn nz" line per isotope
+		self.isotopes, self.nn, self.nz = [], {}, {}
+		for line in sn.get_lines(os.path.join(self.directory, ISOTOPES_INDEX)):
+			name, nn, nz = line.split()
+			self.isotopes.append(name)
+			self.nn[name], self.nz[name] = int(nn), int(nz)
+	# Convert a directory of sorted query files into a new store and return it opened
+	@classmethod
+	def from_queries(cls, queries_dir, directory=None, block_lines=BLOCK_LINES):
+		# By default, put the store next to the queries directory
+		if directory is None:
+			directory = os.path.normpath(queries_dir) + ABUNDANCE_SUFFIX
+		build_abundance_store(queries_dir, directory, block_lines)
+		return cls(directory)
+	# Return the full paths to the particle ID and mass fraction files of an isotope
+	def paths(self, isotope):
+		base = os.path.join(self.directory, isotope)
+		return (base + ".pid.npy", base + ".fmass.npy")
+	# Return the sorted particle IDs and mass fractions stored for an isotope
+	def get(self, isotope):
+		# Check that the isotope is in the store
+		if isotope not in self.nn:
+			raise KeyError("no isotope %s in store %s" % (repr(isotope), self.directory))
+		pid_path, fmass_path = self.paths(isotope)
+		return (np.load(pid_path, mmap_mode='r'), np.load(fmass_path, mmap_mode='r'))
+	# Expand a list of abundance targets (elements or isotopes) into stored isotope names
+	def expand(self, targets):
+		# Collect matching isotope names without repeats
+		isotopes = []
+		for target in targets:
+			# An element matches every stored isotope with its proton number
+			if target.isalpha():
+				nz = sn.SYMBOLS.index(target)
+				matches = [iso for iso in self.isotopes if self.nz[iso] == nz]
+			# Otherwise match the isotope itself, using its standard name
+			else:
+				nn, nz = sn.nn_nz(target)
+				matches = [iso for iso in self.isotopes
+					if self.nn[iso] == int(nn) and self.nz[iso] == int(nz)]
+			# Each target should match at least one stored isotope
+			if len(matches) == 0:
+				raise KeyError("no stored isotopes for target %s" % (repr(target)))
+			isotopes.extend([iso for iso in matches if iso not in isotopes])
+		return isotopes
+	# Return a fingerprint string that changes whenever any stored array changes
+	def fingerprint(self):
+		filenames = []
+		for isotope in self.isotopes:
+			filenames.extend(self.paths(isotope))
+		return files_fingerprint(filenames)
+
+# Build an abundance store from the sorted query files made by sort_query.sh
+# Each query file may hold several isotopes, so rows are grouped by their Z and n values
+def build_abundance_store(queries_dir, directory, block_lines=BLOCK_LINES):
+	# Print a quick progress message for the user
+	print "Building abundance store %s" % (directory)
+	# Make the store directory if needed
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	# Gather the rows of every isotope across all of the query files
+	found = {}
+	for query in sorted(os.listdir(queries_dir)):
+		# Only the burn_query outfiles are of interest here
+		if sn.get_ext(query) != "out":
+			continue
+		# Read the "ID, Z, n, Mass_Frac" rows of the file in blocks
+		for block in read_csv_blocks(os.path.join(queries_dir, query), [], block_lines):
+			# Split the block up by the (nz, nn) pair of each row
+			pairs = block[:, 1].astype(np.int64) * 1000 + block[:, 2].astype(np.int64)
+			for pair in np.unique(pairs):
+				rows = block[pairs == pair]
+				found.setdefault(pair, []).append((rows[:, 0].astype(np.int64), rows[:, 3]))
+	# Write each isotope's IDs and mass fractions sorted by particle ID
+	index = []
+	for pair in sorted(found):
+		# Recover the isotope name from its proton and neutron numbers
+		nz, nn = pair // 1000, pair % 1000
+		name = sn.iso_name(nn, nz)
+		pids = np.concatenate([part[0] for part in found[pair]])
+		fmass = np.concatenate([part[1] for part in found[pair]])
+		# Drop any repeated rows left over from overlapping query files
+		pids, first = np.unique(pids, return_index=True)
+		pid_path = os.path.join(directory, name + ".pid.npy")
+		np.save(pid_path, pids)
+		np.save(os.path.join(directory, name + ".fmass.npy"), fmass[first])
+		index.append("%s %d %d" % (name, nn, nz))
+	# Record the isotopes that are now in the store
+	with open(os.path.join(directory, ISOTOPES_INDEX), 'w') as isotopes:
+		isotopes.write('\n'.join(index) + '\n')
+
+
+# DERIVED COLUMNS
+
+# Simple geometric quantities computed on the fly from the dataset's base columns
+# Each function takes a dataset and a row slice and returns an array for those rows
+
+# Distance from the origin in centimeters
+def _radius(ds, rows):
+	x, y, z = [get_values(ds, axis, rows) for axis in ("x", "y", "z")]
+	return np.sqrt(x**2 + y**2 + z**2)
+
+# Radial velocity in cm/s (positive outward)
+def _radial_velocity(ds, rows):
+	x, y, z = [get_values(ds, axis, rows) for axis in ("x", "y", "z")]
+	vx, vy, vz = [get_values(ds, axis, rows) for axis in ("vx", "vy", "vz")]
+	r = np.sqrt(x**2 + y**2 + z**2)
+	# Particles sitting at the origin have no radial direction, call it zero
+	with np.errstate(invalid="ignore", divide="ignore"):
+		v_r = (x * vx + y * vy + z * vz) / r
+	v_r[r == 0.0] = 0.0
+	return v_r
+
+# Angle from the jet axis in degrees, folded so that both jets are at zero
+def _jet_angle(ds, rows):
+	x, y, z = [get_values(ds, axis, rows) for axis in ("x", "y", "z")]
+	r = np.sqrt(x**2 + y**2 + z**2)
+	along = x * JET_AXIS[0] + y * JET_AXIS[1] + z * JET_AXIS[2]
+	with np.errstate(invalid="ignore", divide="ignore"):
+		cos_theta = np.abs(along) / r
+	cos_theta[r == 0.0] = 1.0
+	return np.degrees(np.arccos(np.clip(cos_theta, 0.0, 1.0)))
+
+# Lookup table of the derived columns that can be asked for by name
+DERIVED_COLUMNS = {
+	"r": _radius,
+	"v_r": _radial_velocity,
+	"jet angle": _jet_angle,
+}
+
+# Return the values of a base or derived column for the given rows (a slice or index array)
+def get_values(ds, name, rows=slice(None)):
+	# Stored columns are read straight from their memory maps
+	if ds.has_column(name):
+		return np.asarray(ds.column(name)[rows], dtype=np.float64)
+	# Derived columns are computed from the stored ones
+	if name in DERIVED_COLUMNS:
+		return DERIVED_COLUMNS[name](ds, rows)
+	raise KeyError("unknown column %s" % (repr(name)))
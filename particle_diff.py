@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+# Particle-by-particle diff of two runs or simulations, aligned by particle ID
+# Either side can be a particle dataset directory or an SDF file, and the particles they share are
+# compared column by column in chunks, so production-size data fits in a memory budget
+# For each column it reports how many particles differ at all and by more than the tolerance,
+# streaming statistics of the absolute and relative differences, and the top-N outliers
+# Every column diff merges with another, so the comparison can also be split into shards
+# This makes quick regression checks of a new fast path against the legacy outputs, e.g.,
+#	./particle_diff.py -r 1e-6 --fail old/jet3b_plotting.dataset new/jet3b_plotting.dataset
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	./particle_diff.py -c rho,temp -t temp=1e-3 -n 20 runA/run1.00400 runB/run1.00400
+# To compare density and temperature particle by particle, allowing temperatures to be 0.1% off,
+# and list the 20 particles that differ the most
+
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+
+import telemetry
+from chunking import chunk_rows, row_chunks
+from particle_data import ParticleDataset, get_values
+from sdf_reader import SDFFile
+from stream_stats import Summary
+
+# Default relative and absolute tolerances, as in numpy.isclose: |b - a| <= atol + rtol * |a|
+DEFAULT_RTOL = 0.0
+DEFAULT_ATOL = 0.0
+# Default number of outliers to keep for each column
+DEFAULT_TOP = 10
+# Rough memory cost in bytes per aligned particle per column while diffing
+BYTES_PER_VALUE = 64
+
+
+# ALIGNMENT
+
+# Open a particle dataset directory or an SDF file
+def open_source(path):
+	if os.path.isdir(path):
+		return ParticleDataset(path)
+	return SDFFile(path)
+
+# Return the name of the particle ID column of a source
+def id_column(source):
+	return ("id" if source.has_column("id") else "ident")
+
+# Return the names of the columns of a source other than its ID column
+def value_columns(source):
+	return [name for name in source.names if name != id_column(source)]
+
+# Return the sorted particle IDs of a source and the row each one is stored in
+def sorted_ids(source):
+	ids = np.asarray(source.column(id_column(source)), dtype=np.int64)
+	if np.all(ids[1:] > ids[:-1]):
+		return ids, np.arange(len(ids))
+	order = np.argsort(ids, kind="mergesort")
+	ids = ids[order]
+	if np.any(ids[1:] == ids[:-1]):
+		raise ValueError("repeated particle IDs in %s" % (getattr(source, "filename",
+			getattr(source, "directory", "source"))))
+	return ids, order
+
+# Align two sources by particle ID
+# Returns the shared IDs, their rows in each source, and the numbers of IDs found in only one
+def align(a, b):
+	ids_a, rows_a = sorted_ids(a)
+	ids_b, rows_b = sorted_ids(b)
+	pids, index_a, index_b = np.intersect1d(ids_a, ids_b, assume_unique=True,
+		return_indices=True)
+	return pids, rows_a[index_a], rows_b[index_b], len(ids_a) - len(pids), len(ids_b) - len(pids)
+
+
+# COLUMN DIFFS
+
+# Streaming diff of one column between two aligned sources
+class ColumnDiff:
+	# Start an empty diff with its tolerances and the number of outliers to keep
+	def __init__(self, name, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL, top=DEFAULT_TOP):
+		self.name = name
+		self.rtol, self.atol = rtol, atol
+		self.top = top
+		self.compared = 0
+		self.nonzero = 0
+		self.mismatched = 0
+		# Differences of (b - a), and (b - a) / a wherever a is nonzero
+		self.absolute = Summary()
+		self.relative = Summary()
+		# Outliers by the size of their relative difference (infinite where a is zero)
+		self.outliers = np.zeros(0, dtype=[("pid", np.int64), ("a", float), ("b", float),
+			("score", float)])
+	# Add a chunk of particle IDs with their values from each source
+	def add(self, pids, a, b):
+		a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+		# Particles that are NaN on both sides agree, any other NaN is a difference
+		same = (a == b) | (np.isnan(a) & np.isnan(b))
+		with np.errstate(invalid="ignore", divide="ignore"):
+			diff = b - a
+			relative = diff / a
+			close = np.abs(diff) <= self.atol + self.rtol * np.abs(a)
+		self.compared += len(a)
+		self.nonzero += len(a) - np.count_nonzero(same)
+		self.mismatched += len(a) - np.count_nonzero(same | close)
+		self.absolute.add(diff)
+		self.relative.add(relative[a != 0.0])
+		# Keep the largest differences of this chunk and the ones already kept
+		score = np.where(same, -1.0, np.abs(relative))
+		score[~same & ~np.isfinite(score)] = np.inf
+		keep = self._largest(score, self.top)
+		chunk = np.zeros(len(keep), dtype=self.outliers.dtype)
+		chunk["pid"], chunk["a"], chunk["b"], chunk["score"] = pids[keep], a[keep], b[keep], \
+			score[keep]
+		self._keep(chunk[chunk["score"] >= 0.0])
+	# Return the indices of the n largest scores
+	@staticmethod
+	def _largest(score, n):
+		if len(score) <= n:
+			return np.arange(len(score))
+		return np.argpartition(-score, n - 1)[:n]
+	# Merge new outliers into the kept ones, keeping the top few by score (then by ID)
+	def _keep(self, outliers):
+		outliers = np.concatenate([self.outliers, outliers])
+		order = np.lexsort((outliers["pid"], -outliers["score"]))
+		self.outliers = outliers[order[:self.top]]
+	# Add another diff of the same column into this one
+	def merge(self, other):
+		self.compared += other.compared
+		self.nonzero += other.nonzero
+		self.mismatched += other.mismatched
+		self.absolute.merge(other.absolute)
+		self.relative.merge(other.relative)
+		self._keep(other.outliers)
+		return self
+	# Return the fraction of compared particles that differ, at all or beyond the tolerance
+	def nonzero_fraction(self):
+		return (self.nonzero / float(self.compared) if self.compared > 0 else 0.0)
+	def mismatch_fraction(self):
+		return (self.mismatched / float(self.compared) if self.compared > 0 else 0.0)
+	# Return the diff as a plain dict, e.g., for JSON
+	def as_dict(self):
+		return {"column": self.name, "rtol": self.rtol, "atol": self.atol,
+			"compared": self.compared, "nonzero": self.nonzero, "mismatched": self.mismatched,
+			"absolute": self.absolute.as_dict(), "relative": self.relative.as_dict(),
+			"outliers": [{"pid": int(o["pid"]), "a": float(o["a"]), "b": float(o["b"]),
+				"rel_diff": float(o["score"])} for o in self.outliers]}
+
+# Everything found by comparing two sources
+class ParticleDiff:
+	def __init__(self, columns, only_a=0, only_b=0):
+		self.columns = columns
+		self.only_a, self.only_b = only_a, only_b
+	# Check whether the sources agree within the tolerances on every shared particle
+	def passed(self):
+		return self.only_a == 0 and self.only_b == 0 and \
+			all(diff.mismatched == 0 for diff in self.columns.values())
+	# Return a text report with a summary line per column and each column's outliers
+	def report(self):
+		lines = ["Particles only in A: %d, only in B: %d" % (self.only_a, self.only_b), "",
+			"%-14s%12s%12s%12s%13s%13s%13s" % ("column", "compared", "nonzero", "mismatched",
+			"mean rel", "median rel", "max |rel|")]
+		for name in sorted(self.columns):
+			diff = self.columns[name]
+			rel = diff.relative
+			largest = max(abs(rel.min), abs(rel.max)) if rel.count > 0 else 0.0
+			lines.append("%-14s%12d%12d%12d%13.5g%13.5g%13.5g" % (name, diff.compared,
+				diff.nonzero, diff.mismatched, rel.mean(), rel.median(), largest))
+		for name in sorted(self.columns):
+			diff = self.columns[name]
+			if len(diff.outliers) == 0:
+				continue
+			lines.extend(["", "Largest differences in %s:" % (name),
+				"%14s%16s%16s%14s" % ("pid", "a", "b", "rel diff")])
+			for o in diff.outliers:
+				lines.append("%14d%16.8g%16.8g%14.5g" % (o["pid"], o["a"], o["b"], o["score"]))
+		return '\n'.join(lines) + '\n'
+	# Return the diff as a plain dict, e.g., for JSON
+	def as_dict(self):
+		return {"only_a": self.only_a, "only_b": self.only_b, "passed": self.passed(),
+			"columns": [self.columns[name].as_dict() for name in sorted(self.columns)]}
+
+
+# DIFFING
+
+# Compare columns of two sources particle by particle, in chunks that fit the memory budget
+# Tolerances is a dict of (rtol, atol) by column name, for columns that differ from the defaults
+# Columns default to every column the sources have in common
+def diff_sources(a, b, columns=None, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL, tolerances=None,
+	top=DEFAULT_TOP, budget=None):
+	if columns is None:
+		columns = [name for name in value_columns(a) if name in value_columns(b)]
+	tolerances = (tolerances if tolerances is not None else {})
+	with telemetry.stage("align"):
+		pids, rows_a, rows_b, only_a, only_b = align(a, b)
+	diffs = dict((name, ColumnDiff(name, *(tolerances.get(name, (rtol, atol)) + (top,))))
+		for name in columns)
+	with telemetry.stage("diff", columns=len(columns)):
+		rows = chunk_rows(budget, BYTES_PER_VALUE * (len(columns) + 1))
+		for start, stop in row_chunks(len(pids), rows):
+			for name in columns:
+				diffs[name].add(pids[start:stop], get_values(a, name, rows_a[start:stop]),
+					get_values(b, name, rows_b[start:stop]))
+			telemetry.count(particles=stop - start)
+	return ParticleDiff(diffs, only_a, only_b)
+
+# Parse a column tolerance of the form "name=rtol" or "name=rtol,atol"
+def parse_tolerance(text):
+	name, values = text.split("=", 1)
+	values = [float(v) for v in values.split(",")]
+	return name.strip(), (values[0], (values[1] if len(values) > 1 else DEFAULT_ATOL))
+
+# Main program: diff two particle datasets or SDF files
+def main():
+	parser = argparse.ArgumentParser()
+	# Columns to compare, comma separated (default is every column they share)
+	parser.add_argument('-c', '--columns', default=None)
+	# Default relative and absolute tolerances
+	parser.add_argument('-r', '--rtol', type=float, default=DEFAULT_RTOL)
+	parser.add_argument('-a', '--atol', type=float, default=DEFAULT_ATOL)
+	# Per-column tolerances, "name=rtol" or "name=rtol,atol" (can be repeated)
+	parser.add_argument('-t', '--tolerance', action='append', default=[])
+	# Number of outliers to list for each column
+	parser.add_argument('-n', '--top', type=int, default=DEFAULT_TOP)
+	# Memory budget for the chunks, e.g., 1G
+	parser.add_argument('-b', '--budget', default=None)
+	# Output JSON file for the full diff
+	parser.add_argument('-o', '--output', default=None)
+	# Exit with status 1 if anything differs beyond the tolerances
+	parser.add_argument('--fail', action='store_true')
+	# The two datasets or SDF files to compare
+	parser.add_argument('a')
+	parser.add_argument('b')
+	args = parser.parse_args()
+	columns = (args.columns.split(",") if args.columns is not None else None)
+	tolerances = dict(parse_tolerance(text) for text in args.tolerance)
+	telemetry.start_run("particle_diff")
+	result = diff_sources(open_source(args.a), open_source(args.b), columns, args.rtol,
+		args.atol, tolerances, args.top, args.budget)
+	telemetry.end_run()
+	sys.stdout.write(result.report())
+	if args.output is not None:
+		with open(args.output, 'w') as output:
+			json.dump(result.as_dict(), output, indent=1, sort_keys=True)
+	if args.fail and not result.passed():
+		print "\nFAILED: the particles differ beyond the tolerances"
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,334 @@
+# Importable DM processing pipeline for one supernova simulation
+# Every stage is a plain function with explicit parameters, so notebooks and batch drivers can
+# chain stages in one process and keep the loaded data around between them
+# The shell scripts and C helpers of DM postprocessing (extract_yields.sh, update_yields,
+# sort_query.sh) have in-process replacements here; burn_query still runs as its C program
+# Stages can run through a stage_cache.StageCache, which restores their outputs instead of
+# redoing them when nothing they depend on has changed
+# Every stage is timed through telemetry, so DM_TELEMETRY=directory records where time goes
+# Importing this module does nothing on its own: NumPy and the array modules are only
+# imported by the stages that need them, and dm_postprocess.py is a thin command line wrapper
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	paths = pipeline.find_paths("sn_data/jet3b")
+#	pipeline.postprocess(paths, sn.get_list(sn.ABUNDANCES_FILE))
+# To run all of DM postprocessing for jet3b in the current Python session, with no prompts
+# Pass cache=True to skip any stage whose inputs and parameters match a cached earlier run
+
+import os
+import re
+import sys
+import glob
+
+import sn_utils as sn
+import telemetry
+from stage_cache import StageCache, CACHE_DIR
+
+# Pattern matching one line of total yields, e.g., "nn = 6 nz = 6 mass = 1.0e+32 (12.34%)"
+YIELDS_PATTERN = re.compile(r"nn\s*=\s*(\d+)\s+nz\s*=\s*(\d+)\s+mass\s*=\s*(\S+)\s*\(\s*(\S+)%\)")
+# File name endings used by the yields files
+YIELDS_END = "_yields.out"
+UPDATED_YIELDS_END = "_updated_yields.out"
+
+
+# HELPER FUNCTIONS
+
+# Find the directories of a simulation, only asking the user to confirm them if told to
+def find_paths(head, confirm=False):
+	return sn.get_paths(head, confirm)
+
+# Ask the user whether to continue if confirm is set, and stop the program if they say no
+def checkpoint(confirm):
+	if confirm and not sn.ask_user("Continue program execution?"):
+		print "Aborting on user command"
+		sys.exit()
+
+# Return the simulation name, which is the name of its head directory
+def sim_name(paths):
+	return os.path.basename(paths["head"])
+
+# Return the full path to an output file in the analysis directory named after the simulation
+def analysis_file(paths, ending):
+	return os.path.join(paths["analysis"], sim_name(paths) + ending)
+
+# Return the stage cache to use, given a StageCache, the directory of one, True for the cache
+# directory inside the simulation, or None (or False) for no caching
+def open_cache(paths, cache):
+	if cache is None or cache is False:
+		return None
+	if cache is True:
+		return StageCache(os.path.join(paths["head"], CACHE_DIR))
+	if isinstance(cache, basestring):
+		return StageCache(cache)
+	return cache
+
+# Run a stage through a cache if there is one, otherwise just run it, timing it either way
+def cached_stage(cache, stage, inputs, outputs, function, params=None):
+	with telemetry.stage(stage, outputs) as record:
+		if cache is None:
+			function()
+		else:
+			record["cached"] = cache.run(stage, inputs, outputs, function, params)[1]
+
+
+# TOTAL YIELDS
+
+# Parse total yields lines into a list of (nn, nz, grams, percent) tuples
+def parse_yields(lines):
+	yields = []
+	for line in lines:
+		match = YIELDS_PATTERN.search(line)
+		if match is not None:
+			nn, nz, mass, percent = match.groups()
+			yields.append((int(nn), int(nz), float(mass), float(percent)))
+	return yields
+
+# Read a total yields file into a list of (nn, nz, grams, percent) tuples
+def read_yields(filename):
+	with open(filename, 'r') as yields_file:
+		return parse_yields(yields_file)
+
+# Write a list of (nn, nz, grams, percent) tuples in the update_yields output format
+def write_yields(yields, filename):
+	with open(filename, 'w') as yields_file:
+		for nn, nz, mass, percent in yields:
+			yields_file.write("nn = %d nz = %d mass = %e (%.2f%%)\n" % (nn, nz, mass, percent))
+
+# Return the burn_query slurm .out files in an sbatch directory, in order
+def query_logs(sbatch_dir):
+	return sorted(glob.glob(os.path.join(sbatch_dir, "slurm.*.ISO*.out")))
+
+# Pull the total yields out of the burn_query slurm .out files, like extract_yields.sh
+# Every output must agree on the yields; returns the parsed (nn, nz, grams, percent) tuples
+def extract_yields(sbatch_dir, yields_path, cache=None):
+	logs = query_logs(sbatch_dir)
+	cached_stage(cache, "extract_yields", logs, [yields_path],
+		lambda : _extract_yields(sbatch_dir, logs, yields_path))
+	return read_yields(yields_path)
+
+# Do the work of extract_yields for the given slurm .out files
+def _extract_yields(sbatch_dir, logs, yields_path):
+	# Print a progress indicator message
+	print "\nExtracting total simulation yields"
+	found = None
+	for output in logs:
+		with open(output, 'r') as output_file:
+			lines = [line for line in output_file if "nn =" in line]
+		telemetry.count(bytes_read=os.path.getsize(output))
+		# Outputs without any yields lines are skipped, as the shell script does
+		if len(lines) == 0:
+			continue
+		if found is None:
+			found = lines
+		elif lines != found:
+			raise ValueError("yields in %s differ from the other burn_query outputs" % (output))
+	if found is None:
+		raise IOError("no yields could be extracted from %s" % (sbatch_dir))
+	with open(yields_path, 'w') as yields_file:
+		yields_file.writelines(found)
+	print "Yields have been extracted to %s" % (yields_path)
+
+# Total the unburned yields from an unburned .unburned.out file, skipping burned particle IDs
+# Returns the nz and nn arrays of the network isotopes and their masses in grams
+def unburned_from_file(unburned_path, burned_ids):
+	import numpy as np
+	from particle_data import read_csv_blocks
+	from reducers import is_listed
+	header, totals = [], None
+	for block in read_csv_blocks(unburned_path, header):
+		# The IDs are looked up in sorted order since the file's rows need not be sorted
+		ids = block[:, 0].astype(np.int64)
+		order = np.argsort(ids, kind="mergesort")
+		unburned = np.empty(len(ids), dtype=bool)
+		unburned[order] = ~is_listed(ids[order], burned_ids)
+		telemetry.count(particles=len(ids))
+		part = np.dot(block[unburned, 1], block[unburned, 2:])
+		totals = (part if totals is None else totals + part)
+	# The header names each isotope column like "nz=6:nn=6"
+	pairs = [re.match(r"nz=(\d+):nn=(\d+)", name).groups() for name in header[2:]]
+	nz = np.array([int(pair[0]) for pair in pairs])
+	nn = np.array([int(pair[1]) for pair in pairs])
+	if totals is None:
+		totals = np.zeros(len(pairs))
+	return nz, nn, totals * sn.SNSPH_MASS
+
+# Add the unburned yields onto the total yields and write the updated yields file
+# The unburned yields come from the .unburned.out file, or straight from the final SDF file
+# Returns the updated (nn, nz, grams, percent) tuples
+def update_yields(yields_path, pids_path, unburned_path=None, final_sdf=None, out_path=None,
+	budget=None, cache=None):
+	if out_path is None:
+		out_path = yields_path[:-len(YIELDS_END)] + UPDATED_YIELDS_END
+	source = (unburned_path if unburned_path is not None else final_sdf)
+	cached_stage(cache, "update_yields", [yields_path, pids_path] + ([source] if source else []),
+		[out_path], lambda : _update_yields(yields_path, pids_path, unburned_path, final_sdf,
+		out_path, budget))
+	return read_yields(out_path)
+
+# Do the work of update_yields
+def _update_yields(yields_path, pids_path, unburned_path, final_sdf, out_path, budget):
+	from reducers import load_pid_list, unburned_yields
+	from sdf_reader import SDFFile
+	# Print a quick progress message for the user
+	print "\nUpdating total yields with unburned yields data"
+	burned_ids = load_pid_list(pids_path)
+	if unburned_path is not None:
+		nz, nn, grams = unburned_from_file(unburned_path, burned_ids)
+	elif final_sdf is not None:
+		final = SDFFile(final_sdf)
+		telemetry.count(particles=final.n_rows)
+		nz, nn, grams = unburned_yields(final, burned_ids, budget)
+	else:
+		raise ValueError("update_yields needs an unburned yields file or a final SDF file")
+	# Add each unburned isotope onto the matching total yields isotope
+	unburned = dict(((int(z), int(n)), mass) for z, n, mass in zip(nz, nn, grams))
+	masses = [mass + unburned.get((nz, nn), 0.0) for nn, nz, mass, percent in
+		read_yields(yields_path)]
+	total = sum(masses)
+	updated = [(nn, nz, mass, 100.0 * mass / total) for (nn, nz, old, percent), mass in
+		zip(read_yields(yields_path), masses)]
+	write_yields(updated, out_path)
+	print "Updated yields were produced and saved to %s" % (out_path)
+
+
+# QUERY FILES
+
+# Sort one burn_query output file by particle ID, keeping one header line, like sort_query.sh
+def sort_query(query_path, sorted_path):
+	# Print a quick message to the user
+	print "Sorting contents of file %s" % (query_path)
+	with open(query_path, 'r') as query:
+		lines = query.readlines()
+	telemetry.count(bytes_read=os.path.getsize(query_path), particles=max(len(lines) - 1, 0))
+	if len(lines) == 0:
+		open(sorted_path, 'w').close()
+		return
+	# Every other header line is dropped and the data lines are sorted by their IDs
+	rows = [line for line in lines[1:] if "ID" not in line and line.strip() != ""]
+	rows.sort(key=lambda line : (int(line.split(",")[0]), line))
+	with open(sorted_path, 'w') as sorted_file:
+		sorted_file.write(lines[0])
+		sorted_file.writelines(rows)
+
+# Sort every burn_query output file of a simulation into its sorted_queries directory
+# With a cache, each file is only sorted again if it changed
+def sort_queries(queries_dir, sorted_dir, cache=None):
+	# Print a progress message to the user
+	print "\nSorting all isotope query files"
+	with telemetry.stage("sort_queries"):
+		for query in sorted(os.listdir(queries_dir)):
+			query_path = os.path.join(queries_dir, query)
+			sorted_path = os.path.join(sorted_dir, query)
+			cached_stage(cache, "sort_query", [query_path], [sorted_path],
+				lambda : sort_query(query_path, sorted_path))
+
+# Return the mass fraction threshold that an isotope is queried at, e.g., '6' for 1e-6
+def fmass_cut(isotope):
+	return (sn.FMASS_CUT_LOW if isotope in sn.ISOTOPES_LOW else sn.FMASS_CUT)
+
+# Run one burn_query isotope query on a list of HDF5 files (burn_query is still a C program)
+# The abundance threshold defaults to the isotope's usual cut
+def burn_query(isotope, outfile, hdf5_files, abundance=None, cache=None):
+	import run_query
+	if abundance is None:
+		abundance = fmass_cut(isotope)
+	hdf5_files = sorted(hdf5_files)
+	telemetry.count(bytes_read=sum(os.path.getsize(f) for f in hdf5_files))
+	cached_stage(cache, "burn_query", hdf5_files, [outfile],
+		lambda : run_query.run_burn_query(hdf5_files,
+		run_query.make_inputs(isotope, abundance, outfile)),
+		{"isotope": isotope, "abundance": abundance})
+
+
+# PLOTTING VALUES
+
+# Write the particle plotting file of a simulation straight from its SDF files and queries
+# The sorted queries are converted to an abundance store first (or reused if given)
+# Returns the name of the plotting file written
+def write_plotting(paths, abundances, store=None, budget=None, cache=None):
+	from trajectories import timestep_files
+	# Make sure that this simulation actually has SDF files
+	if "sdf" not in paths:
+		return None
+	first = timestep_files(paths, "first")[0]
+	last = timestep_files(paths, "last")[0]
+	early = timestep_files(paths, "early")
+	outname = analysis_file(paths, "_plotting.out")
+	columns_name = os.path.join(paths["analysis"], "columns")
+	queries = [os.path.join(paths["sorted_queries"], name)
+		for name in sorted(os.listdir(paths["sorted_queries"]))]
+	cached_stage(cache, "write_plotting", [first, last] + early + queries, [outname, columns_name],
+		lambda : _write_plotting(paths, first, last, early, abundances, outname, columns_name,
+		store, budget), {"abundances": list(abundances)})
+	return outname
+
+# Do the work of write_plotting for the given SDF files
+def _write_plotting(paths, first, last, early, abundances, outname, columns_name, store, budget):
+	from sdf_reader import SDFFile
+	from particle_data import AbundanceStore
+	from alignment import AlignmentIndex, INDEX_DIR
+	import reducers
+	if store is None:
+		with telemetry.stage("abundance_store"):
+			store = AbundanceStore.from_queries(paths["sorted_queries"])
+	# Gather every file's rows through one alignment index over all the files involved
+	alignment = AlignmentIndex.load_or_build([first] + [f for f in early if f != first],
+		os.path.join(paths["head"], INDEX_DIR + ".plotting"))
+	final = SDFFile(last)
+	telemetry.count(particles=final.n_rows)
+	reducers.write_plotting(SDFFile(first), final, [SDFFile(f) for f in early],
+		store, abundances, outname, columns_name, budget, alignment)
+
+
+# WHOLE PIPELINE
+
+# Run all of DM preprocessing for a simulation, writing the sbatch scripts of every stage
+# Scripts are only submitted to the cluster when submit is True (None asks the user instead)
+def preprocess(paths, isotopes=None, submit=False):
+	import dm_preprocess
+	if isotopes is None:
+		isotopes = sn.get_list(sn.ISOTOPES_FILE)
+	return dm_preprocess.preprocess(paths, isotopes, submit)
+
+# Run all of DM postprocessing for a simulation
+# With confirm=True, the user is asked before continuing after each stage, like the old script
+# The cache argument is anything open_cache accepts, e.g., True for the simulation's own cache
+# With incremental=True, the total yields come from saved per-file partials of the HDF5 data
+# instead of the burn_query outputs, and only new or changed HDF5 files are scanned
+def postprocess(paths, abundances, confirm=False, budget=None, cache=None, incremental=False,
+	workers=None):
+	# Check that the preprocessing directories exist and make the postprocessing ones
+	paths = sn.check_dirs(paths, sn.PRE_DIRECTORIES)
+	paths = sn.make_dirs(paths, sn.POST_DIRECTORIES)
+	sn.sbatch_cleanup(paths)
+	cache = open_cache(paths, cache)
+	incremental = incremental and "hdf5" in paths
+	if incremental:
+		# Total yields (updated with the unburned particles) come from the HDF5 partials
+		from incremental_yields import total_yields, DEFAULT_WORKERS
+		total_yields(paths, workers=(DEFAULT_WORKERS if workers is None else workers),
+			budget=budget, cache=cache)
+		checkpoint(confirm)
+	else:
+		# Total yields come from the burn_query outputs
+		yields_path = analysis_file(paths, YIELDS_END)
+		extract_yields(paths["sbatch"], yields_path, cache)
+		checkpoint(confirm)
+	# Update the total yields with the unburned particles, if there is SDF and HDF5 data
+	if not incremental and "sdf" in paths and "hdf5" in paths:
+		unburned = glob.glob(os.path.join(paths["sdf"], "*.unburned.out"))
+		if len(unburned) > 1:
+			raise IOError("matched %d .unburned.out files" % (len(unburned)))
+		pids_path = os.path.join(paths["hdf5"], sim_name(paths) + "_pids.out")
+		final_sdf = os.path.join(paths["sdf"], sn.sdf_list(paths, mode="last"))
+		update_yields(yields_path, pids_path, (unburned[0] if unburned else None), final_sdf,
+			budget=budget, cache=cache)
+		checkpoint(confirm)
+	# Sort the burn_query outputs and compile the plotting values
+	sort_queries(paths["queries"], paths["sorted_queries"], cache)
+	checkpoint(confirm)
+	write_plotting(paths, abundances, budget=budget, cache=cache)
+	print "\nFinished!"
+	return paths
@@ -0,0 +1,273 @@
+# Vectorized, chunked reductions over the SDF files and abundance data of one simulation
+# These do the same jobs as write_particles in dm_postprocess.py and the update_yields program
+# Particles are handled in blocks of consecutive IDs whose size comes from a memory budget
+# Every input is memory-mapped and only the rows for the current block are ever read
+# With no memory budget, all particles are handled in a single block (in-memory mode)
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	final = SDFFile("sn_data/jet3b/sdf/run1.09999")
+#	nz, nn, grams = unburned_yields(final, load_pid_list("sn_data/jet3b/hdf5/jet3b_pids.out"), "2G")
+# To total up the jet3b unburned yields while holding about 2 GB in memory at most
+
+import os
+
+import numpy as np
+
+import sn_utils as sn
+from chunking import chunk_rows, row_chunks
+
+# Header columns of the plotting file, before the abundance columns are added
+PLOTTING_COLUMNS = ["id", "x", "y", "z", "vx", "vy", "vz", "ax", "ay", "az", "mass", "h",
+	"density", "peak temp", "peak density", "Y_{e}"]
+# Output format used for every floating point value
+# The old plotting file passed the entropy outfiles' %g text (6 significant figures) through
+# str(), but these values come from the SDF binaries at full precision, so the numbers now differ
+# from the old file in the last digits (e.g., "1" instead of "1.0", 12 figures instead of 6)
+# while matching it to within the %g rounding; compare plotting files numerically, not as text
+FLOAT_FORMAT = "%.12g"
+# Number of lines to parse at once when converting a particle ID list
+PID_BLOCK = 100000
+
+
+# PARTICLE ID LISTS
+
+# Return the sorted particle IDs listed in a file written by hdf5_pid_list
+# The list is converted once into a .npy file beside the original, then memory-mapped
+def load_pid_list(filename):
+	# Reuse the converted copy as long as it is newer than the list itself
+	npy_name = filename + ".npy"
+	if os.path.isfile(npy_name) and os.path.getmtime(npy_name) >= os.path.getmtime(filename):
+		return np.load(npy_name, mmap_mode='r')
+	with open(filename, 'r') as pid_file:
+		# The first line states how many IDs follow, e.g., "n_ids=1000000"
+		first = pid_file.readline().strip()
+		if not first.startswith("n_ids="):
+			raise ValueError("particle IDs file %s has no n_ids line" % (filename))
+		n_ids = int(first[len("n_ids="):])
+		# Copy the IDs into a .npy file on disk a block of lines at a time
+		ids = np.lib.format.open_memmap(npy_name, mode="w+", dtype=np.int64, shape=(n_ids,))
+		count, block = 0, []
+		for line in pid_file:
+			if line.strip() == "":
+				continue
+			block.append(int(line))
+			if len(block) == PID_BLOCK:
+				ids[count:count+len(block)] = block
+				count, block = count + len(block), []
+		ids[count:count+len(block)] = block
+		count += len(block)
+	# Check the number of IDs against the count that the file claims
+	if count != n_ids:
+		raise ValueError("file %s lists %d IDs, expected %d" % (filename, count, n_ids))
+	ids.flush()
+	del ids
+	return np.load(npy_name, mmap_mode='r')
+
+# Return a boolean array saying which of the sorted IDs appear in a sorted ID list
+def is_listed(ids, id_list):
+	# Only the part of the list covering the range of these IDs is looked at
+	if len(ids) == 0 or len(id_list) == 0:
+		return np.zeros(len(ids), dtype=bool)
+	lo = np.searchsorted(id_list, ids[0], side="left")
+	hi = np.searchsorted(id_list, ids[-1], side="right")
+	part = np.asarray(id_list[lo:hi])
+	if len(part) == 0:
+		return np.zeros(len(ids), dtype=bool)
+	pos = np.minimum(np.searchsorted(part, ids), len(part) - 1)
+	return part[pos] == ids
+
+
+# JOINS
+
+# Split an SDF file into blocks of particles, yielding each block's sorted particle IDs
+# The rows per block is worked out from the budget and the bytes that each row will cost
+def id_blocks(sdf, budget, bytes_per_row):
+	# Work out the block size in rows (None for a single block)
+	rows = chunk_rows(budget, bytes_per_row)
+	for start, stop in row_chunks(sdf.n_rows, rows):
+		ids = sdf.read("ident", start, stop).astype(np.int64)
+		# The join logic below relies on every file being sorted by particle ID
+		if np.any(ids[1:] <= ids[:-1]):
+			raise ValueError("repeated or unsorted IDs in file %s" % (sdf.filename))
+		yield start, stop, ids
+
+# Look up the given sorted particle IDs in an SDF file and read the named fields for them
+# Returns a dict of field arrays (zero where missing) and a mask of which IDs were found
+def gather(sdf, ids, names):
+	# Nothing to look up in an empty block
+	if len(ids) == 0:
+		return dict((name, np.zeros(0)) for name in names), np.zeros(0, dtype=bool)
+	# Find the rows of the file that cover this range of IDs, and read their IDs
+	lo, hi = sdf.id_range(ids[0], ids[-1])
+	file_ids = sdf.read("ident", lo, hi).astype(np.int64)
+	if np.any(file_ids[1:] <= file_ids[:-1]):
+		raise ValueError("repeated or unsorted IDs in file %s" % (sdf.filename))
+	# Match the requested IDs against the IDs actually in the file
+	if len(file_ids) == 0:
+		found = np.zeros(len(ids), dtype=bool)
+		pos = np.zeros(len(ids), dtype=np.int64)
+	else:
+		pos = np.minimum(np.searchsorted(file_ids, ids), len(file_ids) - 1)
+		found = file_ids[pos] == ids
+	# Read each field for the covered rows and pick out the matched ones
+	values = {}
+	for name in names:
+		field = np.zeros(len(ids))
+		if len(file_ids) > 0:
+			field[found] = sdf.read(name, lo, hi)[pos[found]]
+		values[name] = field
+	return values, found
+
+# Read the named fields of an SDF file at the given rows, where -1 marks an absent particle
+# This is the gather used with an alignment index, so the file does not need to be sorted
+# Returns a dict of field arrays (zero where absent) and a mask of which rows were present
+def gather_rows(sdf, rows, names):
+	rows = np.asarray(rows)
+	found = rows >= 0
+	# Read the present rows in increasing order so the memory map is walked front to back
+	order = np.argsort(rows[found], kind="mergesort")
+	sorted_rows = rows[found][order]
+	values = {}
+	for name in names:
+		field = np.zeros(len(rows))
+		picked = np.empty(len(sorted_rows))
+		picked[order] = sdf.column(name)[sorted_rows]
+		field[found] = picked
+		values[name] = field
+	return values, found
+
+
+# REDUCTIONS
+
+# Find the peak temperature of each particle over the early SDF files and its density then
+# With require_all, this follows get_peaks in dm_postprocess.py and returns zeros for any
+# particle missing from a file; otherwise the peak is taken over the files that have it
+# The rows argument can give the (IDs, files) block of an alignment index to gather from
+# Also returns the number of early files each particle was missing from
+def peak_reduction(early, ids, rows=None, require_all=True):
+	# Start the running peaks below any real temperature
+	peak_temp = np.full(len(ids), -np.inf)
+	peak_rho = np.zeros(len(ids))
+	missing = np.zeros(len(ids), dtype=np.int64)
+	# Fold in one early file at a time
+	for j, sdf in enumerate(early):
+		if rows is None:
+			values, found = gather(sdf, ids, ["temp", "rho"])
+		else:
+			values, found = gather_rows(sdf, rows[:, j], ["temp", "rho"])
+		missing += ~found
+		# Keep the first occurrence of the peak, like max() does in get_peaks
+		higher = found & (values["temp"] > peak_temp)
+		peak_temp[higher] = values["temp"][higher]
+		peak_rho[higher] = values["rho"][higher]
+	# Zero out the peaks of particles that never showed up at all
+	lost = (missing > 0) if require_all else (missing == len(early))
+	peak_temp[lost] = 0.0
+	peak_rho[lost] = 0.0
+	return peak_temp, peak_rho, missing
+
+# Sum the stored mass fractions of the given isotopes for each of a block of sorted IDs
+def abundance_sums(store, isotopes, ids):
+	# Accumulate the total mass fraction of every particle in the block
+	total = np.zeros(len(ids))
+	if len(ids) == 0:
+		return total
+	for isotope in isotopes:
+		pids, fmass = store.get(isotope)
+		# Only the part of the isotope's sparse arrays within the block's ID range is read
+		lo = np.searchsorted(pids, ids[0], side="left")
+		hi = np.searchsorted(pids, ids[-1], side="right")
+		if hi == lo:
+			continue
+		part_ids, part_fmass = np.asarray(pids[lo:hi]), np.asarray(fmass[lo:hi])
+		# Add each stored mass fraction onto its particle (IDs not in the block are skipped)
+		pos = np.minimum(np.searchsorted(ids, part_ids), len(ids) - 1)
+		match = ids[pos] == part_ids
+		total += np.bincount(pos[match], weights=part_fmass[match], minlength=len(ids))
+	return total
+
+# Total up the unburned yields in grams from the final SDF file, like update_yields does
+# Particles whose IDs appear in the sorted burned_ids list (processed by Burn) are excluded
+# Returns the nz and nn arrays of the SNSPH network isotopes and the mass of each in grams
+def unburned_yields(final, burned_ids, budget=None):
+	# Identify the network isotopes and the fields holding their mass fractions
+	nz, nn = final.network()
+	fields = final.network_fields()
+	totals = np.zeros(len(fields))
+	# Each row costs the SDF record plus the gathered mass fractions
+	for start, stop, ids in id_blocks(final, budget, final.row_bytes() + 8 * len(fields)):
+		# Only particles never processed by Burn count toward the unburned yields
+		unburned = ~is_listed(ids, burned_ids)
+		mass = final.read("mass", start, stop)[unburned].astype(np.float64)
+		for i, field in enumerate(fields):
+			totals[i] += np.dot(mass, final.read(field, start, stop)[unburned])
+	# Convert the totals from SNSPH mass units to grams
+	return nz, nn, totals * sn.SNSPH_MASS
+
+
+# EXPORTS
+
+# Write the particle plotting file straight from the SDF files and the abundance store
+# The columns and unit conversions are the same as write_particles in dm_postprocess.py, but the
+# values are written at full precision with FLOAT_FORMAT rather than as the entropy outfile text
+# Arguments are the opened first, last, and early SDF files, the store, and the abundance targets
+# An alignment index covering all of the files can be given to gather rows through it
+def write_plotting(initial, final, early, store, abundances, outname, columns_name=None,
+	budget=None, alignment=None):
+	# Print a quick progress message for the user
+	print "\nCompiling simulation plotting values"
+	# Work out which stored isotopes make up each abundance target
+	targets = [(target, store.expand([target])) for target in abundances]
+	header = PLOTTING_COLUMNS + ["X_{%s}" % (target) for target in abundances]
+	# Each row costs a record from every SDF file read, plus the output columns
+	bytes_per_row = sum(sdf.row_bytes() for sdf in [initial, final] + list(early))
+	bytes_per_row += 8 * len(header) * 2
+	# Find the index columns of the first file followed by the early files
+	if alignment is not None:
+		columns = alignment.columns_of([sdf.filename for sdf in [initial] + list(early)])
+	# Format each line as an integer ID followed by all the float values
+	line_format = ", ".join(["%d"] + [FLOAT_FORMAT] * (len(header) - 1))
+	with open(outname, 'w') as outfile:
+		outfile.write(", ".join(header) + '\n')
+		for start, stop, ids in id_blocks(final, budget, bytes_per_row):
+			# Print an incremental progress message based on the block's first ID
+			if len(ids) > 0:
+				print "Compiling values for particle IDs %d to %d" % (ids[0], ids[-1])
+			# Read the final timestep values and convert them to CGS units
+			block = np.empty((len(ids), len(header)))
+			block[:, 0] = ids
+			for c, name in enumerate(("x", "y", "z"), 1):
+				block[:, c] = final.read(name, start, stop) * sn.SNSPH_LENGTH
+			for c, name in enumerate(("vx", "vy", "vz"), 4):
+				block[:, c] = final.read(name, start, stop) * sn.SNSPH_VELOCITY
+			for c, name in enumerate(("ax", "ay", "az"), 7):
+				block[:, c] = final.read(name, start, stop) * sn.SNSPH_ACCELERATION
+			block[:, 10] = final.read("mass", start, stop) * sn.SNSPH_MASS
+			block[:, 11] = final.read("h", start, stop) * sn.SNSPH_LENGTH
+			block[:, 12] = final.read("rho", start, stop) * sn.SNSPH_DENSITY
+			# Look up the rows of these particles in every file when there is an index
+			# Particles born after the indexed files are absent from all of them, so get zero peaks
+			rows = None
+			if alignment is not None:
+				rows = alignment.rows_of(ids, columns)
+			# Peak temperatures and densities come from the early files
+			peak_temp, peak_rho, missing = peak_reduction(early, ids,
+				(None if rows is None else rows[:, 1:]))
+			block[:, 13] = peak_temp
+			block[:, 14] = peak_rho * sn.SNSPH_DENSITY
+			# The progenitor electron fraction comes from the first file (zero if missing)
+			if rows is None:
+				values, found = gather(initial, ids, ["Y_el"])
+			else:
+				values, found = gather_rows(initial, rows[:, 0], ["Y_el"])
+			block[:, 15] = values["Y_el"]
+			# Finally, the summed abundances of each target
+			for c, (target, isotopes) in enumerate(targets, len(PLOTTING_COLUMNS)):
+				block[:, c] = abundance_sums(store, isotopes, ids)
+			np.savetxt(outfile, block, fmt=line_format)
+	# Also write the list of column names, one per line
+	if columns_name is not None:
+		with open(columns_name, 'w') as columns:
+			columns.write('\n'.join(header) + '\n')
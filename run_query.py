@@ -2,8 +2,9 @@
 
 # Wrapper for burn_query that takes arguments from command line for a single isotope query
 # Eventually, I hope to just rewrite burn_query's interface, but this will help out for now
+# Importing this file has no side effects, so pipeline.burn_query can reuse its helpers
 
-# Last edited 11 Jan 2021 by Greg Vance
+# Last edited 19 Oct 2026 by Greg Vance
 
 # Example usage:
 #	./run_query.py -i 26Al -a 6 -o 26Al.out jet3b/j3b.dir/*.h5
@@ -16,6 +17,7 @@ import subprocess
 import math
 
 from sn_utils import nn_nz
+import telemetry
 
 # User's home directory
 HOME_DIR = os.path.expanduser("~")
@@ -28,7 +30,11 @@ def main():
 	# Translate the arguments into the sequence of inputs that burn_query expects
 	inputs = make_inputs(args.isotope, args.abundance, args.outfile)
 	# Pass the HDF5 files to burn_query and send the options as a fake input file
-	run_burn_query(args.hdf5, inputs)
+	telemetry.start_run("run_query")
+	with telemetry.stage("burn_query", [args.outfile], isotope=args.isotope) as record:
+		record["bytes_read"] = sum(os.path.getsize(f) for f in args.hdf5)
+		run_burn_query(args.hdf5, inputs)
+	telemetry.end_run()
 
 def parse_args():
 	# Create a new argument parser object
@@ -117,5 +123,6 @@ def run_burn_query(hdf5, inputs):
 	# Communicate with the subprocess to send the sequence of inputs it requires
 	query.communicate(inputs)
 
-main()
+if __name__ == "__main__":
+	main()
 
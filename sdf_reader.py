@@ -0,0 +1,195 @@
+# Python reader for SNSPH SDF files that works straight off the binary data
+# The ASCII header of each SDF file is parsed for its scalar values and particle struct
+# The particle data is then memory-mapped as a NumPy structured array, so nothing is read
+# until it is used, and any column can be pulled out for any block of particles
+# This handles both the older 22-species (jet3b-style) and the cco2 20-species layouts
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	sdf = SDFFile("sn_data/jet3b/sdf/run1.00100")
+#	temp = sdf.read("temp", 0, 100000)
+# To read the temperatures of the first 100,000 particles in that SDF file
+
+import os
+import re
+
+import numpy as np
+
+import telemetry
+
+# The line that marks the end of the ASCII header in every SDF file
+END_OF_HEADER = b"\n# SDF-EOH"
+# How much of the file to search for the end of the header
+HEADER_SEARCH = 10**6
+
+# NumPy type codes for the C types that can appear in SDF struct declarations
+C_TYPES = {
+	"double": "f8",
+	"float": "f4",
+	"int": "i4",
+	"unsigned int": "u4",
+	"long": "i8",
+	"unsigned long": "u8",
+	"int64_t": "i8",
+	"short": "i2",
+	"char": "i1",
+}
+
+# Byte order markers that may be declared as "parameter byteorder" in the header
+BYTE_ORDERS = {0x78563412: "<", 0x12345678: ">"}
+
+# The identities of the 20 network isotopes in the cco2 SDF files (see cco2-unburned.c)
+# These files do not store them per particle like the 22-species files do
+CCO2_NZ = (6, 8, 10, 12, 14, 15, 16, 18, 20, 20, 21, 22, 24, 26, 26, 27, 28, 0, 1, 2)
+CCO2_NN = (6, 8, 10, 12, 14, 16, 16, 18, 20, 24, 23, 22, 24, 26, 30, 29, 28, 1, 0, 2)
+# Only the first 20 isotopes are real for the 22-species files (see unburned.c)
+SNSPH_NETWORK = 20
+
+# Regular expressions for picking apart the ASCII header
+STRUCT_PATTERN = re.compile(r"struct\s*\{(.*?)\}\s*\[\s*([0-9]*)\s*\]\s*;", re.DOTALL)
+SCALAR_PATTERN = re.compile(r"^\s*(?:parameter\s+)?([A-Za-z_ ]+?)\s+([A-Za-z_][A-Za-z0-9_]*)"
+	r"\s*=\s*([^;]+);", re.MULTILINE)
+COMMENT_PATTERN = re.compile(r"/\*.*?\*/", re.DOTALL)
+
+
+# Parse the struct declaration text from an SDF header into a list of (name, type code)
+def parse_struct(text):
+	# Remove any C comments before splitting up the declarations
+	text = COMMENT_PATTERN.sub("", text)
+	fields = []
+	for declaration in text.split(";"):
+		declaration = declaration.strip()
+		if declaration == "":
+			continue
+		# The type is everything before the first field name, e.g., "unsigned int"
+		match = re.match(r"\A(unsigned\s+\w+|\w+)\s+(.*)\Z", declaration, re.DOTALL)
+		if not match or " ".join(match.group(1).split()) not in C_TYPES:
+			raise ValueError("unknown SDF struct declaration %s" % (repr(declaration)))
+		code = C_TYPES[" ".join(match.group(1).split())]
+		# Several fields can share a declaration, separated by commas
+		for name in match.group(2).split(","):
+			fields.append((name.strip(), code))
+	return fields
+
+# Convert a scalar value from the header into an int, float, or string as appropriate
+def parse_value(value):
+	# Try the most specific type first (int(value, 0) handles hex like the byte order)
+	for convert in (lambda v : int(v, 0), float):
+		try:
+			return convert(value)
+		except ValueError:
+			pass
+	# Anything else is kept as a string without its quotes
+	return value.strip('"')
+
+# Read and parse the ASCII header of an SDF file
+# Returns the data offset in bytes, a dict of the scalar values, the struct fields, and the count
+def read_header(filename):
+	# Read the start of the file, which holds the whole header
+	with open(filename, "rb") as sdf:
+		start = sdf.read(HEADER_SEARCH)
+	# Find the end-of-header marker and skip past the rest of that line
+	end = start.find(END_OF_HEADER)
+	if end == -1:
+		raise IOError("no SDF-EOH marker found in file %s" % (filename))
+	offset = start.index(b"\n", end + len(END_OF_HEADER)) + 1
+	header = start[:end].decode("ascii", "replace")
+	# Pull out the scalar declarations like "float tpos = 0.52;"
+	scalars = {}
+	for match in SCALAR_PATTERN.finditer(header):
+		scalars[match.group(2)] = parse_value(match.group(3).strip())
+	# Pull out the particle struct and the declared particle count, if any
+	match = STRUCT_PATTERN.search(header)
+	if not match:
+		raise IOError("no particle struct found in SDF header of %s" % (filename))
+	fields = parse_struct(match.group(1))
+	count = (int(match.group(2)) if match.group(2) != "" else None)
+	return offset, scalars, fields, count
+
+
+# Memory-mapped view of the particles in one SDF file
+class SDFFile(object):
+	# Open the file and work out the layout of its particle data
+	def __init__(self, filename):
+		# Store the name of the file as an attribute
+		self.filename = filename
+		# Parse the header for the data offset, scalar values, and particle layout
+		self.offset, self.scalars, fields, count = read_header(filename)
+		# Use the declared byte order, or assume the usual little-endian data
+		order = BYTE_ORDERS.get(self.scalars.get("byteorder"), "<")
+		names = [name for name, code in fields]
+		formats = [order + code for name, code in fields]
+		packed = np.dtype({"names": names, "formats": formats})
+		# Work out the size of each record from the file size, allowing for C struct padding
+		data_bytes = os.path.getsize(filename) - self.offset
+		if count is None:
+			count = self.scalars.get("npart")
+		if count:
+			itemsize = data_bytes // count
+		elif data_bytes % packed.itemsize == 0:
+			itemsize = packed.itemsize
+		else:
+			itemsize = -(-packed.itemsize // 8) * 8
+		if itemsize < packed.itemsize:
+			raise IOError("SDF file %s is shorter than its header declares" % (filename))
+		self.dtype = np.dtype({"names": names, "formats": formats,
+			"offsets": [packed.fields[name][1] for name in names],
+			"itemsize": itemsize})
+		# The number of particles is however many whole records fit in the data
+		self.n_rows = data_bytes // itemsize
+		# The memory map is opened on first use
+		self._data = None
+	# Return the names of all the particle fields in the file
+	@property
+	def names(self):
+		return list(self.dtype.names)
+	# Return the value of tpos declared in the header
+	@property
+	def tpos(self):
+		if "tpos" not in self.scalars:
+			raise IOError("no tpos value found in file %s" % (self.filename))
+		return float(self.scalars["tpos"])
+	# Return the structured memory map of all the particles
+	def data(self):
+		if self._data is None:
+			self._data = np.memmap(self.filename, dtype=self.dtype, mode="r",
+				offset=self.offset, shape=(self.n_rows,))
+		return self._data
+	# Check whether the file has the named particle field
+	def has_column(self, name):
+		return name in self.dtype.names
+	# Return a memory-mapped view of one particle field
+	def column(self, name):
+		if name not in self.dtype.names:
+			raise KeyError("no field %s in SDF file %s" % (repr(name), self.filename))
+		return self.data()[name]
+	# Read rows start to stop of one field into an ordinary array
+	def read(self, name, start=0, stop=None):
+		values = np.array(self.column(name)[start:stop])
+		telemetry.count(bytes_read=values.nbytes)
+		return values
+	# Return the number of bytes in each particle record
+	def row_bytes(self):
+		return self.dtype.itemsize
+	# Return the (nz, nn) arrays identifying the network isotopes f1, f2, ... in this file
+	def network(self):
+		# The 22-species files store the proton and neutron numbers with each particle
+		if self.has_column("p1"):
+			first = self.data()[0]
+			nz = np.array([first["p%d" % (i)] for i in range(1, SNSPH_NETWORK + 1)])
+			nn = np.array([first["m%d" % (i)] for i in range(1, SNSPH_NETWORK + 1)])
+			return nz, nn
+		# The cco2-style files need the inferred isotope list
+		return np.array(CCO2_NZ), np.array(CCO2_NN)
+	# Return the names of the mass fraction fields that match the network isotopes
+	def network_fields(self):
+		return ["f%d" % (i) for i in range(1, SNSPH_NETWORK + 1)]
+	# Find the range of rows holding particle IDs lo through hi (the ident field must be sorted)
+	def id_range(self, lo, hi):
+		ident = self.column("ident")
+		return (int(np.searchsorted(ident, lo, side="left")),
+			int(np.searchsorted(ident, hi, side="right")))
+	# Release the memory map
+	def close(self):
+		self._data = None
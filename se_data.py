@@ -0,0 +1,295 @@
+# Python access to the SE HDF5 files written by Burn, returning NumPy arrays
+# Mirrors what burn_query.c does through the SE library (see se_notes.txt): the network's "nz" and
+# "nn" arrays are file attributes, and every particle is a cycle holding its "mass" and its
+# "fmass" array of mass fractions, one per species in the network
+# Particles are read a block at a time into 2D (particles, species) arrays sized from a memory
+# budget, so engines written in Python can work on the fmass data without any text files
+# The reads go through one of three interchangeable backends:
+#	LibSE     ctypes binding to the SE library itself (SEopen, SEncycles, SEcycles,
+#	          SEreadIArrayAttr, SEreadDArrayAttr, SEreadDAttr, SEclose)
+#	H5py      reads the same layout with h5py, for machines without the SE library
+#	Memory    pure-Python stand-in serving arrays registered under file names, for tests
+# The default is LibSE when the library loads and H5py otherwise, or whatever DM_SE_BACKEND names
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	with SEFile("sn_data/jet3b/hdf5/jet3b.0000.h5") as se:
+#		for pids, mass, fmass in se.blocks("2G"):
+# To step through the masses and mass fractions of every particle in one HDF5 file
+# To read through the SE library at a given path, set SE_LIBRARY=~/se/lib/libse.so
+
+import os
+import re
+import ctypes
+import ctypes.util
+
+import numpy as np
+
+from chunking import chunk_rows, row_chunks
+
+# Pattern of the names of the cycle groups, which hold one particle each
+CYCLE_PATTERN = re.compile(r"\Acycle(\d+)\Z")
+# Format of the name of the cycle group of a particle ID
+CYCLE_FORMAT = "cycle%010d"
+# Environment variables naming the backend to use and the SE shared library to load
+BACKEND_VARIABLE = "DM_SE_BACKEND"
+LIBRARY_VARIABLE = "SE_LIBRARY"
+# Places the SE shared library is looked for if SE_LIBRARY is not set
+LIBRARY_PATHS = [os.path.join(os.path.expanduser("~"), "se", d, "libse.so")
+	for d in ("lib", "include", "src")]
+
+
+# Column of every species of the network in a 2D fmass array, keyed by (nz, nn)
+def species_columns(nz, nn):
+	return dict(((int(z), int(n)), k) for k, (z, n) in enumerate(zip(nz, nn)))
+
+
+# BACKENDS
+
+# Every backend opens files into handles and reads through them with the SE library's calls
+# The batched fmass read fills the rows of a preallocated 2D array, one row per cycle
+
+# ctypes binding to the SE library
+class LibSE:
+	name = "libse"
+	def __init__(self, path=None):
+		if path is None:
+			path = os.environ.get(LIBRARY_VARIABLE)
+		if path is None:
+			found = [p for p in LIBRARY_PATHS if os.path.isfile(p)]
+			path = (found[0] if found else ctypes.util.find_library("se"))
+		if path is None:
+			raise OSError("SE library not found; set %s to the path of libse.so" %
+				(LIBRARY_VARIABLE))
+		self.path = path
+		self.lib = lib = ctypes.CDLL(path)
+		self.libc = ctypes.CDLL(ctypes.util.find_library("c"))
+		self.libc.free.argtypes = [ctypes.c_void_p]
+		self.libc.free.restype = None
+		int_p, double_p = ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_double)
+		lib.SEopen.argtypes = [ctypes.c_char_p]
+		lib.SEopen.restype = ctypes.c_int
+		lib.SEclose.argtypes = [ctypes.c_int]
+		lib.SEclose.restype = None
+		lib.SEncycles.argtypes = [ctypes.c_int]
+		lib.SEncycles.restype = ctypes.c_int
+		lib.SEcycles.argtypes = [ctypes.c_int, int_p, ctypes.c_int]
+		lib.SEcycles.restype = None
+		lib.SEreadIArrayAttr.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_char_p,
+			ctypes.POINTER(int_p), int_p]
+		lib.SEreadIArrayAttr.restype = None
+		lib.SEreadDArrayAttr.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_char_p,
+			ctypes.POINTER(double_p), int_p]
+		lib.SEreadDArrayAttr.restype = None
+		lib.SEreadDAttr.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_char_p]
+		lib.SEreadDAttr.restype = ctypes.c_double
+	def open(self, filename):
+		handle = self.lib.SEopen(filename.encode("utf-8"))
+		if handle < 0:
+			raise IOError("SEopen failed on %s" % (filename))
+		return handle
+	def close(self, handle):
+		self.lib.SEclose(handle)
+	def ncycles(self, handle):
+		return self.lib.SEncycles(handle)
+	def cycles(self, handle):
+		cycles = np.zeros(self.ncycles(handle), dtype=np.intc)
+		self.lib.SEcycles(handle, cycles.ctypes.data_as(ctypes.POINTER(ctypes.c_int)),
+			len(cycles))
+		return cycles.astype(np.int64)
+	# Read an int array attribute, copying it out of the buffer that the library allocates
+	def iarray_attr(self, handle, cycle, name):
+		buf, n = ctypes.POINTER(ctypes.c_int)(), ctypes.c_int(0)
+		self.lib.SEreadIArrayAttr(handle, cycle, name.encode("utf-8"), ctypes.byref(buf),
+			ctypes.byref(n))
+		values = np.ctypeslib.as_array(buf, shape=(n.value,)).astype(np.int64)
+		self.libc.free(buf)
+		return values
+	def darray_attr(self, handle, cycle, name):
+		buf, n = ctypes.POINTER(ctypes.c_double)(), ctypes.c_int(0)
+		self.lib.SEreadDArrayAttr(handle, cycle, name.encode("utf-8"), ctypes.byref(buf),
+			ctypes.byref(n))
+		values = np.ctypeslib.as_array(buf, shape=(n.value,)).copy()
+		self.libc.free(buf)
+		return values
+	def dattr(self, handle, cycle, name):
+		return self.lib.SEreadDAttr(handle, cycle, name.encode("utf-8"))
+	# Fill the rows of a C-ordered 2D array with one double array attribute of each cycle,
+	# copying every buffer straight into its row without any intermediate arrays
+	def read_rows(self, handle, cycles, name, out):
+		buf, n = ctypes.POINTER(ctypes.c_double)(), ctypes.c_int(0)
+		key = name.encode("utf-8")
+		width = out.shape[1]
+		row_bytes = out.strides[0]
+		base = out.ctypes.data
+		for i, cycle in enumerate(cycles):
+			self.lib.SEreadDArrayAttr(handle, int(cycle), key, ctypes.byref(buf), ctypes.byref(n))
+			if n.value != width:
+				self.libc.free(buf)
+				raise ValueError("particle %d: %d %s values for %d species" % (cycle, n.value,
+					name, width))
+			ctypes.memmove(base + i * row_bytes, buf, width * 8)
+			self.libc.free(buf)
+		return out
+
+# Reads the SE layout with h5py, for machines without the SE library
+class H5py:
+	name = "h5py"
+	def __init__(self):
+		import h5py
+		self.h5py = h5py
+	def open(self, filename):
+		return self.h5py.File(filename, 'r')
+	def close(self, handle):
+		handle.close()
+	def ncycles(self, handle):
+		return len(self.cycles(handle))
+	def cycles(self, handle):
+		ids = [int(match.group(1)) for match in
+			(CYCLE_PATTERN.match(name) for name in handle.keys()) if match]
+		return np.sort(np.array(ids, dtype=np.int64))
+	# Cycle -1 means the file itself, as in the SE library
+	def _attrs(self, handle, cycle):
+		return (handle.attrs if cycle < 0 else handle[CYCLE_FORMAT % (cycle)].attrs)
+	def iarray_attr(self, handle, cycle, name):
+		return np.asarray(self._attrs(handle, cycle)[name], dtype=np.int64)
+	def darray_attr(self, handle, cycle, name):
+		return np.asarray(self._attrs(handle, cycle)[name], dtype=float)
+	def dattr(self, handle, cycle, name):
+		return float(self._attrs(handle, cycle)[name])
+	def read_rows(self, handle, cycles, name, out):
+		width = out.shape[1]
+		for i, cycle in enumerate(cycles):
+			values = self._attrs(handle, int(cycle))[name]
+			if len(values) != width:
+				raise ValueError("particle %d: %d %s values for %d species" % (cycle,
+					len(values), name, width))
+			out[i] = values
+		return out
+
+# Pure-Python stand-in that serves arrays registered under file names, for tests
+# Nothing is read from disk, so file names only need to be registered, not to exist
+class Memory:
+	name = "memory"
+	def __init__(self):
+		self.files = {}
+	# Register the contents of a file: its network and each particle's ID, mass, and fmass
+	def add_file(self, filename, nz, nn, pids, mass, fmass):
+		order = np.argsort(pids, kind="mergesort")
+		self.files[filename] = {"nz": np.asarray(nz, dtype=np.int64),
+			"nn": np.asarray(nn, dtype=np.int64), "cycles": np.asarray(pids, dtype=np.int64)[order],
+			"mass": np.asarray(mass, dtype=float)[order],
+			"fmass": np.asarray(fmass, dtype=float)[order]}
+	def open(self, filename):
+		if filename not in self.files:
+			raise IOError("no file %s registered in the memory backend" % (filename))
+		return self.files[filename]
+	def close(self, handle):
+		pass
+	def ncycles(self, handle):
+		return len(handle["cycles"])
+	def cycles(self, handle):
+		return handle["cycles"].copy()
+	def _row(self, handle, cycle):
+		row = np.searchsorted(handle["cycles"], cycle)
+		if row == len(handle["cycles"]) or handle["cycles"][row] != cycle:
+			raise KeyError("no cycle %d" % (cycle))
+		return row
+	def iarray_attr(self, handle, cycle, name):
+		return handle[name].copy()
+	def darray_attr(self, handle, cycle, name):
+		return handle[name][self._row(handle, cycle)].copy()
+	def dattr(self, handle, cycle, name):
+		return float(handle[name][self._row(handle, cycle)])
+	def read_rows(self, handle, cycles, name, out):
+		rows = np.searchsorted(handle["cycles"], cycles)
+		out[:len(cycles)] = handle[name][rows]
+		return out
+
+# Backend classes by name, and the backends already made in this process
+BACKENDS = {"libse": LibSE, "h5py": H5py, "memory": Memory}
+_BACKENDS = {}
+
+# Return the backend with a given name (made once per process), or the default backend
+def get_backend(name=None):
+	if name is None:
+		name = os.environ.get(BACKEND_VARIABLE, "").strip() or None
+	if name is None:
+		# Fall back on h5py when the SE library is not installed
+		try:
+			return get_backend("libse")
+		except OSError:
+			return get_backend("h5py")
+	if name not in BACKENDS:
+		raise ValueError("unknown SE backend %s" % (repr(name)))
+	if name not in _BACKENDS:
+		_BACKENDS[name] = BACKENDS[name]()
+	return _BACKENDS[name]
+
+
+# FILES
+
+# One SE HDF5 file opened for reading
+class SEFile:
+	# Open a file and read its network
+	def __init__(self, filename, backend=None):
+		self.filename = filename
+		self.backend = (get_backend(backend) if backend is None or
+			isinstance(backend, basestring) else backend)
+		self.handle = self.backend.open(filename)
+		self.nz = self.backend.iarray_attr(self.handle, -1, "nz")
+		self.nn = self.backend.iarray_attr(self.handle, -1, "nn")
+		self.n_species = len(self.nz)
+		self._cycles = None
+	def __enter__(self):
+		return self
+	def __exit__(self, *exc):
+		self.close()
+	def close(self):
+		self.backend.close(self.handle)
+	# Return the sorted particle IDs of every cycle in the file
+	def cycles(self):
+		if self._cycles is None:
+			self._cycles = np.sort(self.backend.cycles(self.handle))
+		return self._cycles
+	# Return the number of particles in the file
+	def ncycles(self):
+		return len(self.cycles())
+	# Return the masses of some particles
+	def masses(self, cycles):
+		return np.array([self.backend.dattr(self.handle, int(c), "mass") for c in cycles],
+			dtype=float)
+	# Fill a (particles, species) array with the mass fractions of some particles and return it
+	# A preallocated C-ordered array with room for at least len(cycles) rows avoids allocating
+	def fmass(self, cycles, out=None):
+		if out is None:
+			out = np.empty((len(cycles), self.n_species), dtype=float)
+		if out.shape[0] < len(cycles) or out.shape[1] != self.n_species or \
+			not out.flags.c_contiguous or out.dtype != np.float64:
+			raise ValueError("fmass output array must be C-ordered float64 with shape (>=%d, %d)"
+				% (len(cycles), self.n_species))
+		self.backend.read_rows(self.handle, cycles, "fmass", out)
+		return out[:len(cycles)]
+	# Return the number of particles to read per block for a memory budget
+	def block_rows(self, budget=None):
+		return chunk_rows(budget, 8 * (self.n_species + 2))
+	# Generate (pids, mass, fmass) blocks covering every particle in the file in ID order
+	# The fmass array of each block is reused by the next one, so copy anything to be kept
+	def blocks(self, budget=None):
+		cycles = self.cycles()
+		rows = self.block_rows(budget)
+		buf = np.empty((min(rows or len(cycles), len(cycles)), self.n_species), dtype=float)
+		for start, stop in row_chunks(len(cycles), rows):
+			pids = cycles[start:stop]
+			yield pids, self.masses(pids), self.fmass(pids, buf)
+
+# Return the (nz, nn) network arrays of an SE file
+def read_network(filename, backend=None):
+	with SEFile(filename, backend) as se:
+		return se.nz, se.nn
+
+# Return the size in bytes of an SE file on disk, for the telemetry
+# Files that only exist in a backend, like the memory stand-in, count as zero bytes
+def file_bytes(filename):
+	return (os.path.getsize(filename) if os.path.isfile(filename) else 0)
@@ -0,0 +1,224 @@
+# Spatial and kinematic particle selections over a particle dataset
+# Selections are built from geometric shapes (sphere, shell, cone, box, half-space) and
+# column predicates, combined with the &, |, and ~ operators, and evaluated chunk by chunk
+# On a spatially ordered dataset, selections with a bounded shape only read the rows in their box
+# The result is always a sorted array of particle IDs that plugs straight into group_yields,
+# the SPH projections, or a "_pids.out" style ID list for the C tools
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	ejecta = Where("v_r", ">", 5e8) & Cone(30.0)
+#	pids = select(ds, ejecta)
+#	result = group_yields(ds, store, [BinSpec("v_r", bins=20)], ["44Ti"], pids=pids)
+# To break down the 44Ti yield of the ejecta faster than 5000 km/s within 30 degrees of the jets
+
+import operator
+
+import numpy as np
+
+from particle_data import get_values, JET_AXIS
+from chunking import chunk_rows, row_chunks
+
+# Rough memory cost in bytes per particle row per column read while selecting
+BYTES_PER_ROW = 32
+# Comparison operators that can be used in a column predicate
+OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+	"==": operator.eq, "!=": operator.ne}
+
+
+# Return the (n, 3) array of positions of some dataset rows, relative to a center point
+def _positions(ds, rows, center=(0.0, 0.0, 0.0)):
+	return np.column_stack([get_values(ds, axis, rows) - c
+		for axis, c in zip(("x", "y", "z"), center)])
+
+
+# SELECTION BASE CLASS
+
+# A selection knows how to compute its boolean mask for any rows of a dataset
+# Subclasses give the mask and, if they are bounded in space, the box that holds them
+class Selection(object):
+	# Return a boolean array saying which of the given rows are selected
+	def mask(self, ds, rows):
+		raise NotImplementedError
+	# Return the (lo, hi) corners of a box containing everything selected, or None if unbounded
+	def bounds(self):
+		return None
+	# Combine selections with the usual logical operators
+	def __and__(self, other):
+		return And(self, other)
+	def __or__(self, other):
+		return Or(self, other)
+	def __invert__(self):
+		return Not(self)
+
+# Particles in both of two selections
+class And(Selection):
+	def __init__(self, first, second):
+		self.first, self.second = first, second
+	def mask(self, ds, rows):
+		return self.first.mask(ds, rows) & self.second.mask(ds, rows)
+	# The intersection of the two boxes (or either one, if only one is bounded)
+	def bounds(self):
+		first, second = self.first.bounds(), self.second.bounds()
+		if first is None or second is None:
+			return (second if first is None else first)
+		return (np.maximum(first[0], second[0]), np.minimum(first[1], second[1]))
+
+# Particles in either of two selections
+class Or(Selection):
+	def __init__(self, first, second):
+		self.first, self.second = first, second
+	def mask(self, ds, rows):
+		return self.first.mask(ds, rows) | self.second.mask(ds, rows)
+	# The box around both boxes, which only exists if both are bounded
+	def bounds(self):
+		first, second = self.first.bounds(), self.second.bounds()
+		if first is None or second is None:
+			return None
+		return (np.minimum(first[0], second[0]), np.maximum(first[1], second[1]))
+
+# Particles not in a selection
+class Not(Selection):
+	def __init__(self, inner):
+		self.inner = inner
+	def mask(self, ds, rows):
+		return ~self.inner.mask(ds, rows)
+
+
+# GEOMETRIC SELECTIONS
+
+# Particles within a radius (cm) of a center point
+class Sphere(Selection):
+	def __init__(self, radius, center=(0.0, 0.0, 0.0)):
+		self.radius = float(radius)
+		self.center = np.asarray(center, dtype=np.float64)
+	def mask(self, ds, rows):
+		return np.sum(_positions(ds, rows, self.center)**2, axis=1) <= self.radius**2
+	def bounds(self):
+		return (self.center - self.radius, self.center + self.radius)
+
+# Particles at radii (cm) from r_min up to but not including r_max around a center point
+class Shell(Selection):
+	def __init__(self, r_min, r_max, center=(0.0, 0.0, 0.0)):
+		self.r_min, self.r_max = float(r_min), float(r_max)
+		self.center = np.asarray(center, dtype=np.float64)
+	def mask(self, ds, rows):
+		r2 = np.sum(_positions(ds, rows, self.center)**2, axis=1)
+		return (r2 >= self.r_min**2) & (r2 < self.r_max**2)
+	def bounds(self):
+		return (self.center - self.r_max, self.center + self.r_max)
+
+# Particles within an angle (degrees) of an axis through an apex, out to an optional radius
+# With both=True (the default) the cone is doubled to cover both jets, like the jet angle column
+class Cone(Selection):
+	def __init__(self, angle, axis=JET_AXIS, apex=(0.0, 0.0, 0.0), both=True, radius=None):
+		self.angle = float(angle)
+		self.axis = np.asarray(axis, dtype=np.float64) / np.sqrt(np.sum(np.square(axis)))
+		self.apex = np.asarray(apex, dtype=np.float64)
+		self.both = both
+		self.radius = radius
+	def mask(self, ds, rows):
+		pos = _positions(ds, rows, self.apex)
+		r = np.sqrt(np.sum(pos**2, axis=1))
+		along = pos.dot(self.axis)
+		if self.both:
+			along = np.abs(along)
+		# Compare cosines, treating a particle sitting on the apex as inside
+		inside = (along >= np.cos(np.radians(self.angle)) * r)
+		if self.radius is not None:
+			inside &= (r <= self.radius)
+		return inside
+	def bounds(self):
+		if self.radius is None:
+			return None
+		return (self.apex - self.radius, self.apex + self.radius)
+
+# Particles inside an axis-aligned box given by its low and high corners (cm)
+class Box(Selection):
+	def __init__(self, lo, hi):
+		self.lo = np.asarray(lo, dtype=np.float64)
+		self.hi = np.asarray(hi, dtype=np.float64)
+	def mask(self, ds, rows):
+		pos = _positions(ds, rows)
+		return np.all((pos >= self.lo) & (pos <= self.hi), axis=1)
+	def bounds(self):
+		return (self.lo, self.hi)
+
+# Particles on the side of a plane that the normal vector points toward
+# The plane passes through the given point (the origin by default)
+class HalfSpace(Selection):
+	def __init__(self, normal, point=(0.0, 0.0, 0.0)):
+		self.normal = np.asarray(normal, dtype=np.float64)
+		self.point = np.asarray(point, dtype=np.float64)
+	def mask(self, ds, rows):
+		return _positions(ds, rows, self.point).dot(self.normal) >= 0.0
+
+
+# COLUMN PREDICATES
+
+# Particles whose value in a column (stored or derived) compares true against a threshold
+# The comparison is one of "<", "<=", ">", ">=", "==", or "!="
+class Where(Selection):
+	def __init__(self, column, comparison, value):
+		if comparison not in OPERATORS:
+			raise ValueError("unknown comparison %s" % (repr(comparison)))
+		self.column, self.comparison, self.value = column, comparison, value
+	def mask(self, ds, rows):
+		return OPERATORS[self.comparison](get_values(ds, self.column, rows), self.value)
+
+# Particles whose value in a column lies from low up to but not including high
+class Between(Selection):
+	def __init__(self, column, low, high):
+		self.column, self.low, self.high = column, low, high
+	def mask(self, ds, rows):
+		values = get_values(ds, self.column, rows)
+		return (values >= self.low) & (values < self.high)
+
+# Particles whose IDs are in a given list
+class InList(Selection):
+	def __init__(self, pids):
+		self.pids = np.unique(np.asarray(pids, dtype=np.int64))
+	def mask(self, ds, rows):
+		ids = np.asarray(ds.column("id")[rows], dtype=np.int64)
+		if len(self.pids) == 0:
+			return np.zeros(len(ids), dtype=bool)
+		index = np.minimum(np.searchsorted(self.pids, ids), len(self.pids) - 1)
+		return self.pids[index] == ids
+
+
+# EVALUATION
+
+# Return the sorted particle IDs of a dataset that are in a selection
+# Datasets with box_rows (see spatial_order) only read the box around a bounded selection
+def select(ds, selection, budget=None):
+	rows = chunk_rows(budget, BYTES_PER_ROW * 4)
+	# Find the candidate rows, which is every row unless the selection has a usable box
+	box = selection.bounds()
+	candidates = None
+	if box is not None and hasattr(ds, "box_rows"):
+		candidates = ds.box_rows(box[0], box[1], exact=False)
+	# Evaluate the selection on the candidates one chunk at a time
+	pids = []
+	if candidates is None:
+		for start, stop in row_chunks(ds.n_rows, rows):
+			chunk = slice(start, stop)
+			pids.append(np.asarray(ds.column("id")[chunk])[selection.mask(ds, chunk)])
+	else:
+		for start, stop in row_chunks(len(candidates), rows):
+			chunk = candidates[start:stop]
+			pids.append(np.asarray(ds.column("id")[chunk])[selection.mask(ds, chunk)])
+	if len(pids) == 0:
+		return np.zeros(0, dtype=np.int64)
+	return np.sort(np.concatenate(pids).astype(np.int64))
+
+# Return the dataset rows of a list of particle IDs, skipping any that are not in the dataset
+def selected_rows(ds, pids):
+	rows = ds.rows_of(pids)
+	return np.sort(rows[rows >= 0])
+
+# Write particle IDs to a file in the "_pids.out" format read by the C tools
+def write_pids(pids, filename):
+	with open(filename, 'w') as outfile:
+		outfile.write("n_ids=%d\n" % (len(pids)))
+		np.savetxt(outfile, np.asarray(pids, dtype=np.int64), fmt="%d")
@@ -76,6 +76,14 @@ def get_list(filename):
 	# Return the constructed list of isotopes
 	return iso_list
 
+# Return a list of all the non-blank lines in a file, e.g., column names that contain spaces
+def get_lines(filename):
+	# Read the whole file and split it up at the newlines
+	with open(filename, 'r') as lines_file:
+		lines = lines_file.read().split('\n')
+	# Drop surrounding whitespace and any blank lines
+	return [line.strip() for line in lines if line.strip() != ""]
+
 # Given an arbitrary file name, return its extension string without the dot
 def get_ext(filename):
 	# Split the file name into its name and extension
@@ -163,8 +171,9 @@ def ask_user(question):
 #     "head": full path to the specified head directory
 #     "hdf5": full path to the subdirectory containing HDF5 files
 #     "sdf": full path to the subdirectory containing SDF files
-# Selections are manually verified with the user before being returned by the function
-def get_paths(head):
+# Selections are manually verified with the user before being returned by the function,
+# unless confirm is False (for batch jobs and library use, where nobody is there to answer)
+def get_paths(head, confirm=True):
 	# Store the head directory name and find out its absolute path
 	paths = {"head": os.path.abspath(head)}
 	# Signal the user that the program is searching for the appropriate paths
@@ -214,7 +223,7 @@ def get_paths(head):
 		# No directory found, or more than one found
 		print "Failed to find SDF directory (%s possibilities)" % (len(has_sdf))
 	# These all need to be correct, so ask the user whether to continue execution
-	if not ask_user("Continue program execution?"):
+	if confirm and not ask_user("Continue program execution?"):
 		print "Aborting on user command"
 		sys.exit()
 	# With user confirmation, return the paths to main() so the script can proceed
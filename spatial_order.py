@@ -0,0 +1,227 @@
+# Spatially ordered copy of a particle dataset for region-based analysis
+# Plotting datasets are sorted by particle ID, which scatters any spatial region across the files
+# This writes a copy with the rows sorted by the Morton (Z-order) key of each final position,
+# along with the permutation back to particle ID order
+# A box in space then maps onto a short list of contiguous row ranges of the copy,
+# so region queries and projections only read the pages they need
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	ods = OrderedDataset.load_or_build(ParticleDataset("sn_data/jet3b/analysis/jet3b_plotting.dataset"))
+#	rows = ods.box_rows((-1e9, -1e9, 0.0), (1e9, 1e9, 5e9))
+#	temps = get_values(ods, "peak temp", rows)
+# To read the peak temperatures of the jet3b particles inside a box along the upper jet
+
+import os
+
+import numpy as np
+
+from particle_data import ParticleDataset, COLUMNS_FILE, column_filename, get_values
+from chunking import chunk_rows, row_chunks
+
+# Directory name suffix for a spatially ordered copy of a dataset
+ORDERED_SUFFIX = ".morton"
+# Number of bits of each coordinate in the Morton key (three of these fit in 64 bits)
+KEY_BITS = 21
+# Largest number of key ranges a box query is refined into before it stops subdividing
+MAX_RANGES = 4096
+# Rough memory cost in bytes per particle row while building the ordered copy
+BYTES_PER_ROW = 48
+
+
+# MORTON KEYS
+
+# Spread the low 21 bits of each integer out so that there are two zero bits between each
+def _spread_bits(v):
+	v = np.asarray(v, dtype=np.uint64) & np.uint64(0x1fffff)
+	for shift, mask in ((32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff),
+		(8, 0x100f00f00f00f00f), (4, 0x10c30c30c30c30c3), (2, 0x1249249249249249)):
+		v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+	return v
+
+# Interleave integer grid coordinates into Morton keys, with x in the lowest bit
+def interleave(i, j, k):
+	return _spread_bits(i) | (_spread_bits(j) << np.uint64(1)) | (_spread_bits(k) << np.uint64(2))
+
+# Return integer grid coordinates (0 to 2^KEY_BITS - 1) of positions within the bounds lo to hi
+def grid_coords(pos, lo, hi):
+	scale = (2**KEY_BITS) / np.where(hi > lo, hi - lo, 1.0)
+	cells = np.floor((np.asarray(pos, dtype=np.float64) - lo) * scale)
+	return np.clip(cells, 0, 2**KEY_BITS - 1).astype(np.uint64)
+
+# Return the Morton keys of an (n, 3) array of positions within the bounds lo to hi
+def morton_keys(pos, lo, hi):
+	cells = grid_coords(pos, lo, hi)
+	return interleave(cells[:, 0], cells[:, 1], cells[:, 2])
+
+# Break a box (in grid coordinates) into a sorted list of half-open [start, stop) key ranges
+# Octree cells are refined level by level until they are inside or outside the box, or until
+# there are too many ranges, in which case the partly covered cells are kept whole
+def box_key_ranges(lo, hi, max_ranges=MAX_RANGES):
+	lo, hi = np.asarray(lo, dtype=np.float64), np.asarray(hi, dtype=np.float64)
+	# Start from the single cell covering the whole grid
+	cells = np.zeros((1, 3), dtype=np.int64)
+	starts, stops = [], []
+	for level in xrange(KEY_BITS + 1):
+		# Size of the cells at this level in grid units, and the key span of each cell
+		size = 2**(KEY_BITS - level)
+		span = np.uint64(size)**np.uint64(3)
+		cell_lo, cell_hi = cells * size, (cells + 1) * size
+		# Sort out which cells miss the box, which sit inside it, and which cut its edge
+		overlap = np.all((cell_hi > lo) & (cell_lo <= hi), axis=1)
+		inside = np.all((cell_lo >= lo) & (cell_hi - 1 <= hi), axis=1)
+		partial = overlap & ~inside
+		# Whole cells inside the box become key ranges right away
+		done = cells[inside]
+		if level == KEY_BITS or np.sum(partial) * 8 + len(starts) > max_ranges:
+			done = cells[overlap]
+			partial[:] = False
+		keys = interleave(done[:, 0], done[:, 1], done[:, 2]) * span
+		starts.extend(keys)
+		stops.extend(keys + span)
+		if not np.any(partial):
+			break
+		# Split every partly covered cell into its eight children
+		children = np.array([(a, b, c) for c in (0, 1) for b in (0, 1) for a in (0, 1)])
+		cells = (cells[partial][:, None, :] * 2 + children[None, :, :]).reshape(-1, 3)
+	# Sort the ranges and merge the ones that touch
+	order = np.argsort(np.array(starts, dtype=np.uint64), kind="mergesort")
+	merged = []
+	for start, stop in zip(np.array(starts, dtype=np.uint64)[order],
+		np.array(stops, dtype=np.uint64)[order]):
+		if merged and merged[-1][1] == start:
+			merged[-1][1] = stop
+		else:
+			merged.append([start, stop])
+	return merged
+
+
+# ORDERED DATASET
+
+# Particle dataset whose rows are sorted by the Morton key of their final positions
+# Everything that works on a ParticleDataset works on this too, since rows_of is translated
+class OrderedDataset(ParticleDataset):
+	# Open an existing ordered dataset directory
+	def __init__(self, directory):
+		ParticleDataset.__init__(self, directory)
+		# Sorted Morton key of every row, used to turn key ranges into row ranges
+		self.keys = np.load(os.path.join(self.directory, "keys.npy"), mmap_mode='r')
+		# Row of the source dataset for every row here, and the reverse
+		self.order = np.load(os.path.join(self.directory, "order.npy"), mmap_mode='r')
+		self.inverse = np.load(os.path.join(self.directory, "inverse.npy"), mmap_mode='r')
+		# Sorted particle IDs of the source dataset, for looking up rows by ID
+		self.pids = np.load(os.path.join(self.directory, "pids.npy"), mmap_mode='r')
+		# The bounding box that the grid of Morton keys covers
+		bounds = np.load(os.path.join(self.directory, "bounds.npy"))
+		self.lo, self.hi = bounds[0], bounds[1]
+	# Build an ordered copy of a dataset and return it opened
+	@classmethod
+	def build(cls, ds, directory=None, budget=None):
+		# By default, put the ordered copy next to the source dataset
+		if directory is None:
+			directory = ds.directory + ORDERED_SUFFIX
+		build_ordered(ds, directory, budget)
+		return cls(directory)
+	# Open the ordered copy if it was built from the current source dataset, otherwise rebuild it
+	@classmethod
+	def load_or_build(cls, ds, directory=None, budget=None):
+		if directory is None:
+			directory = ds.directory + ORDERED_SUFFIX
+		fingerprint_file = os.path.join(directory, "fingerprint")
+		if os.path.isfile(fingerprint_file):
+			with open(fingerprint_file, 'r') as fingerprint:
+				if fingerprint.read().strip() == ds.fingerprint():
+					return cls(directory)
+		return cls.build(ds, directory, budget)
+	# Return the row index of each particle ID, or -1 for IDs not in the dataset
+	def rows_of(self, pids):
+		pids = np.asarray(pids)
+		rows = np.minimum(np.searchsorted(self.pids, pids), self.n_rows - 1)
+		found = self.pids[rows] == pids
+		rows = np.array(self.inverse[rows], dtype=np.int64)
+		rows[~found] = -1
+		return rows
+	# Return the contiguous [start, stop) row ranges that can hold particles inside a box
+	def box_ranges(self, lo, hi):
+		# Clip the box to the bounds and convert it to grid coordinates
+		scale = (2**KEY_BITS) / np.where(self.hi > self.lo, self.hi - self.lo, 1.0)
+		grid_lo = np.floor((np.clip(lo, self.lo, self.hi) - self.lo) * scale)
+		grid_hi = np.floor((np.clip(hi, self.lo, self.hi) - self.lo) * scale)
+		grid_hi = np.minimum(grid_hi, 2**KEY_BITS - 1)
+		# A box that misses the bounds entirely holds nothing
+		if np.any(np.asarray(hi) < self.lo) or np.any(np.asarray(lo) > self.hi):
+			return []
+		ranges = box_key_ranges(grid_lo, grid_hi)
+		starts = np.searchsorted(self.keys, np.array([r[0] for r in ranges], dtype=np.uint64))
+		stops = np.searchsorted(self.keys, np.array([r[1] for r in ranges], dtype=np.uint64))
+		return [(start, stop) for start, stop in zip(starts, stops) if stop > start]
+	# Return the sorted rows of the particles inside a box, reading only the pages needed
+	# With exact=False, every row of the covering key ranges is returned without checking
+	def box_rows(self, lo, hi, exact=True):
+		ranges = self.box_ranges(lo, hi)
+		if len(ranges) == 0:
+			return np.zeros(0, dtype=np.int64)
+		rows = np.concatenate([np.arange(start, stop) for start, stop in ranges])
+		if not exact:
+			return rows
+		# Check the actual positions, which are read as contiguous runs
+		inside = np.ones(len(rows), dtype=bool)
+		for d, axis in enumerate(("x", "y", "z")):
+			values = np.concatenate([self.read(axis, start, stop) for start, stop in ranges])
+			inside &= (values >= lo[d]) & (values <= hi[d])
+		return rows[inside]
+	# Return the particle IDs inside a box, in ascending ID order
+	def box_pids(self, lo, hi):
+		return np.sort(np.asarray(self.column("id")[self.box_rows(lo, hi)]))
+
+# Write a copy of a dataset with its rows sorted by the Morton key of their final positions
+def build_ordered(ds, directory, budget=None):
+	# Print a quick progress message for the user
+	print "Building spatially ordered dataset %s" % (directory)
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	rows = chunk_rows(budget, BYTES_PER_ROW)
+	# Find the bounding box of the final positions
+	lo, hi = np.full(3, np.inf), np.full(3, -np.inf)
+	for start, stop in row_chunks(ds.n_rows, rows):
+		pos = np.column_stack([ds.read(axis, start, stop) for axis in ("x", "y", "z")])
+		lo, hi = np.minimum(lo, pos.min(axis=0)), np.maximum(hi, pos.max(axis=0))
+	np.save(os.path.join(directory, "bounds.npy"), np.array([lo, hi]))
+	# Compute the Morton key of every particle and sort by it (ties stay in ID order)
+	keys = np.empty(ds.n_rows, dtype=np.uint64)
+	for start, stop in row_chunks(ds.n_rows, rows):
+		pos = np.column_stack([ds.read(axis, start, stop) for axis in ("x", "y", "z")])
+		keys[start:stop] = morton_keys(pos, lo, hi)
+	order = np.argsort(keys, kind="mergesort")
+	np.save(os.path.join(directory, "keys.npy"), keys[order])
+	del keys
+	np.save(os.path.join(directory, "order.npy"), order)
+	inverse = np.empty_like(order)
+	inverse[order] = np.arange(len(order))
+	np.save(os.path.join(directory, "inverse.npy"), inverse)
+	np.save(os.path.join(directory, "pids.npy"), ds.read("id"))
+	# Copy each column into its new order, one chunk of output rows at a time
+	for name in ds.names:
+		source = ds.column(name)
+		out = np.lib.format.open_memmap(os.path.join(directory, column_filename(name)),
+			mode="w+", dtype=source.dtype, shape=(ds.n_rows,))
+		for start, stop in row_chunks(ds.n_rows, rows):
+			# Gather in ascending source order so the source is walked front to back
+			picks = order[start:stop]
+			sort = np.argsort(picks)
+			block = np.empty(len(picks), dtype=source.dtype)
+			block[sort] = source[picks[sort]]
+			out[start:stop] = block
+		out.flush()
+		del out
+	# Record the columns and the source fingerprint so staleness can be detected
+	with open(os.path.join(directory, COLUMNS_FILE), 'w') as names:
+		names.write('\n'.join(ds.names) + '\n')
+	with open(os.path.join(directory, "fingerprint"), 'w') as fingerprint:
+		fingerprint.write(ds.fingerprint() + '\n')
+
+# Return the values of a column for rows of an ordered dataset, put back in particle ID order
+def in_pid_order(ods, name):
+	values = get_values(ods, name)
+	return values[np.asarray(ods.inverse)]
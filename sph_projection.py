@@ -0,0 +1,319 @@
+# Spatial index and SPH kernel projection engine for rendering the final timestep
+# Particles are binned into a uniform grid of cells, each knowing the largest kernel it holds,
+# so the particles that touch any box (an image tile, a slab, a voxel block) are found quickly
+# Any column can then be projected onto a 2D image or deposited onto a 3D grid with the SPH
+# kernel: column densities, mass-weighted maps along the line of sight, and thin slices
+# Images are cut into tiles that are rendered in parallel, each with vectorized kernel sums
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	index = SPHIndex.from_dataset(ParticleDataset("sn_data/jet3b/analysis/jet3b_plotting.dataset"))
+#	maps = abundance_maps(index, ds, sn.get_list(sn.ABUNDANCES_FILE), extent, (512, 512))
+# To make mass-weighted abundance maps of every abundances.txt target for jet3b
+
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from particle_data import get_values, abundance_column
+
+# Kernel support radius in units of the smoothing length (SNSPH uses 2h)
+SUPPORT = 2.0
+# Number of points in the table of the projected (line of sight integrated) kernel
+TABLE_POINTS = 1024
+# Default size in pixels of the square tiles that are rendered in parallel
+TILE_SIZE = 128
+# Largest number of kernel evaluations done in one vectorized batch
+BATCH_ELEMENTS = 2**22
+# Smallest allowed smoothing length in pixels, so every particle reaches a pixel center
+MIN_H_PIXELS = 0.5
+
+
+# SPH KERNELS
+
+# The cubic spline (M4) kernel in three dimensions for a unit smoothing length
+def kernel_3d(q):
+	w = np.zeros_like(q)
+	inner = q < 1.0
+	outer = (q >= 1.0) & (q < 2.0)
+	w[inner] = 1.0 - 1.5 * q[inner]**2 + 0.75 * q[inner]**3
+	w[outer] = 0.25 * (2.0 - q[outer])**3
+	return w / np.pi
+
+# Tabulate the cubic spline kernel integrated along a line of sight, for a unit smoothing length
+def _projected_table():
+	# Impact parameters from zero out to the kernel support
+	b = np.linspace(0.0, SUPPORT, TABLE_POINTS)
+	z = np.linspace(0.0, SUPPORT, TABLE_POINTS)
+	# Integrate W(sqrt(b^2 + z^2)) over the full line of sight (twice the half line)
+	q = np.sqrt(b[:, None]**2 + z[None, :]**2)
+	table = 2.0 * np.trapz(kernel_3d(q), z, axis=1)
+	# Renormalize so that the projected kernel integrates to exactly one over the plane
+	table /= np.trapz(2.0 * np.pi * b * table, b)
+	return b, table
+
+# The table is built once when the module is imported
+PROJECTED_B, PROJECTED_TABLE = _projected_table()
+
+# The cubic spline kernel projected onto a plane, for a unit smoothing length
+def kernel_2d(q):
+	return np.interp(q, PROJECTED_B, PROJECTED_TABLE, right=0.0)
+
+
+# SPATIAL INDEX
+
+# Uniform grid of cells over the particle positions, with the particles sorted by cell
+class SPHIndex:
+	# Build the index from position, smoothing length, and mass arrays (CGS units)
+	def __init__(self, x, y, z, h, mass, cells=None):
+		self.pos = np.column_stack([x, y, z]).astype(np.float64)
+		self.h = np.asarray(h, dtype=np.float64)
+		self.mass = np.asarray(mass, dtype=np.float64)
+		n = len(self.h)
+		# Default to roughly eight particles per cell, within reason
+		if cells is None:
+			cells = int(np.clip(round((n / 8.0)**(1.0 / 3.0)), 1, 256))
+		self.cells = cells
+		# The grid covers the bounding box of the particle positions
+		self.lo = self.pos.min(axis=0)
+		self.size = (self.pos.max(axis=0) - self.lo) / cells
+		self.size[self.size == 0.0] = 1.0
+		# Find the cell of every particle and sort the particles by cell
+		ijk = np.clip(np.floor((self.pos - self.lo) / self.size).astype(np.int64), 0, cells - 1)
+		keys = np.ravel_multi_index(ijk.T, (cells,) * 3)
+		self.order = np.argsort(keys, kind="mergesort")
+		sorted_keys = keys[self.order]
+		n_cells = cells**3
+		self.starts = np.searchsorted(sorted_keys, np.arange(n_cells), side="left")
+		self.ends = np.searchsorted(sorted_keys, np.arange(n_cells), side="right")
+		# Record the largest kernel support radius in each cell
+		self.support = SUPPORT * self.h
+		self.cell_support = np.zeros(n_cells)
+		np.maximum.at(self.cell_support, keys, self.support)
+		self.max_support = (self.support.max() if n > 0 else 0.0)
+	# Build an index from the final-timestep columns of a particle dataset
+	# Giving rows (e.g., from OrderedDataset.box_rows) indexes only those particles
+	@classmethod
+	def from_dataset(cls, ds, cells=None, rows=slice(None)):
+		return cls(*[get_values(ds, name, rows) for name in ("x", "y", "z", "h", "mass")],
+			cells=cells)
+	# Return the indices of all particles whose kernel support overlaps the box lo to hi
+	# Use -inf and inf for any axis that the box should span completely
+	def query_box(self, lo, hi):
+		lo, hi = np.asarray(lo, dtype=np.float64), np.asarray(hi, dtype=np.float64)
+		# Any cell within the largest support of the box might hold a particle touching it
+		first = np.floor((lo - self.max_support - self.lo) / self.size)
+		last = np.floor((hi + self.max_support - self.lo) / self.size)
+		first = np.clip(np.nan_to_num(first), 0, self.cells - 1).astype(np.int64)
+		last = np.clip(np.nan_to_num(last), 0, self.cells - 1).astype(np.int64)
+		ranges = [np.arange(first[d], last[d] + 1) for d in range(3)]
+		ci, cj, ck = [c.ravel() for c in np.meshgrid(*ranges, indexing="ij")]
+		cells = np.ravel_multi_index((ci, cj, ck), (self.cells,) * 3)
+		# Keep only the cells whose own largest support actually reaches the box
+		cell_lo = self.lo + np.column_stack([ci, cj, ck]) * self.size
+		reach = self.cell_support[cells][:, None]
+		touch = np.all((cell_lo - reach <= hi) & (cell_lo + self.size + reach >= lo), axis=1)
+		cells = cells[touch & (self.ends[cells] > self.starts[cells])]
+		# Gather the particles of those cells in one go
+		lengths = self.ends[cells] - self.starts[cells]
+		offsets = np.repeat(self.starts[cells] - np.cumsum(lengths) + lengths, lengths)
+		candidates = self.order[offsets + np.arange(lengths.sum())]
+		# Finally keep only the particles whose own support overlaps the box
+		pos, support = self.pos[candidates], self.support[candidates][:, None]
+		inside = np.all((pos - support <= hi) & (pos + support >= lo), axis=1)
+		return candidates[inside]
+	# Return the indices of all particles within a given distance of a point
+	def query_sphere(self, center, radius):
+		center = np.asarray(center, dtype=np.float64)
+		candidates = self.query_box(center - radius, center + radius)
+		distance = np.sqrt(np.sum((self.pos[candidates] - center)**2, axis=1))
+		return candidates[distance <= radius + self.support[candidates]]
+
+
+# KERNEL DEPOSITION
+
+# Add kernel-weighted contributions of particles onto a tile of pixels or voxels
+# Centers and smoothing lengths are in pixel units, with pixel i covering [i, i+1), and each
+# particle has a smoothing length along every axis so that pixels need not be square
+# The kernel function takes q = r / h, and the weights already include any 1 / h^d factor
+# For slices, offset gives each particle's distance from the plane in units of its own h
+def _deposit(out, centers, h, weights, kernel, offset=None):
+	nd = out.ndim
+	shape = np.array(out.shape)
+	radius = SUPPORT * h
+	# Range of pixels whose centers lie within each particle's support, clipped to the tile
+	lo = np.maximum(np.ceil(centers - radius - 0.5).astype(np.int64), 0)
+	hi = np.minimum(np.floor(centers + radius - 0.5).astype(np.int64), shape - 1)
+	width = (hi - lo + 1).max(axis=1)
+	keep = width > 0
+	centers, h, weights, lo, hi, width = \
+		centers[keep], h[keep], weights[keep], lo[keep], hi[keep], width[keep]
+	offset = (np.zeros(len(h)) if offset is None else offset[keep])
+	# Group particles by footprint size (powers of two) to bound the wasted evaluations
+	size = 2**np.ceil(np.log2(np.maximum(width, 1))).astype(np.int64)
+	# Tiles are views into the full image, so sum into a flat buffer and add it at the end
+	flat_out = np.zeros(out.size)
+	for k in np.unique(size):
+		group = np.nonzero(size == k)[0]
+		offsets = np.column_stack([o.ravel() for o in
+			np.meshgrid(*[np.arange(k)] * nd, indexing="ij")])
+		batch = max(1, BATCH_ELEMENTS // len(offsets))
+		for start in xrange(0, len(group), batch):
+			members = group[start:start+batch]
+			pix = lo[members][:, None, :] + offsets[None, :, :]
+			valid = np.all(pix <= hi[members][:, None, :], axis=2)
+			u = (pix + 0.5 - centers[members][:, None, :]) / h[members][:, None, :]
+			q = np.sqrt(np.sum(u**2, axis=2) + offset[members][:, None]**2)
+			w = kernel(q) * weights[members][:, None]
+			flat = np.ravel_multi_index(tuple(pix[valid].T), out.shape)
+			flat_out += np.bincount(flat, weights=w[valid], minlength=flat_out.size)
+	out += flat_out.reshape(out.shape)
+
+# Split an image (or grid) shape into tiles, returning a list of tuples of slices
+def _tiles(shape, tile):
+	ranges = [[slice(s, min(s + tile, n)) for s in xrange(0, n, tile)] for n in shape]
+	return [tuple(combo) for combo in _product(ranges)]
+
+# Cartesian product of lists (itertools.product written out for clarity)
+def _product(lists):
+	if len(lists) == 0:
+		return [()]
+	return [(item,) + rest for item in lists[0] for rest in _product(lists[1:])]
+
+# Render every tile of an output array in parallel using a function of (out view, tile slices)
+def _render(shape, render_tile, tile, threads):
+	out = np.zeros(shape)
+	if threads is None:
+		threads = multiprocessing.cpu_count()
+	pool = ThreadPool(max(1, threads))
+	try:
+		pool.map(lambda slices : render_tile(out[slices], slices), _tiles(shape, tile))
+	finally:
+		pool.close()
+		pool.join()
+	return out
+
+
+# PROJECTIONS
+
+# Project the kernel-smoothed sum of m_i * v_i onto a 2D image along one axis
+# The extent is ((low, high), (low, high)) for the two image axes in order, e.g., x and y for
+# axis=2, and resolution is the image shape in pixels; values of None give the column density
+def column_density(index, values, extent, resolution, axis=2, tile=TILE_SIZE, threads=None):
+	plane = [d for d in range(3) if d != axis]
+	weights = index.mass * (1.0 if values is None else np.asarray(values, dtype=np.float64))
+	pixel = np.array([(extent[i][1] - extent[i][0]) / float(resolution[i]) for i in range(2)])
+	origin = np.array([extent[0][0], extent[1][0]])
+	# Render one tile from the particles whose support overlaps it
+	def render_tile(view, slices):
+		lo, hi = np.full(3, -np.inf), np.full(3, np.inf)
+		for i, d in enumerate(plane):
+			lo[d] = origin[i] + slices[i].start * pixel[i]
+			hi[d] = origin[i] + slices[i].stop * pixel[i]
+		picks = index.query_box(lo, hi)
+		if len(picks) == 0:
+			return
+		# Positions and smoothing lengths along each image axis in the tile's own pixel units
+		centers = (index.pos[picks][:, plane] - lo[plane]) / pixel
+		h_pix = np.maximum(index.h[picks][:, None] / pixel, MIN_H_PIXELS)
+		h_phys = h_pix * pixel
+		_deposit(view, centers, h_pix, weights[picks] / h_phys.prod(axis=1), kernel_2d)
+	return _render(tuple(resolution), render_tile, tile, threads)
+
+# Project the mass-weighted average of a column along the line of sight onto a 2D image
+def weighted_map(index, values, extent, resolution, axis=2, tile=TILE_SIZE, threads=None):
+	numerator = column_density(index, values, extent, resolution, axis, tile, threads)
+	denominator = column_density(index, None, extent, resolution, axis, tile, threads)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		return np.where(denominator > 0.0, numerator / denominator, 0.0)
+
+# Evaluate the kernel-smoothed sum of m_i * v_i * W on a plane cutting through the particles
+# The plane is perpendicular to the given axis at the given depth; weighted=True divides by the
+# same sum without the values, giving a mass-weighted slice of the column
+def slice_map(index, values, extent, resolution, axis=2, depth=0.0, weighted=True,
+	tile=TILE_SIZE, threads=None):
+	plane = [d for d in range(3) if d != axis]
+	pixel = np.array([(extent[i][1] - extent[i][0]) / float(resolution[i]) for i in range(2)])
+	origin = np.array([extent[0][0], extent[1][0]])
+	values = (np.ones(len(index.h)) if values is None else np.asarray(values, dtype=np.float64))
+	# Both the numerator and the denominator of the slice are rendered tile by tile
+	def render(weights):
+		def render_tile(view, slices):
+			lo, hi = np.full(3, float(depth)), np.full(3, float(depth))
+			for i, d in enumerate(plane):
+				lo[d] = origin[i] + slices[i].start * pixel[i]
+				hi[d] = origin[i] + slices[i].stop * pixel[i]
+			picks = index.query_box(lo, hi)
+			if len(picks) == 0:
+				return
+			# Particles are weighted by their kernel at their distance from the plane, using the
+			# smaller of their in-plane smoothing lengths across it
+			h_pix = np.maximum(index.h[picks][:, None] / pixel, MIN_H_PIXELS)
+			h_phys = h_pix * pixel
+			h_z = h_phys.min(axis=1)
+			dz = np.abs(index.pos[picks, axis] - depth) / h_z
+			centers = (index.pos[picks][:, plane] - lo[plane]) / pixel
+			_deposit(view, centers, h_pix, weights[picks] / (h_phys.prod(axis=1) * h_z),
+				kernel_3d, dz)
+		return _render(tuple(resolution), render_tile, tile, threads)
+	numerator = render(index.mass * values)
+	if not weighted:
+		return numerator
+	denominator = render(index.mass)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		return np.where(denominator > 0.0, numerator / denominator, 0.0)
+
+# Deposit the kernel-smoothed sum of m_i * v_i * W onto a 3D grid of voxels
+# The extent gives (low, high) along x, y, and z and shape is the number of voxels along each
+def deposit_grid(index, values, extent, shape, weighted=False, tile=32, threads=None):
+	voxel = np.array([(extent[d][1] - extent[d][0]) / float(shape[d]) for d in range(3)])
+	origin = np.array([extent[d][0] for d in range(3)])
+	values = (np.ones(len(index.h)) if values is None else np.asarray(values, dtype=np.float64))
+	def render(weights):
+		def render_tile(view, slices):
+			lo = origin + np.array([s.start for s in slices]) * voxel
+			hi = origin + np.array([s.stop for s in slices]) * voxel
+			picks = index.query_box(lo, hi)
+			if len(picks) == 0:
+				return
+			centers = (index.pos[picks] - lo) / voxel
+			h_pix = np.maximum(index.h[picks][:, None] / voxel, MIN_H_PIXELS)
+			h_phys = h_pix * voxel
+			_deposit(view, centers, h_pix, weights[picks] / h_phys.prod(axis=1), kernel_3d)
+		return _render(tuple(shape), render_tile, tile, threads)
+	numerator = render(index.mass * values)
+	if not weighted:
+		return numerator
+	denominator = render(index.mass)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		return np.where(denominator > 0.0, numerator / denominator, 0.0)
+
+
+# ABUNDANCE MAPS
+
+# Make one map per abundance target (as listed in abundances.txt) from a plotting dataset
+# The kind is "weighted" (mass-weighted along the line of sight), "column", or "slice"
+# The rows must be the same ones the index was built from
+def abundance_maps(index, ds, targets, extent, resolution, axis=2, kind="weighted",
+	depth=0.0, threads=None, rows=slice(None)):
+	maps = {}
+	for target in targets:
+		values = get_values(ds, abundance_column(target), rows)
+		if kind == "weighted":
+			maps[target] = weighted_map(index, values, extent, resolution, axis, threads=threads)
+		elif kind == "column":
+			maps[target] = column_density(index, values, extent, resolution, axis,
+				threads=threads)
+		elif kind == "slice":
+			maps[target] = slice_map(index, values, extent, resolution, axis, depth,
+				threads=threads)
+		else:
+			raise ValueError("unknown map kind %s" % (repr(kind)))
+	return maps
+
+# Save a dict of maps and their extent to a NumPy .npz file
+def save_maps(filename, maps, extent):
+	arrays = dict(("map_" + name, image) for name, image in maps.items())
+	np.savez(filename, extent=np.asarray(extent, dtype=np.float64), **arrays)
@@ -0,0 +1,181 @@
+# Content-addressed cache of pipeline stage outputs
+# Every stage run is keyed by a hash of the stage name and version, the fingerprints (name, size,
+# and modification time) of its input files, and the effective values of the parameters it
+# depends on, e.g., FMASS_CUT or the contents of abundances.txt
+# Outputs are copied into the cache under that key next to a JSON manifest recording their
+# provenance, and a later run with the same key just copies the cached outputs back
+# Copies keep their modification times, so restored outputs have the same fingerprints as the
+# originals and downstream stages keep hitting the cache too
+# One cache directory can be shared by any number of simulations
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	cache = StageCache("sn_data/stage_cache")
+#	cache.run("sort_query", ["queries/44Ti.out"], ["sorted_queries/44Ti.out"],
+#		lambda : pipeline.sort_query("queries/44Ti.out", "sorted_queries/44Ti.out"))
+# To sort the 44Ti query file unless an identical sort has been done before
+# To see what produced a file, look at cache.provenance("jet3b/analysis/jet3b_plotting.out")
+
+import os
+import json
+import time
+import shutil
+import socket
+import getpass
+import hashlib
+
+import sn_utils as sn
+
+# Name of the cache directory inside a simulation head directory, if none is given
+CACHE_DIR = "stage_cache"
+# Name of the manifest file stored with every cached stage run
+MANIFEST_FILE = "manifest.json"
+
+# Sources of the global parameters that stages can depend on, looked up only when needed
+PARAMETERS = {
+	"TPOS_MAX": lambda : sn.TPOS_MAX,
+	"FMASS_CUT": lambda : sn.FMASS_CUT,
+	"FMASS_CUT_LOW": lambda : sn.FMASS_CUT_LOW,
+	"ISOTOPES_LOW": lambda : list(sn.ISOTOPES_LOW),
+	"abundances": lambda : sn.get_list(sn.ABUNDANCES_FILE),
+	"isotopes": lambda : sn.get_list(sn.ISOTOPES_FILE),
+}
+
+# Registry of the cacheable stages: name -> (version, global parameters it depends on)
+# Bump a stage's version whenever a change to its code changes its outputs
+STAGES = {
+	"extract_yields": (1, ()),
+	"update_yields": (1, ()),
+	"sort_query": (1, ()),
+	"burn_query": (1, ()),
+	"write_plotting": (1, ("TPOS_MAX",)),
+}
+
+# Add a stage to the registry (or replace one), given its version and global parameters
+def register_stage(name, version, parameters=()):
+	STAGES[name] = (version, tuple(parameters))
+
+
+# FINGERPRINTS AND KEYS
+
+# Return the fingerprint record of one input file
+def file_record(filename):
+	info = os.stat(filename)
+	return {"path": os.path.abspath(filename), "name": os.path.basename(filename),
+		"size": info.st_size, "mtime": repr(info.st_mtime)}
+
+# Return the effective parameters of a stage, with explicit values taking precedence
+def effective_params(stage, params=None):
+	version, names = STAGES[stage]
+	effective = dict((name, PARAMETERS[name]()) for name in names
+		if params is None or name not in params)
+	if params is not None:
+		effective.update(params)
+	return effective
+
+# Return the cache key of a stage run from its inputs and effective parameters
+# Only the names of input files go into the key, so the same files in another place still match
+def stage_key(stage, inputs, params):
+	version = STAGES[stage][0]
+	records = [file_record(filename) for filename in inputs]
+	description = {"stage": stage, "version": version, "params": params,
+		"inputs": [[r["name"], r["size"], r["mtime"]] for r in records]}
+	text = json.dumps(description, sort_keys=True)
+	return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# CACHE
+
+# Directory of cached stage outputs, each stored under its key with a provenance manifest
+class StageCache:
+	# Open (or start) a cache in a directory
+	def __init__(self, directory):
+		self.directory = os.path.abspath(directory)
+	# Return the directory that holds (or would hold) the outputs cached under a key
+	def entry(self, key):
+		return os.path.join(self.directory, key[:2], key)
+	# Return the manifest of a cached stage run if one matches, otherwise None
+	def lookup(self, stage, inputs, params=None):
+		key = stage_key(stage, inputs, effective_params(stage, params))
+		return self.manifest(key)
+	# Return the manifest stored under a key, or None if nothing is cached under it
+	def manifest(self, key):
+		manifest_path = os.path.join(self.entry(key), MANIFEST_FILE)
+		if not os.path.isfile(manifest_path):
+			return None
+		with open(manifest_path, 'r') as manifest_file:
+			return json.load(manifest_file)
+	# Return the full path to one cached output file, given its manifest and output number
+	def artifact(self, manifest, i=0):
+		return os.path.join(self.entry(manifest["key"]), manifest["outputs"][i]["artifact"])
+	# Copy the outputs of a finished stage run into the cache and return its manifest
+	def store(self, stage, inputs, outputs, params=None):
+		params = effective_params(stage, params)
+		key = stage_key(stage, inputs, params)
+		manifest = {"stage": stage, "version": STAGES[stage][0], "key": key, "params": params,
+			"inputs": [file_record(filename) for filename in inputs],
+			"outputs": [], "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+			"host": socket.gethostname(), "user": getpass.getuser()}
+		# Fill a temporary directory first so that a partial entry is never seen as cached
+		entry = self.entry(key)
+		temp = "%s.tmp%d" % (entry, os.getpid())
+		if os.path.isdir(temp):
+			shutil.rmtree(temp)
+		os.makedirs(temp)
+		for i, output in enumerate(outputs):
+			artifact = "%d_%s" % (i, os.path.basename(output))
+			shutil.copy2(output, os.path.join(temp, artifact))
+			record = file_record(output)
+			record["artifact"] = artifact
+			manifest["outputs"].append(record)
+		with open(os.path.join(temp, MANIFEST_FILE), 'w') as manifest_file:
+			json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+		# Another process may have stored the same run in the meantime, which is just as good
+		if os.path.isdir(entry):
+			shutil.rmtree(temp)
+		else:
+			os.rename(temp, entry)
+		return manifest
+	# Copy the cached outputs of a stage run to where the stage would have written them
+	def restore(self, manifest, outputs):
+		if len(outputs) != len(manifest["outputs"]):
+			raise ValueError("cached %s run has %d outputs, not %d" % (manifest["stage"],
+				len(manifest["outputs"]), len(outputs)))
+		for i, output in enumerate(outputs):
+			shutil.copy2(self.artifact(manifest, i), output)
+	# Run a stage through the cache: restore its outputs if cached, otherwise call the function
+	# that runs it and cache what it wrote
+	# Returns the manifest of the run and whether it came from the cache
+	def run(self, stage, inputs, outputs, function, params=None):
+		manifest = self.lookup(stage, inputs, params)
+		if manifest is not None:
+			print "Restoring cached %s outputs (key %s)" % (stage, manifest["key"][:12])
+			self.restore(manifest, outputs)
+			return manifest, True
+		function()
+		return self.store(stage, inputs, outputs, params), False
+	# Return the manifests of every cached run, or only those of one stage, oldest first
+	def manifests(self, stage=None):
+		found = []
+		if not os.path.isdir(self.directory):
+			return found
+		for prefix in sorted(os.listdir(self.directory)):
+			prefix_dir = os.path.join(self.directory, prefix)
+			if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+				continue
+			for key in sorted(os.listdir(prefix_dir)):
+				manifest = self.manifest(key)
+				if manifest is not None and (stage is None or manifest["stage"] == stage):
+					found.append(manifest)
+		found.sort(key=lambda manifest : manifest["created"])
+		return found
+	# Return the manifest of the newest cached run that wrote a file, or None if there is none
+	def provenance(self, filename):
+		path = os.path.abspath(filename)
+		matches = [m for m in self.manifests() if path in [o["path"] for o in m["outputs"]]]
+		return (matches[-1] if len(matches) > 0 else None)
+	# Remove every cached run, or only those of one stage
+	def clear(self, stage=None):
+		for manifest in self.manifests(stage):
+			shutil.rmtree(self.entry(manifest["key"]))
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+
+# Streaming summary statistics that merge exactly across chunks and shards
+# A column summary keeps counts, unweighted and mass-weighted means and variances (merged with
+# Chan's parallel formulas), exact extrema, an optional fixed-edge histogram of counts and
+# weights, and a DDSketch-style quantile sketch whose answers are within a relative accuracy of
+# the true quantiles
+# Every part is updated a chunk at a time and two summaries of different rows merge into the
+# summary of all of them, so any set of columns of a 10M-particle dataset (or SDF file) can be
+# summarized in one pass and in constant memory, or in shards on separate workers
+# The sketch and histogram merge exactly, since they just add up bucket counts
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	summaries = summarize(ds, ["temp", "rho"], weights="mass", budget="1G")
+#	print summaries["temp"].quantile(0.5), summaries["temp"].mean(weighted=True)
+# To get the median and mass-weighted mean of temperature and density of a dataset in one pass
+#	./stream_stats.py -c temp,rho -w mass sn_data/jet3b/sdf/run1.00400
+# To print a table of the same summaries straight from an SDF file
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+import telemetry
+from chunking import chunk_rows, row_chunks
+
+# Default relative accuracy of the quantile sketches
+DEFAULT_ACCURACY = 0.01
+# Quantiles shown in the summary tables
+DEFAULT_QUANTILES = (0.01, 0.5, 0.99)
+# Rough memory cost in bytes per particle row per column while summarizing
+BYTES_PER_VALUE = 48
+
+
+# QUANTILE SKETCH
+
+# Sketch of a distribution with logarithmically spaced buckets, in the style of DDSketch
+# Any quantile it returns is within the relative accuracy of a true quantile of the data
+# Buckets hold counts and (optionally) weights, so quantiles can be unweighted or weighted
+class QuantileSketch:
+	def __init__(self, accuracy=DEFAULT_ACCURACY):
+		self.accuracy = accuracy
+		self.gamma = (1.0 + accuracy) / (1.0 - accuracy)
+		self.log_gamma = np.log(self.gamma)
+		# Separate buckets for positive and negative values, keyed by the log of the magnitude
+		self.positive, self.negative = {}, {}
+		self.zero = np.zeros(2)
+	# Add values (and their weights) into the buckets of one sign
+	def _add_buckets(self, buckets, magnitudes, weights):
+		keys = np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64)
+		unique, inverse = np.unique(keys, return_inverse=True)
+		counts = np.bincount(inverse, minlength=len(unique))
+		sums = np.bincount(inverse, weights=weights, minlength=len(unique))
+		for key, count, weight in zip(unique, counts, sums):
+			if key in buckets:
+				buckets[key] += (count, weight)
+			else:
+				buckets[key] = np.array([count, weight], dtype=float)
+	# Add an array of finite values, with optional weights
+	def add(self, values, weights=None):
+		values = np.asarray(values, dtype=float)
+		weights = (np.ones(len(values)) if weights is None else np.asarray(weights, dtype=float))
+		positive, negative = values > 0.0, values < 0.0
+		self.zero += (np.count_nonzero(values == 0.0), weights[values == 0.0].sum())
+		if positive.any():
+			self._add_buckets(self.positive, values[positive], weights[positive])
+		if negative.any():
+			self._add_buckets(self.negative, -values[negative], weights[negative])
+	# Add the buckets of another sketch with the same accuracy into this one
+	def merge(self, other):
+		if other.accuracy != self.accuracy:
+			raise ValueError("cannot merge sketches of different accuracy")
+		for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+			for key, totals in theirs.items():
+				if key in mine:
+					mine[key] = mine[key] + totals
+				else:
+					mine[key] = totals.copy()
+		self.zero = self.zero + other.zero
+		return self
+	# Pickle the buckets as arrays, which is much smaller and faster to load than the dicts
+	def __getstate__(self):
+		state = dict(self.__dict__)
+		for sign in ("positive", "negative"):
+			keys = np.array(sorted(state[sign].keys()), dtype=np.int64)
+			state[sign] = (keys, np.array([state[sign][k] for k in keys]).reshape((len(keys), 2)))
+		return state
+	def __setstate__(self, state):
+		for sign in ("positive", "negative"):
+			keys, totals = state[sign]
+			state[sign] = dict(zip(keys.tolist(), totals))
+		self.__dict__.update(state)
+	# Return the representative values of every bucket in increasing order, with their totals
+	def _ordered(self):
+		negative = sorted(self.negative.keys(), reverse=True)
+		positive = sorted(self.positive.keys())
+		scale = 2.0 / (1.0 + self.gamma)
+		values = [-scale * self.gamma**k for k in negative] + [0.0] + \
+			[scale * self.gamma**k for k in positive]
+		totals = [self.negative[k] for k in negative] + [self.zero] + \
+			[self.positive[k] for k in positive]
+		return np.array(values), np.array(totals).reshape((len(values), 2))
+	# Return the total count (or weight) of everything added
+	def total(self, weighted=False):
+		values, totals = self._ordered()
+		return totals[:, int(weighted)].sum()
+	# Return the approximate q quantile, by count or by weight (NaN if the sketch is empty)
+	def quantile(self, q, weighted=False):
+		values, totals = self._ordered()
+		cumulative = np.cumsum(totals[:, int(weighted)])
+		if len(cumulative) == 0 or cumulative[-1] <= 0.0:
+			return np.nan
+		rank = q * cumulative[-1]
+		return values[min(np.searchsorted(cumulative, rank), len(values) - 1)]
+	# Return the approximate total count (or weight) of the values above x
+	def total_above(self, x, weighted=False):
+		values, totals = self._ordered()
+		return totals[values > x, int(weighted)].sum()
+
+
+# COLUMN SUMMARIES
+
+# Streaming summary of one column of values, with optional weights (e.g., particle masses)
+class Summary:
+	# Start an empty summary, with histogram bin edges and the accuracy of the quantile sketch
+	def __init__(self, bins=None, accuracy=DEFAULT_ACCURACY):
+		self.count = 0
+		self.nonfinite = 0
+		self.weight = 0.0
+		# Unweighted and weighted (total, mean, sum of squared deviations) for the variances
+		self.moments = [np.zeros(3), np.zeros(3)]
+		self.min, self.max = np.inf, -np.inf
+		self.edges = (None if bins is None else np.asarray(bins, dtype=float))
+		self.hist = (None if bins is None else np.zeros((len(self.edges) - 1, 2)))
+		self.sketch = QuantileSketch(accuracy)
+	# Combine (total, mean, squared deviations) of two sets of values, as Chan et al. do
+	@staticmethod
+	def _combine(a, b):
+		total = a[0] + b[0]
+		if b[0] == 0.0:
+			return a
+		if a[0] == 0.0:
+			return b.copy()
+		delta = b[1] - a[1]
+		return np.array([total, a[1] + delta * b[0] / total, a[2] + b[2] +
+			delta * delta * a[0] * b[0] / total])
+	# Add a chunk of values, with optional weights
+	def add(self, values, weights=None):
+		values = np.asarray(values, dtype=float).ravel()
+		finite = np.isfinite(values)
+		self.nonfinite += len(values) - np.count_nonzero(finite)
+		values = values[finite]
+		if weights is not None:
+			weights = np.asarray(weights, dtype=float).ravel()[finite]
+		if len(values) == 0:
+			return
+		self.count += len(values)
+		self.min = min(self.min, values.min())
+		self.max = max(self.max, values.max())
+		mean = values.mean()
+		self.moments[0] = self._combine(self.moments[0], np.array([len(values), mean,
+			((values - mean)**2).sum()]))
+		if weights is not None:
+			total = weights.sum()
+			self.weight += total
+			if total > 0.0:
+				mean = np.dot(weights, values) / total
+				self.moments[1] = self._combine(self.moments[1], np.array([total, mean,
+					np.dot(weights, (values - mean)**2)]))
+		if self.hist is not None:
+			inside = (values >= self.edges[0]) & (values <= self.edges[-1])
+			index = np.clip(np.searchsorted(self.edges, values[inside], side="right") - 1, 0,
+				len(self.hist) - 1)
+			self.hist[:, 0] += np.bincount(index, minlength=len(self.hist))
+			if weights is not None:
+				self.hist[:, 1] += np.bincount(index, weights=weights[inside],
+					minlength=len(self.hist))
+		self.sketch.add(values, weights)
+	# Add another summary of the same kind into this one
+	def merge(self, other):
+		self.count += other.count
+		self.nonfinite += other.nonfinite
+		self.weight += other.weight
+		self.moments = [self._combine(a, b) for a, b in zip(self.moments, other.moments)]
+		self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+		if self.hist is not None:
+			if not np.array_equal(self.edges, other.edges):
+				raise ValueError("cannot merge histograms with different bins")
+			self.hist += other.hist
+		self.sketch.merge(other.sketch)
+		return self
+	# Return the mean, unweighted or weighted
+	def mean(self, weighted=False):
+		moments = self.moments[int(weighted)]
+		return (moments[1] if moments[0] > 0.0 else np.nan)
+	# Return the (population) variance, unweighted or weighted
+	def var(self, weighted=False):
+		moments = self.moments[int(weighted)]
+		return (moments[2] / moments[0] if moments[0] > 0.0 else np.nan)
+	def std(self, weighted=False):
+		return np.sqrt(self.var(weighted))
+	# Return an approximate quantile, clipped to the exact extrema
+	def quantile(self, q, weighted=False):
+		if self.count == 0:
+			return np.nan
+		return min(max(self.sketch.quantile(q, weighted), self.min), self.max)
+	def median(self, weighted=False):
+		return self.quantile(0.5, weighted)
+	# Return the approximate total count (or weight) of the values above x, exact outside the extrema
+	def total_above(self, x, weighted=False):
+		if self.count == 0 or x >= self.max:
+			return 0.0
+		if x < self.min:
+			return float(self.count if not weighted else self.weight)
+		return self.sketch.total_above(x, weighted)
+	# Return the histogram counts (or weights) and bin edges
+	def histogram(self, weighted=False):
+		return self.hist[:, int(weighted)], self.edges
+	# Return the summary as a plain dict, e.g., for JSON
+	def as_dict(self, quantiles=DEFAULT_QUANTILES):
+		result = {"count": self.count, "nonfinite": self.nonfinite, "min": self.min,
+			"max": self.max, "mean": self.mean(), "std": self.std()}
+		for q in quantiles:
+			result["q%g" % (100 * q)] = self.quantile(q)
+		if self.weight > 0.0:
+			result.update({"weight": self.weight, "weighted_mean": self.mean(True),
+				"weighted_std": self.std(True)})
+			for q in quantiles:
+				result["weighted_q%g" % (100 * q)] = self.quantile(q, True)
+		return result
+
+# Return log-spaced histogram edges from lo to hi with a number of bins per decade
+def log_edges(lo, hi, per_decade=10):
+	decades = np.log10(hi) - np.log10(lo)
+	return np.logspace(np.log10(lo), np.log10(hi), int(round(decades * per_decade)) + 1)
+
+# Merge a list of summaries (e.g., from parallel shards) in order into a new one
+def merge_all(summaries):
+	merged = None
+	for summary in summaries:
+		if merged is None:
+			merged = Summary(summary.edges, summary.sketch.accuracy)
+		merged.merge(summary)
+	return merged
+
+
+# PASSES
+
+# Summarize columns of a source in one chunked pass over rows start to stop
+# The source is anything with n_rows and read(name, start, stop), such as a ParticleDataset or
+# an SDFFile, and the weights are another column, e.g., "mass"
+# Returns a dict of summaries by column name
+def summarize(source, columns, weights=None, budget=None, bins=None, accuracy=DEFAULT_ACCURACY,
+	start=0, stop=None):
+	if stop is None:
+		stop = source.n_rows
+	summaries = dict((name, Summary((bins.get(name) if isinstance(bins, dict) else bins),
+		accuracy)) for name in columns)
+	rows = chunk_rows(budget, BYTES_PER_VALUE * (len(columns) + 1))
+	for first, last in row_chunks(stop - start, rows):
+		w = (None if weights is None else source.read(weights, start + first, start + last))
+		for name in columns:
+			summaries[name].add(source.read(name, start + first, start + last), w)
+		telemetry.count(particles=last - first)
+	return summaries
+
+# Return a text table of summaries
+def table(summaries, quantiles=DEFAULT_QUANTILES, weighted=False):
+	names = ["count", "min", "mean", "std"] + ["q%g" % (100 * q) for q in quantiles] + ["max"]
+	lines = ["%-12s" % ("column") + "".join("%13s" % (name) for name in names)]
+	for column in sorted(summaries):
+		s = summaries[column]
+		values = [s.count, s.min, s.mean(weighted), s.std(weighted)] + \
+			[s.quantile(q, weighted) for q in quantiles] + [s.max]
+		lines.append("%-12s" % (column) + "%13d" % (values[0]) +
+			"".join("%13.5g" % (v) for v in values[1:]))
+	return '\n'.join(lines) + '\n'
+
+# Main program: summarize columns of an SDF file or particle dataset directory
+def main():
+	parser = argparse.ArgumentParser()
+	# Columns to summarize, comma separated
+	parser.add_argument('-c', '--columns', required=True)
+	# Weight column for the weighted statistics, e.g., mass
+	parser.add_argument('-w', '--weights', default=None)
+	# Quantiles to show, comma separated
+	parser.add_argument('-q', '--quantiles', default=",".join(str(q) for q in DEFAULT_QUANTILES))
+	# Relative accuracy of the quantile sketches
+	parser.add_argument('-a', '--accuracy', type=float, default=DEFAULT_ACCURACY)
+	# Memory budget for the chunks, e.g., 1G
+	parser.add_argument('-b', '--budget', default=None)
+	# SDF file or particle dataset directory
+	parser.add_argument('source')
+	args = parser.parse_args()
+	if os.path.isdir(args.source):
+		from particle_data import ParticleDataset
+		source = ParticleDataset(args.source)
+	else:
+		from sdf_reader import SDFFile
+		source = SDFFile(args.source)
+	quantiles = [float(q) for q in args.quantiles.split(",")]
+	summaries = summarize(source, args.columns.split(","), args.weights, args.budget,
+		accuracy=args.accuracy)
+	sys.stdout.write(table(summaries, quantiles))
+	if args.weights is not None:
+		print "\nWeighted by %s:" % (args.weights)
+		sys.stdout.write(table(summaries, quantiles, weighted=True))
+
+if __name__ == "__main__":
+	main()
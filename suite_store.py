@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+
+# Consolidated analysis store for a whole suite of simulations
+# Each simulation is ingested once from its analysis directory, and the store keeps one run per
+# simulation and set of pipeline parameters (FMASS_CUT, TPOS_MAX, ..., plus an optional label,
+# e.g., the pipeline version), so the same model processed two ways is two runs side by side
+# Every run's total yields go into one long columnar table (run, nz, nn, grams, percent) and the
+# summary statistics of every particle column into another (run, column, statistic, value), both
+# stored as .npy columns, so questions like "44Ti yield across all models" are answered from a
+# few small arrays without opening any simulation
+# The mergeable stream_stats summaries (mass-weighted, with quantile sketches) of every run are
+# also kept for threshold questions like "mass above 5 GK by model", and optionally an evenly
+# spaced sample of the particles is kept as a small particle dataset for quick plots
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	./suite_store.py -d suite ingest -n 100000 sn_data/50Am sn_data/cco2 sn_data/jet3b
+#	./suite_store.py -d suite yields 44Ti
+#	./suite_store.py -d suite above "peak temp" 5e9
+# To gather three models into one store, then compare their 44Ti yields and their mass that
+# was heated above 5 GK
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import cPickle as pickle
+
+import numpy as np
+
+import sn_utils as sn
+import pipeline
+import telemetry
+from stage_cache import PARAMETERS, file_record
+from particle_data import ParticleDataset, DATASET_SUFFIX, COLUMNS_FILE, column_filename
+from stream_stats import summarize
+
+# Name of the store directory, if none is given
+STORE_DIR = "suite_store"
+# Pipeline parameters recorded with every run (beyond any label or explicit ones)
+RUN_PARAMETERS = ("TPOS_MAX", "FMASS_CUT", "FMASS_CUT_LOW", "ISOTOPES_LOW")
+# Statistics kept in the stats table for every particle column
+STATISTICS = ("count", "min", "max", "mean", "std", "median", "total_mass", "weighted_mean",
+	"weighted_std", "weighted_median")
+# Columns of the two tables
+YIELDS_COLUMNS = (("run", np.int32), ("nz", np.int16), ("nn", np.int16), ("grams", np.float64),
+	("percent", np.float64))
+STATS_COLUMNS = (("run", np.int32), ("column", np.int32), ("stat", np.int16),
+	("value", np.float64))
+
+
+# HELPER FUNCTIONS
+
+# Return the particle dataset of a simulation's plotting file, building it if it is out of date
+def plotting_dataset(paths):
+	plotting = pipeline.analysis_file(paths, "_plotting.out")
+	directory = os.path.splitext(plotting)[0] + DATASET_SUFFIX
+	columns = os.path.join(directory, COLUMNS_FILE)
+	if os.path.isfile(columns) and os.path.getmtime(columns) >= os.path.getmtime(plotting):
+		return ParticleDataset(directory)
+	return ParticleDataset.from_plotting(plotting, directory)
+
+# Return the total yields file of a simulation, preferring the updated yields
+def yields_file(paths):
+	updated = pipeline.analysis_file(paths, pipeline.UPDATED_YIELDS_END)
+	if os.path.isfile(updated):
+		return updated
+	return pipeline.analysis_file(paths, pipeline.YIELDS_END)
+
+# Return the key of a set of pipeline parameters
+def params_key(params):
+	text = json.dumps(params, sort_keys=True)
+	return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+# Return the (nz, nn) of an isotope like "44Ti", or (nz, None) for an element like "Ti"
+def parse_target(target):
+	if target in sn.SYMBOLS:
+		return sn.SYMBOLS.index(target), None
+	nn, nz = sn.nn_nz(target)
+	return int(nz), int(nn)
+
+
+# STORE
+
+# Directory of runs with their yields and statistics tables, summaries, and particle samples
+class SuiteStore:
+	# Open a store directory, which is made when the first run is ingested
+	def __init__(self, directory=STORE_DIR):
+		self.directory = os.path.abspath(directory)
+		runs_file = os.path.join(self.directory, "runs.json")
+		self.runs = []
+		if os.path.isfile(runs_file):
+			with open(runs_file, 'r') as runs:
+				self.runs = json.load(runs)
+		names_file = os.path.join(self.directory, "stats_columns.json")
+		self.stats_columns = []
+		if os.path.isfile(names_file):
+			with open(names_file, 'r') as names:
+				self.stats_columns = json.load(names)
+		# Tables and summaries are read on first use and kept
+		self._tables = {}
+		self._summaries = {}
+	# Return a table as a dict of arrays, empty if it has not been written yet
+	def table(self, name):
+		if name not in self._tables:
+			columns = dict(YIELDS_COLUMNS if name == "yields" else STATS_COLUMNS)
+			path = os.path.join(self.directory, name)
+			self._tables[name] = dict((column, (np.load(os.path.join(path, column + ".npy"))
+				if os.path.isdir(path) else np.zeros(0, dtype=dtype)))
+				for column, dtype in columns.items())
+		return self._tables[name]
+	# Replace a table on disk with new arrays
+	def _write_table(self, name, table):
+		path = os.path.join(self.directory, name)
+		temp = "%s.tmp%d" % (path, os.getpid())
+		os.makedirs(temp)
+		for column, values in table.items():
+			np.save(os.path.join(temp, column + ".npy"), values)
+		if os.path.isdir(path):
+			shutil.rmtree(path)
+		os.rename(temp, path)
+		self._tables[name] = table
+	# Write the list of runs and the names of the stats columns
+	def _write_index(self):
+		for name, value in (("runs.json", self.runs), ("stats_columns.json", self.stats_columns)):
+			temp = os.path.join(self.directory, "%s.tmp%d" % (name, os.getpid()))
+			with open(temp, 'w') as index:
+				json.dump(value, index, indent=1, sort_keys=True)
+			os.rename(temp, os.path.join(self.directory, name))
+	# Return the run number for a simulation and key, reusing the number of an older ingest
+	def _run_number(self, sim, key):
+		for record in self.runs:
+			if record["sim"] == sim and record["key"] == key:
+				return record["run"]
+		return max([record["run"] for record in self.runs] + [-1]) + 1
+	# Return the path to a run's pickled summaries or to its particle sample
+	def summaries_path(self, run):
+		return os.path.join(self.directory, "summaries", "%d.pickle" % (run))
+	def sample_path(self, run):
+		return os.path.join(self.directory, "samples", "%d" % (run))
+	# Ingest the analysis outputs of a simulation as a run, replacing any run of the same
+	# simulation and parameters, and return the run's record
+	# The label and params are recorded with the pipeline parameters, and sample is the number
+	# of particles to keep in the run's particle sample (0 for none)
+	def ingest(self, head, label=None, params=None, sample=0, budget=None):
+		paths = sn.check_dirs(pipeline.find_paths(head), ["analysis"])
+		sim = pipeline.sim_name(paths)
+		run_params = dict((name, PARAMETERS[name]()) for name in RUN_PARAMETERS)
+		run_params.update(params if params is not None else {})
+		if label is not None:
+			run_params["label"] = label
+		key = params_key(run_params)
+		run = self._run_number(sim, key)
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+		print "\nIngesting %s as run %d (parameters %s)" % (sim, run, key)
+		# Total yields
+		sources = [yields_file(paths)]
+		yields = pipeline.read_yields(sources[0])
+		table = self._without(self.table("yields"), run)
+		self._write_table("yields", self._append(table, {"run": [run] * len(yields),
+			"nz": [y[1] for y in yields], "nn": [y[0] for y in yields],
+			"grams": [y[2] for y in yields], "percent": [y[3] for y in yields]}))
+		# Particle column statistics and summaries
+		record = {"run": run, "sim": sim, "key": key, "params": run_params, "head": paths["head"],
+			"ingested": time.strftime("%Y-%m-%d %H:%M:%S"), "particles": 0, "sample": 0}
+		if os.path.isfile(pipeline.analysis_file(paths, "_plotting.out")):
+			ds = plotting_dataset(paths)
+			sources.append(pipeline.analysis_file(paths, "_plotting.out"))
+			record["particles"] = ds.n_rows
+			record["columns"] = [name for name in ds.names if name != "id"]
+			with telemetry.stage("suite_summaries", particles=ds.n_rows):
+				summaries = summarize(ds, record["columns"], "mass", budget)
+			self._write_stats(run, summaries)
+			if sample > 0:
+				record["sample"] = self._write_sample(run, ds, sample)
+		record["sources"] = [file_record(f) for f in sources]
+		self.runs = [r for r in self.runs if r["run"] != run] + [record]
+		self.runs.sort(key=lambda r : r["run"])
+		self._write_index()
+		return record
+	# Return a table without the rows of one run
+	@staticmethod
+	def _without(table, run):
+		keep = table["run"] != run
+		return dict((column, values[keep]) for column, values in table.items())
+	# Return a table with new rows appended, keeping every column's type
+	@staticmethod
+	def _append(table, rows):
+		return dict((column, np.concatenate([values, np.asarray(rows[column],
+			dtype=values.dtype)])) for column, values in table.items())
+	# Write a run's summaries and put their statistics in the stats table
+	def _write_stats(self, run, summaries):
+		rows = {"run": [], "column": [], "stat": [], "value": []}
+		for name in sorted(summaries):
+			if name not in self.stats_columns:
+				self.stats_columns.append(name)
+			s = summaries[name]
+			values = (s.count, s.min, s.max, s.mean(), s.std(), s.median(), s.weight,
+				s.mean(True), s.std(True), s.median(True))
+			rows["run"].extend([run] * len(values))
+			rows["column"].extend([self.stats_columns.index(name)] * len(values))
+			rows["stat"].extend(range(len(values)))
+			rows["value"].extend(values)
+		table = self._without(self.table("stats"), run)
+		self._write_table("stats", self._append(table, rows))
+		path = self.summaries_path(run)
+		if not os.path.isdir(os.path.dirname(path)):
+			os.makedirs(os.path.dirname(path))
+		with open(path, 'wb') as summaries_file:
+			pickle.dump(summaries, summaries_file, pickle.HIGHEST_PROTOCOL)
+		self._summaries[run] = summaries
+	# Write an evenly spaced sample of a run's particles as a particle dataset
+	# Returns the number of particles in the sample
+	def _write_sample(self, run, ds, n):
+		rows = np.unique(np.linspace(0, ds.n_rows - 1, min(n, ds.n_rows)).astype(np.int64))
+		directory = self.sample_path(run)
+		if os.path.isdir(directory):
+			shutil.rmtree(directory)
+		os.makedirs(directory)
+		for name in ds.names:
+			np.save(os.path.join(directory, column_filename(name)), ds.column(name)[rows])
+		with open(os.path.join(directory, COLUMNS_FILE), 'w') as names:
+			names.write('\n'.join(ds.names) + '\n')
+		return len(rows)
+	# Return the records of the runs matching a simulation name and any parameter values
+	def select(self, sim=None, **params):
+		return [record for record in self.runs if (sim is None or record["sim"] == sim) and
+			all(record["params"].get(name) == value for name, value in params.items())]
+	# Return the yield in grams of an isotope (or an element, summed) for each of some runs
+	def yields(self, target, runs=None):
+		runs = (self.runs if runs is None else runs)
+		table = self.table("yields")
+		nz, nn = parse_target(target)
+		match = (table["nz"] == nz) & ((table["nn"] == nn) if nn is not None else True)
+		numbers = np.array([record["run"] for record in runs], dtype=np.int32)
+		totals = np.bincount(table["run"][match], weights=table["grams"][match],
+			minlength=(numbers.max() + 1 if len(numbers) > 0 else 0))
+		return [(record, totals[record["run"]]) for record in runs]
+	# Return a statistic of a particle column (one of STATISTICS) for each of some runs
+	def stat(self, column, statistic, runs=None):
+		runs = (self.runs if runs is None else runs)
+		table = self.table("stats")
+		if column not in self.stats_columns:
+			raise KeyError("no statistics for column %s" % (repr(column)))
+		match = (table["column"] == self.stats_columns.index(column)) & \
+			(table["stat"] == STATISTICS.index(statistic))
+		values = dict(zip(table["run"][match], table["value"][match]))
+		return [(record, values.get(record["run"], np.nan)) for record in runs]
+	# Return the summaries of a run's particle columns
+	def summaries(self, run):
+		if run not in self._summaries:
+			with open(self.summaries_path(run), 'rb') as summaries_file:
+				self._summaries[run] = pickle.load(summaries_file)
+		return self._summaries[run]
+	# Return the mass in grams (or the number of particles) with a column above a threshold,
+	# for each of some runs (within the accuracy of the summaries' quantile sketches)
+	def mass_above(self, column, threshold, runs=None, weighted=True):
+		runs = (self.runs if runs is None else runs)
+		results = []
+		for record in runs:
+			if column not in record.get("columns", []):
+				results.append((record, np.nan))
+				continue
+			summary = self.summaries(record["run"])[column]
+			results.append((record, summary.total_above(threshold, weighted)))
+		return results
+	# Return a run's particle sample as a particle dataset
+	def sample(self, run):
+		return ParticleDataset(self.sample_path(run))
+
+# Return a text table of (record, value) query results
+def results_table(results, heading):
+	lines = ["%-6s%-16s%-14s%-16s%16s" % ("run", "simulation", "parameters", "label", heading)]
+	for record, value in results:
+		lines.append("%-6d%-16s%-14s%-16s%16.6e" % (record["run"], record["sim"], record["key"],
+			record["params"].get("label", ""), value))
+	return '\n'.join(lines) + '\n'
+
+# Main program: ingest simulations into a store, or query it
+def main():
+	parser = argparse.ArgumentParser()
+	# The store directory
+	parser.add_argument('-d', '--directory', default=STORE_DIR)
+	# Only show runs of this simulation
+	parser.add_argument('-s', '--sim', default=None)
+	# Only show runs with this label
+	parser.add_argument('-l', '--label', default=None)
+	commands = parser.add_subparsers(dest="command")
+	# Ingest simulations: ingest [-n sample] [-b budget] head [head ...]
+	ingest = commands.add_parser("ingest")
+	ingest.add_argument('-n', '--sample', type=int, default=0)
+	ingest.add_argument('-b', '--budget', default=None)
+	ingest.add_argument('heads', nargs='+')
+	# List the runs in the store
+	commands.add_parser("runs")
+	# Yield of an isotope or element: yields target
+	yields = commands.add_parser("yields")
+	yields.add_argument('target')
+	# Statistic of a particle column: stat column statistic
+	stat = commands.add_parser("stat")
+	stat.add_argument('column')
+	stat.add_argument('statistic', choices=STATISTICS)
+	# Mass with a particle column above a threshold: above column threshold
+	above = commands.add_parser("above")
+	above.add_argument('column')
+	above.add_argument('threshold', type=float)
+	args = parser.parse_args()
+	store = SuiteStore(args.directory)
+	if args.command == "ingest":
+		telemetry.start_run("suite_store")
+		for head in args.heads:
+			store.ingest(head, args.label, sample=args.sample, budget=args.budget)
+		telemetry.end_run()
+		return
+	params = ({"label": args.label} if args.label is not None else {})
+	runs = store.select(args.sim, **params)
+	if args.command == "runs":
+		# Long list parameters like ISOTOPES_LOW are left out, they only go into the keys
+		for record in runs:
+			shown = dict((name, value) for name, value in record["params"].items()
+				if not isinstance(value, list))
+			print "%-6d%-16s%-14s%12d particles  %s" % (record["run"], record["sim"],
+				record["key"], record["particles"], json.dumps(shown, sort_keys=True))
+	elif args.command == "yields":
+		sys.stdout.write(results_table(store.yields(args.target, runs), args.target + " (g)"))
+	elif args.command == "stat":
+		sys.stdout.write(results_table(store.stat(args.column, args.statistic, runs),
+			args.statistic))
+	elif args.command == "above":
+		sys.stdout.write(results_table(store.mass_above(args.column, args.threshold, runs),
+			"mass (g)"))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+
+# Generators of synthetic supernova simulation data in the same formats as the real thing
+# SDF files are written in both the jet3b-style 22-species layout and the cco2 20-species layout,
+# with real-looking ASCII headers (padded to the 1600 bytes the C readers assume) and tpos lines
+# Alongside them come SE-style HDF5 files of per-particle fmass arrays (these need h5py), the
+# entropy and unburned CSV outfiles, burn_query query files and slurm logs, and PID lists
+# Every particle's values are a fixed function of its ID, so the same particle looks consistent
+# from one timestep to the next, and everything is written a chunk of particles at a time so
+# that simulations of 10 million particles can be made without holding them in memory
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	./synthetic_data.py bench/jet3b 1000000 jet3b
+# To write a complete synthetic one-million-particle jet3b-style simulation into bench/jet3b
+
+import os
+import sys
+
+import numpy as np
+
+import sn_utils as sn
+from sdf_reader import SDFFile, parse_struct, CCO2_NZ, CCO2_NN, SNSPH_NETWORK
+
+# Size of the SDF header block, which the older C readers expect to be exactly 1600 bytes
+HEADER_BYTES = 1600
+# Number of particles generated and written at a time
+CHUNK_ROWS = 250000
+# Timestep tpos values of a synthetic simulation (the last one is the final timestep)
+TPOS_STEPS = (0.0, 0.05, 0.15, 0.3, 0.6, 1.0, 50.0)
+# Isotopes of the Burn network in the synthetic HDF5 files
+NETWORK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "isotopes.txt")
+
+# Particle struct declarations of the two SDF layouts (see entropy.c and cco2-SDF-reader.c)
+_COMMON_STRUCT = ["double x, y, z;", "float mass;", "float vx, vy, vz;", "float u;", "float h;",
+	"float rho;", "float drho_dt;", "float udot;", "float ax, ay, az;", "float lax, lay, laz;",
+	"float phi;", "float idt;"]
+STRUCTS = {
+	"jet3b": _COMMON_STRUCT + ["unsigned int nbrs;", "unsigned int ident;",
+		"unsigned int windid;", "float temp;", "float Y_el;",
+		"float %s;" % (", ".join("f%d" % (i) for i in range(1, 23))),
+		"int %s;" % (", ".join("p%d" % (i) for i in range(1, 23))),
+		"int %s;" % (", ".join("m%d" % (i) for i in range(1, 23)))],
+	"cco2": _COMMON_STRUCT + ["float pr;", "unsigned int nbrs;", "unsigned int ident;",
+		"unsigned int windid;", "float temp;", "float Y_el;", "float mfp;",
+		"float %s;" % (", ".join("f%d" % (i) for i in range(1, 21)))],
+}
+# Network isotopes (nz, nn) of the SDF files: the 20 real ones, plus two unused for jet3b
+SDF_NETWORK = zip(CCO2_NZ, CCO2_NN)
+
+
+# PER-PARTICLE VALUES
+
+# Return a deterministic pseudo-random number in [0, 1) for each particle ID
+# Different streams give independent values for the same particle
+def _unit(ids, stream):
+	x = (np.asarray(ids, dtype=np.uint64) + np.uint64(stream * 0x9E3779B9 + 1)) * \
+		np.uint64(0x5851F42D4C957F2D)
+	x ^= x >> np.uint64(29)
+	x *= np.uint64(0xBF58476D1CE4E5B9)
+	x ^= x >> np.uint64(32)
+	return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+# Return the mass fractions of n_species isotopes for each particle ID, summing to one
+# The fractions span many orders of magnitude like real abundances, so thresholds matter
+def mass_fractions(ids, n_species):
+	logs = np.empty((len(ids), n_species))
+	for k in range(n_species):
+		logs[:, k] = -14.0 * _unit(ids, 100 + k) ** 1.5 - 0.05 * k
+	fractions = 10.0 ** logs
+	return fractions / fractions.sum(axis=1)[:, np.newaxis]
+
+# Fill a structured array with the particle values at one timestep of an SDF layout
+def _particles(dtype, ids, tpos):
+	n = len(ids)
+	out = np.zeros(n, dtype=dtype)
+	# Particles move out homologously from a radius set by their ID
+	r0 = 0.01 + 2.0 * _unit(ids, 0) ** 2
+	cos_theta = 2.0 * _unit(ids, 1) - 1.0
+	sin_theta = np.sqrt(1.0 - cos_theta**2)
+	phi = 2.0 * np.pi * _unit(ids, 2)
+	speed = 5.0 * (1.0 + _unit(ids, 3)) / (1.0 + r0)
+	r = r0 + speed * tpos
+	direction = (sin_theta * np.cos(phi), sin_theta * np.sin(phi), cos_theta)
+	for c, name in enumerate(("x", "y", "z")):
+		out[name] = r * direction[c]
+		out["v" + name] = speed * direction[c]
+		out["a" + name] = -direction[c] / (1.0 + r**2)
+		out["la" + name] = out["a" + name]
+	out["mass"] = 0.5 + _unit(ids, 4)
+	out["h"] = 0.05 * r
+	# The shock heats each particle to its peak soon after the start, then it cools and thins
+	peak_temp = 1e8 * 10.0 ** (2.0 * _unit(ids, 5)) / (1.0 + r0)
+	heating = np.exp(-((tpos - 0.1 * r0) / 0.1)**2) + (r0 / r)**3 * 0.01
+	out["temp"] = peak_temp * heating
+	out["rho"] = 1e-3 * (r0 / r)**3 / r0**2
+	out["drho_dt"] = -3.0 * out["rho"] * speed / r
+	out["u"] = 1e-2 * out["temp"] / 1e8
+	out["udot"] = -out["u"] / (1.0 + tpos)
+	out["phi"] = -out["mass"] / r
+	out["idt"] = 1e-4
+	out["nbrs"] = 50 + (_unit(ids, 6) * 30).astype(np.uint32)
+	out["ident"] = ids
+	out["Y_el"] = 0.5 - 0.05 * _unit(ids, 7)
+	if "pr" in out.dtype.names:
+		out["pr"] = out["rho"] * out["u"]
+		out["mfp"] = 1.0 / (1.0 + out["rho"])
+	# Mass fractions of the network isotopes, plus the isotope identities of the 22-species files
+	n_species = len([name for name in out.dtype.names if name[0] == "f" and name[1:].isdigit()])
+	fractions = mass_fractions(ids, SNSPH_NETWORK)
+	for k in range(n_species):
+		out["f%d" % (k + 1)] = (fractions[:, k] if k < SNSPH_NETWORK else 0.0)
+		if "p1" in out.dtype.names:
+			nz, nn = (SDF_NETWORK[k] if k < SNSPH_NETWORK else (0, 0))
+			out["p%d" % (k + 1)] = nz
+			out["m%d" % (k + 1)] = nn
+	return out
+
+
+# SDF FILES
+
+# Return the ASCII header of an SDF file, padded to HEADER_BYTES
+def sdf_header(layout, n, tpos):
+	lines = ["# SDF 1.0", "parameter byteorder = 0x78563412;", "int npart = %d;" % (n),
+		"int iter = %d;" % (int(tpos * 1000)), "float tpos = %.6f;" % (tpos),
+		"float dt = 0.0001;", "char *sdf_type = \"synthetic %s\";" % (layout), "struct {"]
+	lines.extend("\t" + line for line in STRUCTS[layout])
+	lines.append("}[%d];" % (n))
+	text = '\n'.join(lines) + '\n'
+	end = "# SDF-EOH\n"
+	if len(text) + len(end) + 2 > HEADER_BYTES:
+		return text + end
+	# A comment line of spaces pads the header out to its full length
+	padding = HEADER_BYTES - len(text) - len(end)
+	return text + "#" + " " * (padding - 2) + "\n" + end
+
+# Return the NumPy record type of an SDF layout
+def sdf_dtype(layout):
+	fields = parse_struct('\n'.join(STRUCTS[layout]))
+	return np.dtype([(name, "<" + code) for name, code in fields])
+
+# Write a synthetic SDF file holding the given sorted particle IDs at one timestep
+def write_sdf(filename, ids, layout="jet3b", tpos=0.0):
+	dtype = sdf_dtype(layout)
+	with open(filename, "wb") as sdf:
+		sdf.write(sdf_header(layout, len(ids), tpos).encode("ascii"))
+		for start in xrange(0, len(ids), CHUNK_ROWS):
+			sdf.write(_particles(dtype, ids[start:start+CHUNK_ROWS], tpos).tostring())
+	return filename
+
+
+# CSV OUTFILES
+
+# Write the entropy (or cco2-SDF-reader) CSV outfile of an SDF file, as DM preprocessing would
+def write_entropy(sdf_filename):
+	sdf = SDFFile(sdf_filename)
+	names = ["ident", "x", "y", "z", "temp", "u", "udot", "rho", "vx", "vy", "vz", "ax", "ay",
+		"az", "h", "mass", "Y_el"]
+	with open(sdf_filename + ".out", 'w') as out:
+		out.write("ID, X_Pos, Y_Pos, Z_Pos, Temp, U, U_dot, rho, V_x, V_y, V_z, A_x, A_y, A_z, "
+			"h, Mass, Y_e\n")
+		for start in xrange(0, sdf.n_rows, CHUNK_ROWS):
+			stop = min(start + CHUNK_ROWS, sdf.n_rows)
+			block = np.column_stack([sdf.read(name, start, stop) for name in names])
+			np.savetxt(out, block, fmt=["%d"] + ["%g"] * (len(names) - 1), delimiter=", ")
+	return sdf_filename + ".out"
+
+# Write the unburned (or cco2-unburned) CSV outfile of the final SDF file
+def write_unburned(sdf_filename):
+	sdf = SDFFile(sdf_filename)
+	nz, nn = sdf.network()
+	with open(sdf_filename + ".unburned.out", 'w') as out:
+		out.write("ID, Mass, " + ", ".join("nz=%d:nn=%d" % (z, n) for z, n in zip(nz, nn)) + '\n')
+		fields = sdf.network_fields()
+		for start in xrange(0, sdf.n_rows, CHUNK_ROWS):
+			stop = min(start + CHUNK_ROWS, sdf.n_rows)
+			block = np.column_stack([sdf.read("ident", start, stop), sdf.read("mass", start, stop)]
+				+ [sdf.read(field, start, stop) for field in fields])
+			np.savetxt(out, block, fmt=["%d", "%g"] + ["%e"] * len(fields), delimiter=", ")
+	return sdf_filename + ".unburned.out"
+
+# Write a PID list in the format of hdf5_pid_list
+def write_pid_list(filename, ids):
+	with open(filename, 'w') as pid_file:
+		pid_file.write("n_ids=%d\n" % (len(ids)))
+		for start in xrange(0, len(ids), CHUNK_ROWS):
+			np.savetxt(pid_file, ids[start:start+CHUNK_ROWS], fmt="%d")
+	return filename
+
+
+# BURN NETWORK DATA
+
+# Return the (nz, nn) arrays of the synthetic Burn network
+def network():
+	pairs = [sn.nn_nz(isotope) for isotope in sn.get_list(NETWORK_FILE)]
+	return (np.array([int(nz) for nn, nz in pairs]), np.array([int(nn) for nn, nz in pairs]))
+
+# Write the burn_query outfile for one isotope over the burned IDs, as it would come out
+# One block of rows (and one header line) is written per HDF5 file, in descending ID order
+# within each file, so the file needs sorting like the real ones do
+def write_query(filename, isotope, burned_ids, n_files=1, abundance=None):
+	nz, nn = network()
+	nn_iso, nz_iso = [int(value) for value in sn.nn_nz(isotope)]
+	k = np.nonzero((nz == nz_iso) & (nn == nn_iso))[0]
+	if len(k) == 0:
+		raise ValueError("isotope %s is not in the synthetic network" % (isotope))
+	if abundance is None:
+		abundance = (sn.FMASS_CUT_LOW if isotope in sn.ISOTOPES_LOW else sn.FMASS_CUT)
+	cutoff = 10.0 ** (-int(abundance))
+	with open(filename, 'w') as query:
+		for part in np.array_split(burned_ids, n_files):
+			query.write("ID, Z, n, Mass_Frac \n")
+			for start in xrange(0, len(part), CHUNK_ROWS):
+				ids = part[start:start+CHUNK_ROWS]
+				fmass = mass_fractions(ids, len(nz))[:, k[0]]
+				keep = fmass >= cutoff
+				rows = np.column_stack([ids[keep], np.full(keep.sum(), nz_iso),
+					np.full(keep.sum(), nn_iso), fmass[keep]])[::-1]
+				np.savetxt(query, rows, fmt=["%d", "%d", "%d", "%e"], delimiter=", ")
+	return filename
+
+# Write the total yields lines that burn_query prints to its slurm log
+def write_query_log(filename, burned_ids, masses):
+	nz, nn = network()
+	totals = np.zeros(len(nz))
+	for start in xrange(0, len(burned_ids), CHUNK_ROWS):
+		ids = burned_ids[start:start+CHUNK_ROWS]
+		totals += np.dot(masses[start:start+CHUNK_ROWS], mass_fractions(ids, len(nz)))
+	totals *= sn.SNSPH_MASS
+	with open(filename, 'w') as log:
+		log.write("synthetic burn_query log\n")
+		for z, n, mass in zip(nz, nn, totals):
+			log.write("nn = %d nz = %d mass = %e (%.2f%%)\n" % (n, z, mass,
+				100.0 * mass / totals.sum()))
+	return filename
+
+# Write an SE-style HDF5 file of the given particle IDs, like the Burn outputs
+# Each particle is a cycle group holding its "mass" in grams and its "fmass" array as
+# attributes, and the file holds the "nz" and "nn" arrays of the network as attributes
+def write_se_hdf5(filename, ids, masses):
+	import h5py
+	nz, nn = network()
+	with h5py.File(filename, 'w') as h5:
+		h5.attrs["nz"] = nz.astype(np.int32)
+		h5.attrs["nn"] = nn.astype(np.int32)
+		for start in xrange(0, len(ids), CHUNK_ROWS):
+			block = ids[start:start+CHUNK_ROWS]
+			fractions = mass_fractions(block, len(nz))
+			for i, ident in enumerate(block):
+				cycle = h5.create_group("cycle%010d" % (ident))
+				cycle.attrs["mass"] = float(masses[start + i])
+				cycle.attrs["fmass"] = fractions[i]
+	return filename
+
+
+# WHOLE SIMULATIONS
+
+# Write a complete synthetic simulation directory, ready for DM postprocessing
+# The layout is "jet3b" or "cco2"; a fraction of the particles are lost along the way (accreted),
+# and the burned fraction of them get HDF5 data and query files (HDF5 files only with h5py)
+# The entropy CSV outfiles are slow to write for big simulations and can be left out
+# Returns the paths dict of the simulation
+def write_simulation(head, n, layout="jet3b", isotopes=("44Ti", "56Ni", "26Al"), lost=0.001,
+	burned=0.5, n_hdf5=2, hdf5=True, entropy=True):
+	name = os.path.basename(os.path.normpath(head))
+	paths = {"head": os.path.abspath(head)}
+	for subdir in ("sdf", "hdf5", "queries", "sbatch"):
+		paths[subdir] = os.path.join(paths["head"], subdir)
+		if not os.path.isdir(paths[subdir]):
+			os.makedirs(paths[subdir])
+	ids = np.arange(n, dtype=np.int64)
+	# Particles that get lost stop appearing part way through the timesteps
+	lost_ids = ids[_unit(ids, 8) < lost]
+	for step, tpos in enumerate(TPOS_STEPS):
+		step_ids = (ids if step < len(TPOS_STEPS) // 2 else np.setdiff1d(ids, lost_ids))
+		filename = os.path.join(paths["sdf"], "run1.%05d" % (step * 100))
+		write_sdf(filename, step_ids, layout, tpos)
+	# The CSV outfiles of DM preprocessing
+	final = os.path.join(paths["sdf"], "run1.%05d" % ((len(TPOS_STEPS) - 1) * 100))
+	if entropy:
+		for sdf in sn.sdf_list(paths):
+			write_entropy(os.path.join(paths["sdf"], sdf))
+	write_unburned(final)
+	# The burned particles have Burn network data in the HDF5 files
+	burned_ids = ids[_unit(ids, 9) < burned]
+	masses = (0.5 + _unit(burned_ids, 4))
+	write_pid_list(os.path.join(paths["hdf5"], name + "_pids.out"), burned_ids)
+	if hdf5:
+		try:
+			for i, part in enumerate(np.array_split(np.arange(len(burned_ids)), n_hdf5)):
+				write_se_hdf5(os.path.join(paths["hdf5"], "%s.%04d.h5" % (name, i)),
+					burned_ids[part], masses[part] * sn.SNSPH_MASS)
+		except ImportError:
+			print "Warning: h5py is not available, so no synthetic HDF5 files were written"
+	for i, isotope in enumerate(isotopes):
+		iso = ('0' + isotope if isotope[1].isalpha() else isotope)
+		write_query(os.path.join(paths["queries"], iso + ".out"), isotope, burned_ids, n_hdf5)
+		write_query_log(os.path.join(paths["sbatch"], "slurm.%d.ISO%s.out" % (1000 + i, iso)),
+			burned_ids, masses)
+	return paths
+
+
+# Main program: write a synthetic simulation from the command line
+def main():
+	if len(sys.argv) not in (3, 4):
+		print "Usage: %s simulation_directory n_particles [jet3b|cco2]" % (sys.argv[0])
+		sys.exit(1)
+	layout = (sys.argv[3] if len(sys.argv) == 4 else "jet3b")
+	write_simulation(sys.argv[1], int(float(sys.argv[2])), layout)
+
+if __name__ == "__main__":
+	main()
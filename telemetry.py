@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+
+# Instrumentation of the DM processing stages: timing, throughput, and memory use
+# Each stage or task is wrapped in a stage() block, which records its wall and CPU times (its own
+# and that of any subprocesses it waited for), the bytes the readers handed out and the bytes of
+# output files it wrote, the operating system's read/write byte counts, its particles per second,
+# and the peak resident memory reached while it ran
+# Records are kept in memory and, when DM_TELEMETRY names a directory, also appended to one JSON
+# lines file per run there, which this script summarizes into a report
+# Setting DM_PROFILE to "cprofile" and/or "tracemalloc" (comma separated) also profiles every
+# top-level stage; tracemalloc needs Python 3 and is skipped with a warning otherwise
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	DM_TELEMETRY=sn_data/telemetry ./dm_postprocess.py sn_data/jet3b
+#	./telemetry.py sn_data/telemetry/dm_postprocess.*.jsonl
+# To record where the time goes while postprocessing jet3b and then print the summary report
+
+import os
+import sys
+import json
+import time
+import socket
+import resource
+import threading
+
+# Environment variable naming the directory for the JSON lines files, if they should be written
+TELEMETRY_VARIABLE = "DM_TELEMETRY"
+# Environment variable choosing the profilers to run, e.g., DM_PROFILE=cprofile,tracemalloc
+PROFILE_VARIABLE = "DM_PROFILE"
+# Number of allocation sites kept from each tracemalloc snapshot
+TOP_ALLOCATIONS = 10
+
+# Every stage record made in this process, in the order the stages finished
+RECORDS = []
+# Stages that are currently running, outermost first
+# This is shared by all threads so that work done by worker threads counts toward the stage
+_OPEN = []
+_LOCK = threading.Lock()
+# Details of the current run, and the file its records are appended to
+_RUN = {"name": None, "filename": None}
+# Number of stages started so far, which orders the records in reports
+_STARTED = [0]
+# Whether the warning about tracemalloc being unavailable has been printed
+_WARNED = [False]
+
+
+# SYSTEM MEASUREMENTS
+
+# Return the (user + system) CPU seconds of this process and of its waited-for children
+def _cpu_times():
+	times = os.times()
+	return times[0] + times[1], times[2] + times[3]
+
+# Return the bytes this process has read and written through system calls, or (None, None)
+def _io_bytes():
+	try:
+		with open("/proc/self/io", 'r') as io:
+			counts = dict(line.split(":") for line in io if ":" in line)
+		return int(counts["rchar"]), int(counts["wchar"])
+	except (IOError, OSError, KeyError, ValueError):
+		return None, None
+
+# Return the peak resident memory of the process in bytes since it was last reset
+def _peak_rss():
+	try:
+		with open("/proc/self/status", 'r') as status:
+			for line in status:
+				if line.startswith("VmHWM:"):
+					return int(line.split()[1]) * 1024
+	except (IOError, OSError, ValueError):
+		pass
+	# The rusage peak is in kilobytes on Linux, but bytes on macOS, and can't be reset
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return (peak if sys.platform == "darwin" else peak * 1024)
+
+# Reset the peak resident memory to the current resident memory, where Linux allows it
+def _reset_peak_rss():
+	try:
+		with open("/proc/self/clear_refs", 'w') as clear_refs:
+			clear_refs.write("5")
+	except (IOError, OSError):
+		pass
+
+# Return the peak resident memory in bytes of the largest child process waited for so far
+def _children_peak_rss():
+	peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+	return (peak if sys.platform == "darwin" else peak * 1024)
+
+# Return the profilers requested through the environment
+def _profilers():
+	return [name.strip().lower() for name in os.environ.get(PROFILE_VARIABLE, "").split(",")
+		if name.strip() != ""]
+
+
+# RUNS
+
+# Start a new run, whose records go to a new JSON lines file if a directory is given or set in
+# the environment, and return the name of that file (or None)
+def start_run(name, directory=None):
+	if directory is None:
+		directory = os.environ.get(TELEMETRY_VARIABLE)
+	_RUN["name"], _RUN["filename"] = name, None
+	if directory is None or directory.strip() == "":
+		return None
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	filename = os.path.join(directory, "%s.%s.%d.jsonl" % (name,
+		time.strftime("%Y%m%d-%H%M%S"), os.getpid()))
+	_RUN["filename"] = filename
+	_write({"type": "run", "run": name, "argv": sys.argv, "host": socket.gethostname(),
+		"pid": os.getpid(), "python": sys.version.split()[0],
+		"start": time.strftime("%Y-%m-%d %H:%M:%S")})
+	return filename
+
+# Finish the current run, printing its summary report if its records are being written
+def end_run(report_file=sys.stdout):
+	if _RUN["filename"] is not None and report_file is not None:
+		report_file.write("\n" + report(load_records(_RUN["filename"])))
+	_RUN["name"], _RUN["filename"] = None, None
+
+# Return whether records are being written to a file
+def recording():
+	return _RUN["filename"] is not None
+
+# Append one record to the run's JSON lines file
+def _write(record):
+	if _RUN["filename"] is None:
+		return
+	with _LOCK:
+		with open(_RUN["filename"], 'a') as log:
+			log.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+# STAGES
+
+# Add to the counters of every running stage, e.g., count(bytes_read=n) or count(particles=n)
+# This is cheap enough to call from the readers on every read
+def count(**counters):
+	if len(_OPEN) == 0:
+		return
+	with _LOCK:
+		for stage in _OPEN:
+			for name, value in counters.items():
+				stage.record[name] = stage.record.get(name, 0) + value
+
+# Context manager timing one stage or task of the pipeline
+# Counters can be added through count() or by setting entries of the record directly, and the
+# sizes of any output files given are added to bytes_written when the stage finishes
+class stage(object):
+	def __init__(self, name, outputs=(), **fields):
+		self.name = name
+		self.outputs = list(outputs)
+		self.record = {"type": "stage", "stage": name, "bytes_read": 0, "bytes_written": 0}
+		self.record.update(fields)
+	def __enter__(self):
+		with _LOCK:
+			# Parent stages keep the peak reached so far before it is reset for this one
+			peak = _peak_rss()
+			for parent in _OPEN:
+				parent.peak = max(parent.peak, peak)
+			self.record["path"] = "/".join([s.name for s in _OPEN] + [self.name])
+			self.record["depth"] = len(_OPEN)
+			self.record["seq"] = _STARTED[0]
+			_STARTED[0] += 1
+			_OPEN.append(self)
+		_reset_peak_rss()
+		self.peak = 0
+		self.children_peak = _children_peak_rss()
+		self.profile = self.tracing = None
+		if self.record["depth"] == 0:
+			self._start_profilers()
+		self.record["start"] = time.strftime("%Y-%m-%d %H:%M:%S")
+		self.io = _io_bytes()
+		self.cpu = _cpu_times()
+		self.wall = time.time()
+		return self.record
+	def __exit__(self, kind, value, traceback):
+		wall = time.time() - self.wall
+		cpu = _cpu_times()
+		io = _io_bytes()
+		record = self.record
+		record["wall"] = wall
+		record["cpu"] = cpu[0] - self.cpu[0]
+		record["children_cpu"] = cpu[1] - self.cpu[1]
+		if io[0] is not None and self.io[0] is not None:
+			record["io_read"], record["io_written"] = io[0] - self.io[0], io[1] - self.io[1]
+		written = sum(os.path.getsize(output) for output in self.outputs if os.path.isfile(output))
+		record["bytes_written"] += written
+		if record.get("particles"):
+			record["particles_per_sec"] = record["particles"] / max(wall, 1e-9)
+		self._stop_profilers()
+		with _LOCK:
+			_OPEN.remove(self)
+			record["peak_rss"] = max(self.peak, _peak_rss())
+			# Parent stages count the outputs of this one as written by them as well
+			for parent in _OPEN:
+				parent.record["bytes_written"] += written
+			# A child process only counts if it raised the largest child peak during this stage
+			children_peak = _children_peak_rss()
+			if children_peak > self.children_peak:
+				record["children_peak_rss"] = children_peak
+			for parent in _OPEN:
+				parent.peak = max(parent.peak, record["peak_rss"])
+		record["run"] = _RUN["name"]
+		record["ok"] = (kind is None)
+		RECORDS.append(record)
+		_write(record)
+		return False
+	# Start the profilers requested in the environment
+	def _start_profilers(self):
+		profilers = _profilers()
+		if "cprofile" in profilers:
+			import cProfile
+			self.profile = cProfile.Profile()
+			self.profile.enable()
+		if "tracemalloc" in profilers:
+			try:
+				import tracemalloc
+			except ImportError:
+				if not _WARNED[0]:
+					print "Warning: tracemalloc is not available in Python %s" % (sys.version.split()[0])
+					_WARNED[0] = True
+				return
+			if not tracemalloc.is_tracing():
+				tracemalloc.start()
+				self.tracing = tracemalloc
+	# Stop the profilers and save what they found
+	def _stop_profilers(self):
+		if self.profile is not None:
+			self.profile.disable()
+			directory = (os.path.dirname(_RUN["filename"]) if _RUN["filename"] else ".")
+			filename = os.path.join(directory, "%s.%d.prof" % (self.name.replace(" ", "_"),
+				os.getpid()))
+			self.profile.dump_stats(filename)
+			self.record["profile"] = filename
+		if self.tracing is not None:
+			snapshot = self.tracing.take_snapshot()
+			self.record["traced_peak"] = self.tracing.get_traced_memory()[1]
+			self.record["top_allocations"] = [[str(stat.traceback), stat.size]
+				for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]]
+			self.tracing.stop()
+
+# Wrap a function so that every call to it runs as a stage of the same name
+def timed(name):
+	def decorate(function):
+		def wrapper(*args, **kwargs):
+			with stage(name):
+				return function(*args, **kwargs)
+		wrapper.__name__ = function.__name__
+		return wrapper
+	return decorate
+
+
+# REPORTS
+
+# Read the stage records back out of JSON lines files
+def load_records(filenames):
+	if isinstance(filenames, basestring):
+		filenames = [filenames]
+	records = []
+	for filename in filenames:
+		with open(filename, 'r') as log:
+			for line in log:
+				record = json.loads(line)
+				if record.get("type") == "stage":
+					records.append(record)
+	return records
+
+# Total up the records of each stage path, keeping the order in which paths were first started
+# Returns a list of dicts of count, wall, cpu, bytes, particles, rate, and peak memory totals
+def summarize(records):
+	totals, order = {}, []
+	for record in sorted(records, key=lambda record : record.get("seq", 0)):
+		path = record.get("path", record["stage"])
+		if path not in totals:
+			order.append(path)
+			totals[path] = {"path": path, "count": 0, "wall": 0.0, "cpu": 0.0,
+				"children_cpu": 0.0, "bytes_read": 0, "bytes_written": 0, "particles": 0,
+				"peak_rss": 0, "failed": 0}
+		total = totals[path]
+		total["count"] += 1
+		for name in ("wall", "cpu", "children_cpu", "bytes_read", "bytes_written", "particles"):
+			total[name] += record.get(name, 0) or 0
+		total["peak_rss"] = max(total["peak_rss"], record.get("peak_rss", 0),
+			record.get("children_peak_rss", 0))
+		total["failed"] += (0 if record.get("ok", True) else 1)
+	for total in totals.values():
+		total["particles_per_sec"] = (total["particles"] / total["wall"]
+			if total["particles"] and total["wall"] > 0 else None)
+	return [totals[path] for path in order]
+
+# Return a text table summarizing the records, one line per stage path
+def report(records):
+	lines = ["%-40s %5s %10s %10s %10s %10s %12s %10s" % ("stage", "runs", "wall (s)", "cpu (s)",
+		"read (MB)", "wrote (MB)", "particles/s", "peak (MB)")]
+	for total in summarize(records):
+		rate = total["particles_per_sec"]
+		name = "  " * total["path"].count("/") + total["path"].split("/")[-1]
+		if total["failed"] > 0:
+			name += " (%d failed)" % (total["failed"])
+		lines.append("%-40s %5d %10.2f %10.2f %10.1f %10.1f %12s %10.1f" % (name[:40],
+			total["count"], total["wall"], total["cpu"] + total["children_cpu"],
+			total["bytes_read"] / 1e6, total["bytes_written"] / 1e6,
+			("%.3g" % (rate) if rate is not None else "-"), total["peak_rss"] / 1e6))
+	return '\n'.join(lines) + '\n'
+
+
+# Main program: print the summary report of the given JSON lines files
+def main():
+	if len(sys.argv) < 2:
+		print "Usage: %s run.jsonl ..." % (sys.argv[0])
+		sys.exit(1)
+	sys.stdout.write(report(load_records(sys.argv[1:])))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,179 @@
+# Per-particle thermodynamic trajectories for downstream nucleosynthesis post-processing
+# SDF files store one timestep each, so the history of a particle is spread across every file
+# This transposes the selected timesteps into a store where each particle's history is contiguous
+# The transpose runs out-of-core on blocks of particle IDs, with one thread per timestep file
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	store = build_trajectories(paths, mode="early", budget="4G", threads=8)
+#	history = store.get(123456)
+#	export_tracers(store, [123456, 123457], "tracers")
+# To build the jet3b trajectory store, look up one particle, and write two tracer files
+
+import os
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+import sn_utils as sn
+from sdf_reader import SDFFile
+from chunking import chunk_rows, row_chunks
+from reducers import gather_rows
+from alignment import AlignmentIndex, INDEX_DIR
+
+# Name of the trajectory store directory within the simulation head directory
+STORE_DIR = "trajectories"
+# The quantities stored for each particle at each timestep, in order
+FIELDS = ("tpos", "temp", "rho", "Y_e")
+# Name of the file holding the trajectory array inside the store directory
+TRAJECTORY_FILE = "trajectories.npy"
+# File name pattern for exported tracer files
+TRACER_NAME = "tracer_%08d.dat"
+
+
+# Return the full paths of the SDF files selected by sn.sdf_list, in order of tpos
+def timestep_files(paths, mode="early"):
+	# The "all" mode tacks the final timestep on after the early ones, which is already in order
+	names = sn.sdf_list(paths, mode=mode)
+	if isinstance(names, str):
+		names = [names]
+	return [os.path.join(paths["sdf"], name) for name in names]
+
+
+# Read-only view of a trajectory store built by build_trajectories
+class TrajectoryStore:
+	# Open the store directory and memory-map its arrays
+	def __init__(self, directory):
+		self.directory = os.path.abspath(directory)
+		# Sorted particle IDs, one per row of the trajectory array
+		self.pids = np.load(os.path.join(self.directory, "pids.npy"), mmap_mode='r')
+		# The time of each timestep in seconds
+		self.times = np.load(os.path.join(self.directory, "times.npy"))
+		# Array of shape (particles, timesteps, fields), NaN where a particle is absent
+		self.data = np.load(os.path.join(self.directory, TRAJECTORY_FILE), mmap_mode='r')
+		# The SDF files the store was built from
+		self.sources = sn.get_lines(os.path.join(self.directory, "sources"))
+	# Return the row of the trajectory array for each particle ID, or -1 if absent
+	def rows_of(self, pids):
+		pids = np.atleast_1d(np.asarray(pids, dtype=np.int64))
+		rows = np.minimum(np.searchsorted(self.pids, pids), len(self.pids) - 1)
+		rows[self.pids[rows] != pids] = -1
+		return rows
+	# Return the (timesteps, fields) history of one particle, dropping steps where it is absent
+	def get(self, pid):
+		row = self.rows_of(pid)[0]
+		if row < 0:
+			raise KeyError("particle ID %d is not in trajectory store %s" % (pid, self.directory))
+		history = np.array(self.data[row])
+		return history[~np.isnan(history[:, 0])]
+	# Return the full (particles, timesteps, fields) histories of many particles, NaN for gaps
+	def get_many(self, pids):
+		rows = self.rows_of(pids)
+		if np.any(rows < 0):
+			raise KeyError("%d particle IDs are not in the trajectory store" % (np.sum(rows < 0)))
+		# Read in sorted order so the memory map is walked front to back
+		order = np.argsort(rows)
+		histories = np.empty((len(rows),) + self.data.shape[1:], dtype=self.data.dtype)
+		histories[order] = self.data[rows[order]]
+		return histories
+
+
+# Transpose the selected SDF timesteps into a new trajectory store and return it opened
+# The mode is passed on to sn.sdf_list ("early" or "all"), threads defaults to the core count
+def build_trajectories(paths, mode="early", directory=None, budget=None, threads=None):
+	# Put the store in the simulation head directory unless told otherwise
+	if directory is None:
+		directory = os.path.join(paths["head"], STORE_DIR)
+	# Align the particle IDs of the selected timesteps (reusing the index if it is current)
+	filenames = timestep_files(paths, mode)
+	alignment = AlignmentIndex.load_or_build(filenames,
+		os.path.join(paths["head"], INDEX_DIR + "." + mode))
+	return transpose_files(filenames, directory, budget, threads, alignment)
+
+# Transpose a list of SDF files (in timestep order) into a trajectory store directory
+# Rows are gathered through an alignment index, which is built in the store if not given
+def transpose_files(filenames, directory, budget=None, threads=None, alignment=None):
+	# Print a quick progress message for the user
+	print "\nTransposing %d timesteps into trajectory store %s" % (len(filenames), directory)
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	sdfs = [SDFFile(filename) for filename in filenames]
+	times = np.array([sdf.tpos for sdf in sdfs]) * sn.SNSPH_TIME
+	# Every particle that shows up in any of the timesteps gets a row
+	if alignment is None:
+		alignment = AlignmentIndex.load_or_build(filenames, os.path.join(directory, INDEX_DIR))
+	pids = alignment.pids
+	columns = alignment.columns_of(filenames)
+	np.save(os.path.join(directory, "pids.npy"), pids)
+	np.save(os.path.join(directory, "times.npy"), times)
+	with open(os.path.join(directory, "sources"), 'w') as sources:
+		sources.write('\n'.join(os.path.abspath(f) for f in filenames) + '\n')
+	# The output array is laid out on disk so that each particle's history is contiguous
+	n_steps = len(sdfs)
+	out = np.lib.format.open_memmap(os.path.join(directory, TRAJECTORY_FILE), mode="w+",
+		dtype=np.float32, shape=(len(pids), n_steps, len(FIELDS)))
+	# Each particle costs its block of output plus roughly one record from every timestep file
+	bytes_per_row = n_steps * (4 * len(FIELDS) + 8 * 3) + sum(sdf.row_bytes() for sdf in sdfs)
+	rows = chunk_rows(budget, bytes_per_row)
+	# One worker thread per timestep file, up to the number of cores
+	if threads is None:
+		threads = multiprocessing.cpu_count()
+	pool = ThreadPool(max(1, min(threads, n_steps)))
+	try:
+		for start, stop in row_chunks(len(pids), rows):
+			ids = np.asarray(pids[start:stop])
+			print "Transposing particle IDs %d to %d" % (ids[0], ids[-1])
+			block = np.full((len(ids), n_steps, len(FIELDS)), np.nan, dtype=np.float32)
+			block_rows = np.asarray(alignment.rows[start:stop])
+			# Fill in one timestep column of the block for one SDF file
+			def fill(step):
+				values, found = gather_rows(sdfs[step], block_rows[:, columns[step]],
+					["temp", "rho", "Y_el"])
+				block[found, step, 0] = times[step]
+				block[found, step, 1] = values["temp"][found]
+				block[found, step, 2] = values["rho"][found] * sn.SNSPH_DENSITY
+				block[found, step, 3] = values["Y_el"][found]
+			pool.map(fill, range(n_steps))
+			# Write the finished block out in one contiguous piece
+			out[start:stop] = block
+	finally:
+		pool.close()
+		pool.join()
+	out.flush()
+	del out
+	return TrajectoryStore(directory)
+
+
+# Write one tracer-format text file per requested particle ID into a directory
+# Each file has a short header followed by one "time temp rho Ye" line per timestep
+def export_tracers(store, pids, directory, threads=None):
+	# Print a quick progress message for the user
+	print "\nExporting %d tracer files to %s" % (len(pids), directory)
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	pids = np.unique(np.asarray(pids, dtype=np.int64))
+	# Read the histories in sorted batches so each batch is one walk through the store
+	batch = 4096
+	if threads is None:
+		threads = multiprocessing.cpu_count()
+	pool = ThreadPool(max(1, threads))
+	try:
+		for start in xrange(0, len(pids), batch):
+			chunk = pids[start:start+batch]
+			histories = store.get_many(chunk)
+			# Write a single tracer file from its history
+			def write(i):
+				history = histories[i]
+				history = history[~np.isnan(history[:, 0])]
+				filename = os.path.join(directory, TRACER_NAME % (chunk[i]))
+				with open(filename, 'w') as tracer:
+					tracer.write("# particle ID %d\n" % (chunk[i]))
+					tracer.write("# %d timesteps\n" % (len(history)))
+					tracer.write("# time (s), temperature (K), density (g/cm^3), Y_e\n")
+					np.savetxt(tracer, history, fmt="%.6e")
+			pool.map(write, range(len(chunk)))
+	finally:
+		pool.close()
+		pool.join()
@@ -0,0 +1,264 @@
+# Group-by engine for breaking down simulation yields into bins of particle properties
+# Yields are mass-weighted sums of the sparse burn_query abundances, binned by any column
+# Binning by one column gives a 1D breakdown, binning by a pair of columns gives a 2D one
+# Results are cached on disk per binning spec so that repeated breakdowns are instant
+
+# Last modified 19 Oct 2026 by Greg Vance
+
+# Usage example:
+#	ds = ParticleDataset("sn_data/jet3b/analysis/jet3b_plotting.dataset")
+#	store = AbundanceStore("sn_data/jet3b/sorted_queries.abundances")
+#	result = group_yields(ds, store, [BinSpec("v_r", bins=20, range=(0., 2e9))], ["44Ti", "Fe"])
+# To get the 44Ti and iron yields in 20 radial velocity shells of the jet3b simulation
+
+import os
+import hashlib
+import tempfile
+
+import numpy as np
+
+import sn_utils as sn
+from particle_data import get_values
+from chunking import chunk_rows, row_chunks
+
+# Name of the subdirectory of a dataset where group-by results are cached
+CACHE_DIR = "groupby"
+# Rough memory cost in bytes per particle row per binned column, for sizing chunks
+BYTES_PER_ROW = 64
+
+
+# BINNING SPECS
+
+# Description of how to bin the values of one column
+# Either give the bin edges directly, or give a number of bins and an optional range
+# With log=True, the bins are spaced evenly in log10 of the column values
+class BinSpec:
+	# Store the column name and the binning options
+	def __init__(self, column, edges=None, bins=10, range=None, log=False):
+		self.column = column
+		self.edges = (None if edges is None else np.asarray(edges, dtype=np.float64))
+		self.bins = bins
+		self.range = range
+		self.log = log
+	# Work out the bin edges to use for this column of a dataset, reading it in chunks of rows
+	def get_edges(self, ds, rows=None):
+		# Explicit edges are used exactly as given
+		if self.edges is not None:
+			return self.edges
+		# Otherwise use the given range, or find the range of the data itself
+		if self.range is not None:
+			low, high = self.range
+		else:
+			low, high = np.inf, -np.inf
+			for start, stop in row_chunks(ds.n_rows, rows):
+				values = get_values(ds, self.column, slice(start, stop))
+				values = values[np.isfinite(values)]
+				if self.log:
+					values = values[values > 0.0]
+				if len(values) > 0:
+					low, high = min(low, values.min()), max(high, values.max())
+			if low > high:
+				raise ValueError("no usable values to bin in column %s" % (repr(self.column)))
+		# Space the edges evenly in the appropriate scale
+		if self.log:
+			return np.logspace(np.log10(low), np.log10(high), self.bins + 1)
+		else:
+			return np.linspace(low, high, self.bins + 1)
+	# Return a string that uniquely identifies this spec, used for caching
+	def key(self):
+		if self.edges is not None:
+			return "%s|edges=%s" % (self.column, ",".join(repr(e) for e in self.edges))
+		return "%s|bins=%d|range=%r|log=%r" % (self.column, self.bins, self.range, self.log)
+
+# Return the bin number of each value given the bin edges, or -1 for values outside them
+# The last bin includes its upper edge, like numpy.histogram does
+def bin_index(values, edges):
+	# Find which pair of edges each value falls between
+	index = np.searchsorted(edges, values, side="right") - 1
+	# Values sitting exactly on the final edge belong to the last bin
+	index[values == edges[-1]] = len(edges) - 2
+	# Flag everything that falls outside the edges (or is NaN) as out of range
+	index[(index < 0) | (index >= len(edges) - 1) | np.isnan(values)] = -1
+	return index
+
+# Return the combined (flattened) bin number of the given dataset rows along all the specs
+# Rows that fall outside the edges along any of the specs get -1
+def flat_bins(ds, specs, edges, rows):
+	flat = 0
+	for spec, spec_edges in zip(specs, edges):
+		index = bin_index(get_values(ds, spec.column, rows), spec_edges)
+		flat = np.where((flat < 0) | (index < 0), -1, flat * (len(spec_edges) - 1) + index)
+	return flat
+
+
+# GROUP-BY RESULTS
+
+# Results of a yields breakdown: isotope yields in grams for every bin
+# The yields array has shape (isotopes, bins of first spec[, bins of second spec])
+class GroupedYields:
+	# Store all of the pieces of the result
+	def __init__(self, columns, edges, isotopes, yields, mass, count):
+		self.columns = columns
+		self.edges = edges
+		self.isotopes = isotopes
+		self.yields = yields
+		self.mass = mass
+		self.count = count
+	# Return the yields array for one isotope, or summed over all isotopes of an element
+	def get(self, target):
+		# A plain element symbol collects all of its isotopes
+		if target.isalpha():
+			nz = sn.SYMBOLS.index(target)
+			picks = [i for i, iso in enumerate(self.isotopes) if int(sn.nn_nz(iso)[1]) == nz]
+			if len(picks) == 0:
+				raise KeyError("no isotopes of element %s in result" % (target))
+			return self.yields[picks].sum(axis=0)
+		return self.yields[self.isotopes.index(target)]
+	# Return the element names present in the result and their summed yields
+	def element_yields(self):
+		# Collect the elements in order of their proton numbers
+		elements = sorted(set(int(sn.nn_nz(iso)[1]) for iso in self.isotopes))
+		names = [sn.SYMBOLS[nz] for nz in elements]
+		return names, np.array([self.get(name) for name in names])
+	# Save the result as a NumPy .npz file
+	def save(self, filename):
+		arrays = {"columns": np.array(self.columns), "isotopes": np.array(self.isotopes),
+			"yields": self.yields, "mass": self.mass, "count": self.count}
+		for i, edges in enumerate(self.edges):
+			arrays["edges%d" % (i)] = edges
+		np.savez(filename, **arrays)
+	# Load a result saved by the save method
+	@classmethod
+	def load(cls, filename):
+		data = np.load(filename)
+		columns = [str(c) for c in data["columns"]]
+		edges = [data["edges%d" % (i)] for i in range(len(columns))]
+		return cls(columns, edges, [str(iso) for iso in data["isotopes"]],
+			data["yields"], data["mass"], data["count"])
+
+
+# GROUP-BY ENGINE
+
+# Compute mass-weighted isotope yields in bins of one or two dataset columns
+# The specs argument is a list of one or two BinSpec objects
+# The targets argument lists elements and/or isotopes, all stored isotopes by default
+# Giving a memory budget (e.g., "2G") streams the particles in chunks sized to fit it
+# Giving particle IDs (e.g., from selections.select) restricts the breakdown to those particles
+def group_yields(ds, store, specs, targets=None, cache=True, budget=None, pids=None):
+	# Only 1D and 2D breakdowns are supported
+	if len(specs) not in (1, 2):
+		raise ValueError("group_yields takes one or two bin specs, not %d" % (len(specs)))
+	# Work out which stored isotopes are needed for the requested targets
+	isotopes = (list(store.isotopes) if targets is None else store.expand(targets))
+	# Look for a cached result first, keyed by the specs, isotopes, and input fingerprints
+	cache_path = None
+	if cache:
+		key = "\n".join([spec.key() for spec in specs] + isotopes
+			+ [ds.fingerprint(), store.fingerprint()])
+		if pids is not None:
+			key += "\n" + hashlib.sha1(np.asarray(pids, dtype=np.int64).tostring()).hexdigest()
+		name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npz"
+		cache_path = os.path.join(ds.directory, CACHE_DIR, name)
+		if os.path.isfile(cache_path):
+			return GroupedYields.load(cache_path)
+	# Work out the chunk size from the memory budget (None means everything at once)
+	rows = chunk_rows(budget, BYTES_PER_ROW * len(specs))
+	# Flag the selected dataset rows, if only some particles are wanted
+	selected = None
+	if pids is not None:
+		selected = np.zeros(ds.n_rows, dtype=bool)
+		found_rows = ds.rows_of(pids)
+		selected[found_rows[found_rows >= 0]] = True
+	# Find the bin edges along each spec
+	edges = [spec.get_edges(ds, rows) for spec in specs]
+	# Every row's flat bin is worked out once and kept for the isotope loop below, in memory or,
+	# with a memory budget, in a scratch .npy file next to the cached results
+	scratch = None
+	if rows is None:
+		all_flat = np.empty(ds.n_rows, dtype=np.int32)
+	else:
+		scratch_dir = os.path.join(ds.directory, CACHE_DIR)
+		if not os.path.isdir(scratch_dir):
+			os.makedirs(scratch_dir)
+		handle, scratch = tempfile.mkstemp(suffix=".npy", dir=scratch_dir)
+		os.close(handle)
+		all_flat = np.lib.format.open_memmap(scratch, mode="w+", dtype=np.int32,
+			shape=(ds.n_rows,))
+	try:
+		result = _group_yields(ds, store, specs, isotopes, rows, selected, edges, all_flat)
+	finally:
+		if scratch is not None:
+			del all_flat
+			os.remove(scratch)
+	# Save the result in the cache for next time, renaming it into place once it is complete so
+	# that other processes computing the same breakdown never load a half-written file
+	if cache_path is not None:
+		if not os.path.isdir(os.path.dirname(cache_path)):
+			os.makedirs(os.path.dirname(cache_path))
+		temp = "%s.tmp%d.npz" % (cache_path[:-len(".npz")], os.getpid())
+		result.save(temp)
+		os.rename(temp, cache_path)
+	return result
+
+# Do the work of group_yields, filling in the flat bin of every row as it goes
+def _group_yields(ds, store, specs, isotopes, rows, selected, edges, all_flat):
+	shape = [len(spec_edges) - 1 for spec_edges in edges]
+	n_flat = int(np.prod(shape))
+	# Total particle mass and count in each bin, for normalizing the yields
+	bin_mass, bin_count = np.zeros(n_flat), np.zeros(n_flat, dtype=np.int64)
+	for start, stop in row_chunks(ds.n_rows, rows):
+		flat = flat_bins(ds, specs, edges, slice(start, stop))
+		if selected is not None:
+			flat[~selected[start:stop]] = -1
+		all_flat[start:stop] = flat
+		inside = flat >= 0
+		mass = get_values(ds, "mass", slice(start, stop))
+		bin_mass += np.bincount(flat[inside], weights=mass[inside], minlength=n_flat)
+		bin_count += np.bincount(flat[inside], minlength=n_flat)
+	# For each isotope, weight its sparse mass fractions by particle mass and sum per bin
+	yields = np.zeros((len(isotopes), n_flat))
+	for i, isotope in enumerate(isotopes):
+		iso_pids, iso_fmass = store.get(isotope)
+		for start, stop in row_chunks(len(iso_pids), rows):
+			# Look up the dataset rows of this chunk of particles that have the isotope
+			found_rows = ds.rows_of(iso_pids[start:stop])
+			found = found_rows >= 0
+			found_rows, chunk_fmass = found_rows[found], np.asarray(iso_fmass[start:stop])[found]
+			# Drop the particles outside the selection, if there is one
+			if selected is not None:
+				found = selected[found_rows]
+				found_rows, chunk_fmass = found_rows[found], chunk_fmass[found]
+			# Look up their bins and weight their mass fractions by their masses
+			bins = np.asarray(all_flat[found_rows])
+			keep = bins >= 0
+			mass = get_values(ds, "mass", found_rows[keep])
+			yields[i] += np.bincount(bins[keep], weights=mass * chunk_fmass[keep],
+				minlength=n_flat)
+	# Package everything up with the bins in their proper shape
+	return GroupedYields([spec.column for spec in specs], edges, isotopes,
+		yields.reshape([len(isotopes)] + shape), bin_mass.reshape(shape),
+		bin_count.reshape(shape))
+
+# Write a 1D or 2D breakdown to an ASCII CSV file, one line per bin
+def write_grouped(result, filename, elements=False):
+	# Report either the element sums or the individual isotopes
+	if elements:
+		names, yields = result.element_yields()
+	else:
+		names, yields = result.isotopes, result.yields
+	with open(filename, 'w') as outfile:
+		# Each bin is labeled by its edges along every binned column
+		header = []
+		for column in result.columns:
+			header.extend(["%s low" % (column), "%s high" % (column)])
+		header.extend(["count", "mass"] + names)
+		outfile.write(", ".join(header) + '\n')
+		# Loop over every bin in row-major order
+		for index in np.ndindex(*result.mass.shape):
+			line = []
+			for edges, i in zip(result.edges, index):
+				line.extend([repr(edges[i]), repr(edges[i+1])])
+			line.append(str(result.count[index]))
+			line.append(repr(result.mass[index]))
+			line.extend([repr(y) for y in yields[(slice(None),) + index]])
+			outfile.write(", ".join(line) + '\n')